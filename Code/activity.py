@@ -0,0 +1,201 @@
+# activity.py
+# "What's new" for the dashboards: last post, last document edit, post and
+# member counts and unread counts per workspace (hierarchy.tree does the same
+# for every thread inside one).
+#
+# Everything is read from thread_activity (one row per thread, maintained by
+# the mapper events in models.py) and read_markers (one row per user and
+# thread), so a list of N workspaces is one indexed query:
+#
+#   group_memberships (user_id, …) ─▶ threads ─▶ thread_activity ─▶ read_markers (user_id, thread_id)
+#
+# Unread counts compare post counts, so opening a thread is one small write
+# (mark_read) instead of a row per post read.
+
+from collections import namedtuple
+from datetime import datetime
+
+import click
+from sqlalchemy.exc import IntegrityError
+
+import schema
+from extensions import db
+from models import Document, GroupMembership, Post, ReadMarker, Thread, ThreadActivity, ThreadClosure
+
+Summary = namedtuple('Summary', 'thread post_count last_post_at last_document_edit_at '
+                                'last_activity_at member_count unread')
+
+
+def _summary(thread, activity, post_count, read_count):
+    if activity is None:   # no row yet (run `flask rebuild-activity` on old databases)
+        return Summary(thread, 0, None, None, thread.created_at, thread.member_count, 0)
+    return Summary(thread, post_count, activity.last_post_at, activity.last_document_edit_at,
+                   activity.last_activity_at or thread.created_at, thread.member_count,
+                   max(post_count - (read_count or 0), 0))
+
+
+def workspace_summaries(user_id) -> list:
+    """The user's active workspaces, most recently active first, whole-workspace counts."""
+    rows = (db.session.query(Thread, ThreadActivity, ReadMarker.read_tree_count)
+            .join(GroupMembership, db.and_(GroupMembership.thread_id == Thread.id,
+                                           GroupMembership.user_id == user_id))
+            .outerjoin(ThreadActivity, ThreadActivity.thread_id == Thread.id)
+            .outerjoin(ReadMarker, db.and_(ReadMarker.thread_id == Thread.id, ReadMarker.user_id == user_id))
+            .filter(Thread.is_private_workspace == True, Thread.status == 'active')
+            .order_by(db.func.coalesce(ThreadActivity.last_activity_at, Thread.created_at).desc(),
+                      Thread.id.desc())
+            .all())
+    return [_summary(thread, activity, activity.tree_post_count if activity else 0, read)
+            for thread, activity, read in rows]
+
+
+def read_marker_time(user_id, thread_id):
+    """When the user last read anything in this thread's tree (part of the workspace ETag)."""
+    marker = db.session.get(ReadMarker, (user_id, thread_id))
+    return marker.read_at if marker else None
+
+
+def _marker(user_id, thread_id):
+    marker = db.session.get(ReadMarker, (user_id, thread_id))
+    if marker is None:
+        marker = ReadMarker(user_id=user_id, thread_id=thread_id, read_post_count=0, read_tree_count=0)
+        db.session.add(marker)
+    return marker
+
+
+def mark_read(user_id, thread):
+    """Record that the user has seen every post in thread. Writes (and commits)
+    only if something is new; returns whether it did."""
+    for attempt in range(2):
+        try:
+            if not _mark_read(user_id, thread):
+                return False
+            db.session.commit()
+            return True
+        except IntegrityError:
+            # same user opened it twice at once and the other request created a
+            # marker first: start over from the markers as they are now
+            db.session.rollback()
+            if attempt:
+                raise
+
+
+def _mark_read(user_id, thread):
+    activity = db.session.get(ThreadActivity, thread.id)
+    if activity is None:
+        return False
+    existing = db.session.get(ReadMarker, (user_id, thread.id))
+    seen = activity.post_count - (existing.read_post_count if existing else 0)
+    if existing is not None and not seen:
+        return False
+    now = datetime.utcnow()
+    marker = existing
+    if marker is None:
+        marker = ReadMarker(user_id=user_id, thread_id=thread.id, read_post_count=0, read_tree_count=0)
+        db.session.add(marker)
+    marker.read_post_count = activity.post_count
+    marker.read_tree_count += seen
+    marker.read_at = now
+    ancestors = (db.session.query(ThreadClosure.ancestor_id)
+                 .filter(ThreadClosure.descendant_id == thread.id, ThreadClosure.depth > 0))
+    for (ancestor_id,) in ancestors.all():
+        parent = _marker(user_id, ancestor_id)   # tree totals above include these posts
+        parent.read_tree_count += seen
+        parent.read_at = now
+    db.session.flush()
+    return True
+
+
+def refresh_trees(thread_ids):
+    """Recompute the tree_* columns of these threads from their subtrees (after a move)."""
+    thread_ids = set(thread_ids)
+    if not thread_ids:
+        return
+    totals = {thread_id: {'thread_id': thread_id, 'tree_post_count': 0, 'last_activity_at': None}
+              for thread_id in thread_ids}
+    rows = (db.session.query(ThreadClosure.ancestor_id, ThreadActivity.post_count,
+                             ThreadActivity.last_post_at, ThreadActivity.last_document_edit_at)
+            .join(ThreadActivity, ThreadActivity.thread_id == ThreadClosure.descendant_id)
+            .filter(ThreadClosure.ancestor_id.in_(thread_ids)))
+    for ancestor_id, post_count, last_post, last_edit in rows:
+        total = totals[ancestor_id]
+        total['tree_post_count'] += post_count
+        total['last_activity_at'] = max(filter(None, (total['last_activity_at'], last_post, last_edit)),
+                                        default=None)
+    db.session.execute(db.update(ThreadActivity), list(totals.values()))
+
+
+def move_read_counts(thread_id, old_ancestor_ids, new_ancestor_ids):
+    """Carry every user's reads of a moved subtree from the old ancestors'
+    read_tree_count to the new ones' (after a move; the caller commits).
+
+    A marker's read_tree_count on thread_id already totals what the user read
+    anywhere below it, so that is the amount moved.
+    """
+    left = set(old_ancestor_ids) - set(new_ancestor_ids)
+    joined = set(new_ancestor_ids) - set(old_ancestor_ids)
+    moved = db.aliased(ReadMarker)
+    read_below = (db.select(moved.read_tree_count)
+                  .where(moved.user_id == ReadMarker.user_id, moved.thread_id == thread_id)
+                  .scalar_subquery())
+    readers = db.select(moved.user_id).where(moved.thread_id == thread_id, moved.read_tree_count > 0)
+    if left:
+        db.session.execute(db.update(ReadMarker)
+                           .where(ReadMarker.thread_id.in_(left), ReadMarker.user_id.in_(readers))
+                           .values(read_tree_count=db.case((ReadMarker.read_tree_count > read_below,
+                                                            ReadMarker.read_tree_count - read_below), else_=0))
+                           .execution_options(synchronize_session=False))
+    if joined:
+        reader = db.aliased(ReadMarker)
+        db.session.execute(db.insert(ReadMarker).from_select(   # users with no marker there yet
+            ['user_id', 'thread_id', 'read_post_count', 'read_tree_count', 'read_at'],
+            db.select(reader.user_id, Thread.id, db.literal(0), db.literal(0), reader.read_at)
+            .select_from(db.join(reader, Thread, db.true()))
+            .where(reader.thread_id == thread_id, reader.read_tree_count > 0, Thread.id.in_(joined),
+                   ~db.exists().where(ReadMarker.user_id == reader.user_id, ReadMarker.thread_id == Thread.id))))
+        db.session.execute(db.update(ReadMarker)
+                           .where(ReadMarker.thread_id.in_(joined), ReadMarker.user_id.in_(readers))
+                           .values(read_tree_count=ReadMarker.read_tree_count + read_below)
+                           .execution_options(synchronize_session=False))
+
+
+def rebuild():
+    """Recompute thread_activity from posts and documents (repairs / old databases)."""
+    posts = {thread_id: (count, last) for thread_id, count, last in
+             db.session.query(Post.thread_id, db.func.count(Post.id), db.func.max(Post.created_at))
+             .group_by(Post.thread_id)}
+    edits = dict(db.session.query(Document.thread_id, db.func.max(Document.last_updated))
+                 .group_by(Document.thread_id))
+    parents = dict(db.session.query(Thread.id, Thread.parent_thread_id))
+
+    rows = {}
+    for thread_id in parents:
+        count, last_post = posts.get(thread_id, (0, None))
+        last_edit = edits.get(thread_id)
+        rows[thread_id] = {'thread_id': thread_id, 'post_count': count, 'last_post_at': last_post,
+                           'last_document_edit_at': last_edit, 'tree_post_count': count,
+                           'last_activity_at': max(filter(None, (last_post, last_edit)), default=None)}
+    for thread_id in parents:   # add each thread's own numbers to every ancestor's tree_*
+        row = rows[thread_id]
+        ancestor, seen = parents[thread_id], {thread_id}
+        while ancestor in rows and ancestor not in seen:
+            parent = rows[ancestor]
+            parent['tree_post_count'] += row['post_count']
+            parent['last_activity_at'] = max(filter(None, (parent['last_activity_at'], row['last_activity_at'])),
+                                             default=None)
+            seen.add(ancestor)
+            ancestor = parents[ancestor]
+    db.session.execute(db.delete(ThreadActivity))
+    if rows:
+        db.session.execute(db.insert(ThreadActivity), list(rows.values()))
+    db.session.commit()
+    return len(rows)
+
+
+def init_app(app):
+    schema.register_backfill('thread_activity', rebuild)   # `flask upgrade-db`
+
+    @app.cli.command('rebuild-activity')
+    def rebuild_activity_command():
+        """Rebuild thread_activity (dashboard counts) from posts and documents."""
+        click.echo(f'Activity rebuilt for {rebuild()} threads.')
@@ -0,0 +1,361 @@
+# ai_jobs.py
+# Background AI jobs: summaries, continuations and canon checks on documents.
+# Nothing here runs a provider call inside a request thread.
+#
+#   request ──enqueue()──▶ ai_jobs row (queued) ◀──claim── worker processes (`flask ai-workers`)
+#                                                          │  batch by kind, dedupe by prompt_hash,
+#                                                          │  answer from ai_results when cached
+#                                                          ▼
+#   client ◀── GET /ai/jobs/<id> (poll) or /ai/jobs/<id>/stream (SSE) ── done / failed
+#
+# - Identical prompts share one provider call and one ai_results row
+#   (content-hash result cache, AI_CACHE_TTL seconds).
+# - AI_WORKERS processes; AI_MAX_CONCURRENT caps provider calls in flight
+#   across all of them; AI_MAX_PENDING_PER_USER caps each user's queue.
+# - Failed calls are retried up to AI_MAX_ATTEMPTS; jobs left 'running' by a
+#   dead worker are requeued after AI_JOB_TIMEOUT seconds (and fail once they
+#   have used up their attempts too).
+# - Every finished job writes an AiCallLog row (latency, tokens, cache hit).
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import re
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from html import unescape
+
+import click
+from flask import current_app
+from sqlalchemy import update
+
+import live
+from ai_providers import AiRequest, load_provider
+from extensions import db
+from models import AiJob, AiResult, AiCallLog, Document
+
+log = logging.getLogger(__name__)
+
+KINDS = ('summary', 'continuation', 'canon_check')
+CANON_TYPES = ('story_arc', 'chapter_arc')   # documents a canon check compares against
+
+PROMPTS = {
+    'summary': 'Summarize this chapter of a collaborative novel in one paragraph.\n\n{text}',
+    'continuation': 'Continue this story for a few paragraphs in the same voice and tense.\n\n{text}',
+    'canon_check': ('List any contradictions between the chapter and the story canon, '
+                    'or reply that there are none.\n\nCANON:\n{canon}\n\nCHAPTER:\n{text}'),
+}
+
+
+class QueueFullError(Exception):
+    """The user already has AI_MAX_PENDING_PER_USER jobs waiting."""
+
+
+_TAG = re.compile(r'<[^>]+>')
+_BLANK = re.compile(r'\n\s*\n\s*')
+
+
+def document_text(html) -> str:
+    """Plain text of stored (sanitized) document HTML."""
+    text = _TAG.sub('\n', html or '')
+    return _BLANK.sub('\n\n', unescape(text)).strip()
+
+
+def build_prompt(kind, document, max_chars) -> str:
+    text = document_text(document.content)
+    if kind == 'continuation':
+        text = text[-max_chars:]   # the ending is what matters
+    else:
+        text = text[:max_chars]
+    canon = ''
+    if kind == 'canon_check':
+        canon_docs = (Document.query
+                      .filter(Document.thread_id == document.thread_id, Document.id != document.id,
+                              Document.type.in_(CANON_TYPES))
+                      .order_by(Document.id).all())
+        canon = '\n\n'.join(f'{d.title}:\n{document_text(d.content)}' for d in canon_docs)[:max_chars]
+    return PROMPTS[kind].format(text=text, canon=canon)
+
+
+def prompt_hash(provider, kind, prompt) -> str:
+    raw = '\x1f'.join((provider.name, provider.model or '', kind, prompt))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+_provider = None
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        _provider = load_provider(current_app.config)
+    return _provider
+
+
+# ─── Result cache ────────────────────────────────────────────────────
+def cached_result(digest, ttl):
+    result = db.session.get(AiResult, digest)
+    if result is None:
+        return None
+    if ttl and result.created_at < datetime.utcnow() - timedelta(seconds=ttl):
+        return None
+    return result
+
+
+def _finish(job, result_text, cache_hit, provider, latency_ms=0.0, prompt_tokens=0,
+            completion_tokens=0, batch_size=1, error=None):
+    """Complete job and write its AiCallLog row (caller commits)."""
+    job.status = 'failed' if error else 'done'
+    job.result = result_text
+    job.error = error[:500] if error else None
+    job.cache_hit = cache_hit
+    job.finished_at = datetime.utcnow()
+    db.session.add(AiCallLog(job_id=job.id, user_id=job.user_id, kind=job.kind,
+                             provider=provider.name, model=provider.model,
+                             prompt_hash=job.prompt_hash, cache_hit=cache_hit,
+                             batch_size=batch_size, latency_ms=latency_ms,
+                             prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                             error=job.error))
+
+
+def _publish(job):
+    live.hub.publish(f'ai_job:{job.id}', {'id': job.id, 'event': 'job', 'data': json.dumps(job.to_dict())})
+
+
+# ─── Enqueue (request side) ──────────────────────────────────────────
+def enqueue(user_id, kind, document) -> AiJob:
+    """Queue an AI job on a document; answered at once if the result is cached. Commits."""
+    if kind not in KINDS:
+        raise ValueError(f'unknown AI job kind: {kind}')
+    config = current_app.config
+    pending = (AiJob.query.filter(AiJob.user_id == user_id, AiJob.status.in_(('queued', 'running')))
+               .count())
+    if pending >= config.get('AI_MAX_PENDING_PER_USER', 5):
+        raise QueueFullError()
+
+    provider = get_provider()
+    prompt = build_prompt(kind, document, config.get('AI_MAX_PROMPT_CHARS', 48_000))
+    job = AiJob(user_id=user_id, document_id=document.id, kind=kind, prompt=prompt,
+                prompt_hash=prompt_hash(provider, kind, prompt))
+    db.session.add(job)
+    db.session.flush()
+
+    cached = cached_result(job.prompt_hash, config.get('AI_CACHE_TTL'))
+    if cached is not None:
+        cached.hit_count += 1
+        _finish(job, cached.result, True, provider)
+    db.session.commit()
+    return job
+
+
+# ─── Worker ──────────────────────────────────────────────────────────
+class Worker:
+    """Claims and runs batches of queued jobs. Needs an app context."""
+
+    def __init__(self, config, limiter=None, name='ai-worker'):
+        self.provider = load_provider(config)
+        self.limiter = limiter   # shared semaphore: provider calls in flight across processes
+        self.name = name
+        self.batch_size = max(1, min(config.get('AI_BATCH_SIZE', 8), self.provider.max_batch))
+        self.max_attempts = config.get('AI_MAX_ATTEMPTS', 3)
+        self.cache_ttl = config.get('AI_CACHE_TTL')
+        self.job_timeout = config.get('AI_JOB_TIMEOUT', 300)
+        self.poll_interval = config.get('AI_POLL_INTERVAL', 1.0)
+
+    def claim(self):
+        """Atomically mark up to batch_size queued jobs of one kind as ours."""
+        # Leave prompts that are already running queued: they'll be cache hits.
+        # (No NULLs in the subquery: one would make NOT IN exclude every row.)
+        running = db.select(AiJob.prompt_hash).where(AiJob.status == 'running', AiJob.prompt_hash.is_not(None))
+        claimable = (AiJob.status == 'queued', AiJob.prompt_hash.not_in(running))
+        kind = db.session.scalar(db.select(AiJob.kind).where(*claimable).order_by(AiJob.id).limit(1))
+        if kind is None:
+            db.session.rollback()
+            return []
+        token = uuid.uuid4().hex
+        candidates = (db.select(AiJob.id)
+                      .where(*claimable, AiJob.kind == kind)
+                      .order_by(AiJob.id).limit(self.batch_size))
+        db.session.execute(update(AiJob)
+                           .where(AiJob.id.in_(candidates), AiJob.status == 'queued')
+                           .values(status='running', claim_token=token, started_at=datetime.utcnow(),
+                                   attempts=AiJob.attempts + 1)
+                           .execution_options(synchronize_session=False))
+        db.session.commit()
+        return (AiJob.query.options(db.undefer(AiJob.prompt))
+                .filter_by(claim_token=token, status='running').order_by(AiJob.id).all())
+
+    def run_batch(self, jobs):
+        groups = OrderedDict()
+        for job in jobs:
+            groups.setdefault(job.prompt_hash, []).append(job)
+
+        misses = OrderedDict()
+        for digest, group in groups.items():
+            cached = cached_result(digest, self.cache_ttl)
+            if cached is None:
+                misses[digest] = group
+                continue
+            cached.hit_count += len(group)
+            for job in group:
+                _finish(job, cached.result, True, self.provider)
+
+        if misses:
+            requests = [AiRequest(group[0].kind, group[0].prompt) for group in misses.values()]
+            started = time.perf_counter()
+            try:
+                if self.limiter is not None:
+                    with self.limiter:
+                        completions = self.provider.complete(requests)
+                else:
+                    completions = self.provider.complete(requests)
+            except Exception as exc:
+                log.warning('%s: provider call failed for %d prompts: %s', self.name, len(requests), exc)
+                for group in misses.values():
+                    for job in group:
+                        if job.attempts >= self.max_attempts:
+                            _finish(job, None, False, self.provider, error=str(exc) or type(exc).__name__,
+                                    batch_size=len(requests))
+                        else:
+                            job.status, job.claim_token = 'queued', None
+            else:
+                latency_ms = (time.perf_counter() - started) * 1000
+                completions = list(completions)
+                for (digest, group), completion in zip(misses.items(), completions):
+                    db.session.merge(AiResult(prompt_hash=digest, provider=self.provider.name,
+                                              model=self.provider.model, result=completion.text,
+                                              prompt_tokens=completion.prompt_tokens,
+                                              completion_tokens=completion.completion_tokens,
+                                              created_at=datetime.utcnow(), hit_count=len(group) - 1))
+                    first, *duplicates = group
+                    _finish(first, completion.text, False, self.provider, latency_ms,
+                            completion.prompt_tokens, completion.completion_tokens, len(requests))
+                    for job in duplicates:   # same prompt in the same batch: one call served all
+                        _finish(job, completion.text, True, self.provider, batch_size=len(requests))
+                if len(completions) < len(misses):   # a short answer: don't leave the rest 'running'
+                    error = f'provider returned {len(completions)} completions for {len(requests)} prompts'
+                    log.warning('%s: %s', self.name, error)
+                    for group in list(misses.values())[len(completions):]:
+                        for job in group:
+                            _finish(job, None, False, self.provider, error=error, batch_size=len(requests))
+        db.session.commit()
+        for job in jobs:
+            if job.finished:
+                _publish(job)
+
+    def requeue_stale(self):
+        """Jobs stuck in 'running' past AI_JOB_TIMEOUT (worker died) go back to the queue.
+
+        Every claim counted as an attempt, so a job that keeps killing its
+        worker fails once it has had AI_MAX_ATTEMPTS instead of looping forever.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.job_timeout)
+        stale = (AiJob.query.filter(AiJob.status == 'running', AiJob.started_at < cutoff)
+                 .order_by(AiJob.id).with_for_update().all())
+        failed = []
+        for job in stale:
+            if job.attempts >= self.max_attempts:
+                _finish(job, None, False, self.provider,
+                        error=f'worker timed out on all {job.attempts} attempts')
+                failed.append(job)
+            else:
+                job.status, job.claim_token = 'queued', None
+        db.session.commit()
+        for job in failed:
+            _publish(job)
+        if stale:
+            log.warning('%s: %d stale jobs: %d requeued, %d failed',
+                        self.name, len(stale), len(stale) - len(failed), len(failed))
+        return len(stale)
+
+    def run(self, stop=None, once=False):
+        """Process jobs until stop is set (or, with once=True, until the queue is empty)."""
+        self.requeue_stale()
+        last_sweep = time.monotonic()
+        while stop is None or not stop.is_set():
+            jobs = self.claim()
+            if jobs:
+                self.run_batch(jobs)
+                continue
+            if once:
+                return
+            db.session.close()   # idle: give the connection back
+            if time.monotonic() - last_sweep > self.job_timeout:
+                self.requeue_stale()
+                last_sweep = time.monotonic()
+            if stop is not None:
+                stop.wait(self.poll_interval)
+            else:
+                time.sleep(self.poll_interval)
+
+
+def _worker_main(number, limiter, stop):
+    from app import app   # already imported when forked; imported fresh when spawned
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)   # never share the parent's pooled connections
+        live.hub.set_backend(live.backend_from_config(app.config))   # threads don't survive fork
+        try:
+            Worker(app.config, limiter, name=f'ai-worker-{number}').run(stop)
+        except KeyboardInterrupt:
+            pass
+
+
+def run_pool(processes, max_concurrent):
+    """Start the worker processes and wait for them (Ctrl-C stops them)."""
+    context = multiprocessing.get_context()
+    limiter = context.BoundedSemaphore(max_concurrent) if max_concurrent else None
+    stop = context.Event()
+    workers = [context.Process(target=_worker_main, args=(n, limiter, stop), name=f'ai-worker-{n}')
+               for n in range(processes)]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for process in workers:
+            process.join()
+
+
+# ─── Client side: wait for a result ──────────────────────────────────
+def job_events(job_id, subscription, poll=2.0):
+    """SSE frames for one job: a single 'job' event once it finishes.
+
+    Workers publish completions through live.hub; the job row is also
+    re-checked every `poll` seconds, so this works without a broker too.
+    Run inside stream_with_context (it uses db.session).
+    """
+    try:
+        yield f'retry: {live.RETRY_MS}\n\n'
+        while True:
+            db.session.expire_all()
+            job = db.session.get(AiJob, job_id)
+            finished = job is not None and job.finished
+            payload = json.dumps(job.to_dict()) if finished else None
+            db.session.close()   # don't hold a connection while waiting
+            if finished:
+                yield live.sse_event(payload, 'job', job_id)
+                return
+            if subscription.get(timeout=poll) is None:
+                yield ': keepalive\n\n'
+    finally:
+        subscription.close()
+
+
+def init_app(app):
+    @app.cli.command('ai-workers')
+    @click.option('--processes', type=int, default=None, help='worker processes (default AI_WORKERS)')
+    @click.option('--once', is_flag=True, help='drain the queue in this process and exit')
+    def ai_workers_command(processes, once):
+        """Run the AI job workers."""
+        if once:
+            Worker(app.config).run(once=True)
+            return
+        processes = processes or app.config.get('AI_WORKERS', 2)
+        click.echo(f'Starting {processes} AI workers')
+        run_pool(processes, app.config.get('AI_MAX_CONCURRENT'))
@@ -0,0 +1,87 @@
+# ai_providers.py
+# Pluggable AI providers for the job workers (ai_jobs.py).
+#
+# A provider answers a batch of prompts in one call:
+#
+#   class MyProvider(Provider):
+#       name = 'my-llm'
+#       max_batch = 8
+#       def complete(self, requests):            # [AiRequest, …]
+#           return [Completion(text, prompt_tokens, completion_tokens), …]
+#
+# and is selected with AI_PROVIDER: 'fake' (the built-in local provider used
+# for development and tests) or 'package.module:ClassName'. Providers are
+# constructed with the app config.
+
+import hashlib
+import importlib
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+AiRequest = namedtuple('AiRequest', 'kind prompt')
+Completion = namedtuple('Completion', 'text prompt_tokens completion_tokens')
+
+
+class ProviderError(Exception):
+    """A provider call failed; the jobs in it are retried up to AI_MAX_ATTEMPTS."""
+
+
+class Provider(ABC):
+    name = 'base'
+    max_batch = 1   # prompts per complete() call
+
+    def __init__(self, config):
+        self.model = config.get('AI_MODEL')
+
+    @abstractmethod
+    def complete(self, requests):
+        """One Completion per request, in order."""
+
+
+def count_tokens(text):
+    """Rough whitespace token count, for providers that don't report usage."""
+    return len(text.split())
+
+
+class FakeProvider(Provider):
+    """Deterministic local provider: no network, same prompt → same answer.
+
+    AI_FAKE_LATENCY_MS simulates a slow remote call (once per batch).
+    """
+    name = 'fake'
+    max_batch = 16
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.model = self.model or 'fake-1'
+        self.latency = config.get('AI_FAKE_LATENCY_MS', 0) / 1000
+
+    def complete(self, requests):
+        if self.latency:
+            time.sleep(self.latency)
+        completions = []
+        for request in requests:
+            digest = hashlib.sha256(request.prompt.encode()).hexdigest()[:8]
+            words = request.prompt.split()
+            if request.kind == 'summary':
+                text = f"Summary [{digest}]: {' '.join(words[-40:])}"
+            elif request.kind == 'continuation':
+                text = f"Continuation [{digest}]: {' '.join(words[-20:])} …"
+            else:
+                text = f'Canon check [{digest}]: no contradictions found.'
+            completions.append(Completion(text, count_tokens(request.prompt), count_tokens(text)))
+        return completions
+
+
+PROVIDERS = {'fake': FakeProvider}
+
+
+def load_provider(config) -> Provider:
+    spec = config.get('AI_PROVIDER', 'fake')
+    if spec in PROVIDERS:
+        return PROVIDERS[spec](config)
+    module_name, _, class_name = spec.partition(':')
+    if not class_name:
+        raise ValueError(f"AI_PROVIDER must be one of {sorted(PROVIDERS)} or 'module:Class', got {spec!r}")
+    return getattr(importlib.import_module(module_name), class_name)(config)
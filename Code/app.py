@@ -1,30 +1,72 @@
 # app.py
 
-from flask import Flask, render_template, request, redirect, url_for, flash, abort
-from datetime import datetime
+from flask import Flask, render_template, request, redirect, url_for, flash, abort, jsonify, Response, stream_with_context
 import os
 import json
-from werkzeug.security import check_password_hash   # actually already used in model
+from werkzeug.utils import secure_filename
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.exc import StaleDataError
 from flask_login import login_user, logout_user, login_required, current_user
 
 # ─── Extensions ───────────────────────────────────────────────────────────────
 from extensions import db, login_manager
-from models import Thread, Post, ListBoundaryOption, GroupMembership
+from config import load_config
+import database
+from database import read_only
+from models import Thread, Post, Document, DocumentChunk, ListBoundaryOption, AiJob
+import feed
+import deltas
+import search
+import boundaries
+import discovery
+import provisioning
+import memberships
+import live
+import instrumentation
+import conditional
+import fragments
+import ai_jobs
+import chunking
+import export
+import collab
+import assets
+import activity
+import hierarchy
+import auth
+import schema
+import sanitize
+from boundaries import boundary_cache
 
 app = Flask(__name__)
 
-# Config
-basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, '..', 'DB', 'database.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'dev-key-change-this-later-please-use-env-var'
+# Config (defaults → PLOTFORGE_CONFIG file → environment, see config.py)
+load_config(app)
+database.configure(app)
 
 # Initialize extensions
 db.init_app(app)
+database.init_app(app, db)   # SQLite pragmas (WAL, busy_timeout, …) on every connection
 login_manager.init_app(app)
 login_manager.login_view = 'login'          # redirect here when @login_required triggers
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
+search.init_app(app)
+boundaries.init_app(app)
+provisioning.init_app(app)
+memberships.init_app(app)
+conditional.init_app(app)
+live.init_app(app)
+fragments.init_app(app)
+ai_jobs.init_app(app)
+chunking.init_app(app)
+export.init_app(app)
+collab.init_app(app)
+assets.init_app(app)
+activity.init_app(app)
+hierarchy.init_app(app)
+auth.init_app(app)
+instrumentation.init_app(app, db)   # no-op unless METRICS_ENABLED
+schema.init_app(app)   # `flask upgrade-db` for databases older than the models
 
 # ─── User loader (required by Flask-Login) ────────────────────────────────────
 from models import User #RJH- Does this need to be done here? Cleaner up top)
@@ -51,12 +93,19 @@ def register():
             flash('All fields are required.', 'danger')
             return redirect(url_for('register'))
 
-        if User.query.filter((User.username == username) | (User.email == email)).first():
-            flash('Username or email already taken.', 'danger')
-            return redirect(url_for('register'))
+        try:
+            auth.check_registration(request.remote_addr)
+            if User.query.filter((User.username == username) | (User.email == email)).first():
+                flash('Username or email already taken.', 'danger')
+                return redirect(url_for('register'))
+            password_hash = auth.hash_password(password)   # on the hash pool, not this worker
+        except auth.Throttled as e:
+            return _auth_refused('register.html', 'Too many registrations from your address. '
+                                 f'Try again in {e.retry_after} seconds.', 429, e.retry_after)
+        except auth.Overloaded:
+            return _auth_refused('register.html', 'The server is busy. Please try again in a moment.', 503, 1)
 
-        user = User(username=username, email=email)
-        user.set_password(password)
+        user = User(username=username, email=email, password_hash=password_hash)
 
         db.session.add(user)
         db.session.commit()
@@ -66,6 +115,13 @@ def register():
 
     return render_template('register.html')
 
+def _auth_refused(template, message, status, retry_after):
+    """Login/registration turned away before any hashing (throttled or hash pool full)."""
+    flash(message, 'danger')
+    response = app.make_response((render_template(template), status))
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
 # ─── Login ───────────────────────────────────────────────────────────────────
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -76,12 +132,17 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
 
-        user = User.query.filter_by(username=username).first()
+        try:
+            user = auth.authenticate(username, password, request.remote_addr)
+        except auth.Throttled as e:
+            return _auth_refused('login.html', 'Too many login attempts. '
+                                 f'Try again in {e.retry_after} seconds.', 429, e.retry_after)
+        except auth.Overloaded:
+            return _auth_refused('login.html', 'The server is busy. Please try again in a moment.', 503, 1)
 
-        if user and user.check_password(password):
+        if user:
             login_user(user)
-            user.last_login = datetime.utcnow()  #Update last login
-            db.session.commit()
+            auth.last_logins.record(user.id)   # written in batches, see auth.py
             flash('Logged in successfully.', 'success')
             return redirect(url_for('dashboard'))   # or request.args.get('next')
 
@@ -101,21 +162,17 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    print(f"Current user ID: {current_user.id}")
-    print(f"Current user username: {current_user.username}")
-
     user_proposals = Thread.query.filter_by(
         leader_id=current_user.id,
         is_proposal=True,
         status='open'
     ).order_by(Thread.created_at.desc()).all()
 
-    print(f"Found {len(user_proposals)} open proposals for this user")
-    for p in user_proposals:
-        print(f" - Proposal ID {p.id}: {p.title} (status: {p.status}, is_proposal: {p.is_proposal})")
+    app.logger.debug('Dashboard for user %s: %d open proposals', current_user.id, len(user_proposals))
 
     return render_template('dashboard.html',
                            proposals=user_proposals,
+                           workspaces=activity.workspace_summaries(current_user.id),
                            user=current_user)     # ← this line fixes the error
 
 # ─── New Proposal Thread Creation ────────────────────────────────────────────
@@ -131,162 +188,145 @@ def new_proposal():
             flash('Title is required.', 'danger')
             return redirect(url_for('new_proposal'))
 
-        # Create public recruitment thread (proposal)
-        recruitment = Thread(
-            title=title,
-            is_proposal=True,
-            leader_id=current_user.id,
-            max_members=max_members,
-            status='open',
-            boundary_genre=request.form.get('boundary_genre'),
-            boundary_political=request.form.get('boundary_political'),
-            boundary_violence=request.form.get('boundary_violence'),
-            boundary_sex=request.form.get('boundary_sex'),
-            boundary_style=request.form.get('boundary_style'),
-            boundary_audience=request.form.get('boundary_audience')
-        )
-        db.session.add(recruitment)
-        db.session.commit()
+        # Boundary dropdowns post option ids – keep only ones valid for their category
+        boundary_ids = {}
+        for category, _ in boundaries.CATEGORIES:
+            option_id = request.form.get(f'{category}_id', type=int)
+            boundary_ids[f'{category}_id'] = option_id if boundary_cache.is_valid(category, option_id) else None
 
-        # Auto-add leader to recruitment thread
-        db.session.add(GroupMembership(
-            user_id=current_user.id,
-            thread_id=recruitment.id,
-            role='leader'
-        ))
-        db.session.commit()
-
-        # Create private workspace immediately
-        workspace = Thread(
-            title=f"Workspace: {title}",
-            is_proposal=False,
-            is_private_workspace=True,
+        # Recruitment thread, workspace, sub-threads, documents and first post – one transaction
+        result = provisioning.provision_workspace(
             leader_id=current_user.id,
+            title=title,
+            description=description,
             max_members=max_members,
-            status='active',
-            boundary_genre=recruitment.boundary_genre,
-            boundary_political=recruitment.boundary_political,
-            boundary_violence=recruitment.boundary_violence,
-            boundary_sex=recruitment.boundary_sex,
-            boundary_style=recruitment.boundary_style,
-            boundary_audience=recruitment.boundary_audience
+            boundary_ids=boundary_ids
         )
-        db.session.add(workspace)
-        db.session.commit()
-
-        # Auto-add leader to workspace
-        db.session.add(GroupMembership(
-            user_id=current_user.id,
-            thread_id=workspace.id,
-            role='leader'
-        ))
-        db.session.commit()
-
-        # Create default sub-threads in workspace
-        social_chat = Thread(
-            title="Social Chat (Not Book Related)",
-            is_proposal=False,
-            parent_thread_id=workspace.id,
-            leader_id=current_user.id,
-            status='active'
-        )
-        overall_arc = Thread(
-            title="Overall Story Arc (Big Picture)",
-            is_proposal=False,
-            parent_thread_id=workspace.id,
-            leader_id=current_user.id,
-            status='active'
-        )
-        chapter_1 = Thread(
-            title="Chapter 1",
-            is_proposal=False,
-            parent_thread_id=workspace.id,
-            leader_id=current_user.id,
-            status='active'
-        )
-        db.session.add_all([social_chat, overall_arc, chapter_1])
-        db.session.commit()
-
-        # Create default documents in workspace
-        overall_doc = Document(
-            thread_id=workspace.id,
-            title="Overall Story Arc",
-            type='story_arc',
-            content='[Initial big-picture elements – edit here]',
-            associated_thread_id=overall_arc.id
-        )
-        ch1_arc_doc = Document(
-            thread_id=workspace.id,
-            title="Chapter 1 Story Arc",
-            type='chapter_arc',
-            chapter_num=1,
-            content='[Chapter 1 outline – edit here]',
-            associated_thread_id=chapter_1.id
-        )
-        ch1_text_doc = Document(
-            thread_id=workspace.id,
-            title="Chapter 1 Text",
-            type='chapter_text',
-            chapter_num=1,
-            content='[Start writing the actual chapter here]',
-            associated_thread_id=chapter_1.id
-        )
-        db.session.add_all([overall_doc, ch1_arc_doc, ch1_text_doc])
-        db.session.commit()
-
-        # Optional: initial post in recruitment thread
-        if description:
-            db.session.add(Post(
-                thread_id=recruitment.id,
-                user_id=current_user.id,
-                content=description
-            ))
-            db.session.commit()
+        workspace = result.workspace
 
         flash('Proposal created! Private workspace ready — start collaborating.', 'success')
         return redirect(url_for('workspace_dashboard', workspace_id=workspace.id))
 
-    # GET unchanged
-    # ... (genre_options etc.)
+    # GET – dropdown vocabularies come from the in-process boundary cache
+    return render_template('new_proposal.html', **boundary_cache.dropdowns())
 
 #Pasted in this chunk down, check for duplicates
 @app.route('/proposals')
+@read_only
 def proposals():
-    open_proposals = Thread.query.filter_by(is_proposal=True, status='open') \
-                                 .order_by(Thread.created_at.desc()).all()
-    return render_template('proposals.html', proposals=open_proposals)
-
-
-@app.route('/threads/<int:thread_id>')
+    # Any change to any proposal (new one, post, member joined) moves this marker
+    changed_at = db.session.query(db.func.max(Thread.changed_at)).filter(Thread.is_proposal == True).scalar()
+    etag = conditional.make_etag('proposals', changed_at, request.full_path,
+                                 conditional.viewer_key(), boundary_cache.fingerprint)
+    not_modified = conditional.check(etag, changed_at)
+    if not_modified:
+        return not_modified
+
+    filters, open_seats = discovery.parse_filters(request.args)
+    try:
+        page = discovery.proposal_page(filters, open_seats, cursor=request.args.get('cursor'))
+    except ValueError:
+        abort(400)
+    return conditional.stamp(render_template('proposals.html',
+                                             page=page,
+                                             total=discovery.proposal_count(filters, open_seats),
+                                             filters=filters,
+                                             open_seats=open_seats,
+                                             **boundary_cache.dropdowns()),
+                             etag, changed_at)
+
+@app.route('/proposals.json')
+@read_only
+def proposals_json():
+    """Same listing as /proposals for infinite scroll: pass next_cursor back as ?cursor=."""
+    filters, open_seats = discovery.parse_filters(request.args)
+    try:
+        page = discovery.proposal_page(filters, open_seats, cursor=request.args.get('cursor'),
+                                       limit=request.args.get('limit', type=int))
+    except ValueError:
+        abort(400)
+    data = page.to_dict()
+    if not request.args.get('cursor'):
+        data['total'] = discovery.proposal_count(filters, open_seats)
+    return jsonify(data)
+
+
+@app.route('/threads/<int:thread_id>')   # not @read_only: opening a thread writes the read marker
 def thread_detail(thread_id):
     thread = Thread.query.get_or_404(thread_id)
     
     if not thread.is_proposal and not current_user.is_authenticated:
         abort(403)  # private → require login later
 
-    # Load posts ordered
-    posts = thread.posts.order_by(Post.created_at).all()
-    
+    etag = conditional.make_etag('thread', thread.id, thread.changed_at,
+                                 conditional.viewer_key(), boundary_cache.fingerprint)
+    not_modified = conditional.check(etag, thread.changed_at)
+    if not_modified:
+        return not_modified
+
+    # Newest page only (authors joined in) – older/newer pages come from the feed routes below
+    page = feed.latest_posts(thread.id)
+
     # Check if current user can join/finalize
     is_leader = current_user.is_authenticated and thread.leader_id == current_user.id
-    is_member = current_user.is_authenticated and GroupMembership.query.filter_by(user_id=current_user.id, thread_id=thread.id).first() is not None
+    is_member = memberships.is_member(thread.id)   # cached role map, no query
     
-    return render_template('thread.html', 
-                           thread=thread, 
-                           posts=posts, 
-                           is_leader=is_leader, 
+    changed_at = thread.changed_at
+    html = render_template('thread.html',
+                           thread=thread,
+                           boundaries=boundary_cache.thread_boundaries(thread),
+                           posts=page.posts,
+                           page=page,
+                           newest_post_id=max((post.id for post in page.posts), default=0),
+                           is_leader=is_leader,
                            is_member=is_member)
+    # After rendering: its commit expires the posts the template has just read
+    if current_user.is_authenticated:
+        activity.mark_read(current_user.id, thread)
+    return conditional.stamp(html, etag, changed_at)
+
+# ─── Post feed pages (load older / load newer) ───────────────────────────────
+def _feed_response(thread, page):
+    is_leader = current_user.is_authenticated and thread.leader_id == current_user.id
+    html = render_template('_posts.html', thread=thread, posts=page.posts, is_leader=is_leader)
+    return jsonify(html=html, **page.to_dict())
+
+@app.route('/threads/<int:thread_id>/posts/older')
+@read_only
+def thread_posts_older(thread_id):
+    thread = Thread.query.get_or_404(thread_id)
+    if not thread.is_proposal and not current_user.is_authenticated:
+        abort(403)
+    try:
+        page = feed.posts_before(thread.id, request.args.get('cursor', ''),
+                                 limit=request.args.get('limit', type=int))
+    except ValueError:
+        abort(400)
+    return _feed_response(thread, page)
+
+@app.route('/threads/<int:thread_id>/posts/newer')
+@read_only
+def thread_posts_newer(thread_id):
+    thread = Thread.query.get_or_404(thread_id)
+    if not thread.is_proposal and not current_user.is_authenticated:
+        abort(403)
+    try:
+        page = feed.posts_after(thread.id, request.args.get('cursor', ''),
+                                limit=request.args.get('limit', type=int))
+    except ValueError:
+        abort(400)
+    return _feed_response(thread, page)
 
 @app.route('/threads/<int:thread_id>/post', methods=['POST'])
 @login_required
 def post_in_thread(thread_id):
     thread = Thread.query.get_or_404(thread_id)
-    
+
     content = request.form.get('content', '').strip()
     if not content:
         flash('Post cannot be empty.', 'danger')
         return redirect(url_for('thread_detail', thread_id=thread_id))
-    
+
     new_post = Post(
         thread_id=thread.id,
         user_id=current_user.id,
@@ -294,41 +334,369 @@ def post_in_thread(thread_id):
     )
     db.session.add(new_post)
     db.session.commit()
-    
+
+    # Push the rendered post to everyone watching the thread
+    live.hub.publish(_thread_channel(thread.id), _post_event(thread, new_post))
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(id=new_post.id), 201   # posted from thread.html via fetch; SSE shows it
+
     flash('Posted!', 'success')
     return redirect(url_for('thread_detail', thread_id=thread_id))
 
+# ─── Live updates (Server-Sent Events) ───────────────────────────────────────
+STREAM_BACKLOG_LIMIT = 200
+
+def _thread_channel(thread_id):
+    return f'thread:{thread_id}'
+
+def _post_event(thread, post):
+    # Rendered once per post for all subscribers; leaders get the "Add to Group" variant
+    return {
+        'id': post.id,
+        'event': 'post',
+        'data': str(fragments.post_card(thread, post, is_leader=False)).strip(),
+        'leader_data': str(fragments.post_card(thread, post, is_leader=True)).strip(),
+    }
+
+@app.route('/threads/<int:thread_id>/stream')
+def thread_stream(thread_id):
+    thread = Thread.query.get_or_404(thread_id)
+    if not thread.is_proposal and not current_user.is_authenticated:
+        abort(403)
+    is_leader = current_user.is_authenticated and thread.leader_id == current_user.id
+
+    # Subscribe before reading the backlog so nothing falls in between. The page
+    # passes the newest post it rendered as ?last_id=, so posts made between the
+    # render and this subscribe are replayed too (0: the thread had none).
+    subscription = live.hub.subscribe(_thread_channel(thread.id))
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_id', type=int)
+    backlog = []
+    if last_id is not None:
+        missed = (Post.query.options(joinedload(Post.author))
+                  .filter(Post.thread_id == thread.id, Post.id > last_id)
+                  .order_by(Post.id)
+                  .limit(STREAM_BACKLOG_LIMIT).all())
+        backlog = [_post_event(thread, post) for post in missed]
+    db.session.close()   # don't hold a DB connection for the life of the stream
+
+    return Response(live.stream(subscription, backlog, last_id=last_id or 0,
+                                data_key='leader_data' if is_leader else 'data'),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/threads/<int:thread_id>/add_member/<int:user_id>', methods=['POST'])
 @login_required
 def add_member(thread_id, user_id):
     thread = Thread.query.get_or_404(thread_id)
     if thread.leader_id != current_user.id:
         abort(403)
-    
-    if GroupMembership.query.filter_by(user_id=user_id, thread_id=thread.id).first():
-        flash('User is already a member.', 'info')
+
+    try:
+        # Seat is claimed with a conditional UPDATE – safe under concurrent joins
+        memberships.add_member(thread.id, user_id)
+    except memberships.AlreadyMemberError as exc:
+        flash(str(exc), 'info')
         return redirect(url_for('thread_detail', thread_id=thread_id))
-    
-    if len(thread.memberships) >= thread.max_members:
-        flash('Group is full.', 'danger')
+    except memberships.GroupFullError as exc:
+        flash(str(exc), 'danger')
         return redirect(url_for('thread_detail', thread_id=thread_id))
-    
-    membership = GroupMembership(user_id=user_id, thread_id=thread.id, role='member')
-    db.session.add(membership)
-    db.session.commit()
-    
+
     flash('Member added to group!', 'success')
     return redirect(url_for('thread_detail', thread_id=thread_id))
 
-# CKEditor test page (minimal)
+@app.route('/threads/<int:thread_id>/move', methods=['POST'])
+@login_required
+def move_thread(thread_id):
+    """Re-parent a thread and everything below it. Body: {"parent_id": 12} (null = top level)."""
+    thread = Thread.query.get_or_404(thread_id)
+    data = request.get_json(silent=True) or {}
+    parent_id = data.get('parent_id')
+    if parent_id is not None and not isinstance(parent_id, int):
+        return jsonify(error='parent_id must be a thread id or null'), 400
+    parent = db.session.get(Thread, parent_id) if parent_id is not None else None
+    if thread.leader_id != current_user.id or (parent is not None and parent.leader_id != current_user.id):
+        abort(403)
+    try:
+        hierarchy.move_thread(thread.id, parent_id)
+    except hierarchy.HierarchyError as exc:
+        return jsonify(error=str(exc)), 400
+    return jsonify(id=thread.id, parent_id=parent_id, path=hierarchy.ancestor_ids(thread.id))
+
+# ─── Document revision history ───────────────────────────────────────────────
+def _get_member_document(document_id):
+    document = Document.query.get_or_404(document_id)
+    if not memberships.is_member(document.thread_id):
+        abort(403)
+    return document
+
+@app.route('/documents/<int:document_id>/revisions')
+@login_required
+def document_revisions(document_id):
+    document = _get_member_document(document_id)
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    revisions = document.get_revision_history(before_seq=request.args.get('before', type=int),
+                                              limit=limit)
+    return jsonify(revisions=[r.to_dict() for r in revisions],
+                   next_before=revisions[-1].seq if len(revisions) == limit else None)
+
+@app.route('/documents/<int:document_id>/revisions/<int:seq>')
+@login_required
+def document_revision_content(document_id, seq):
+    document = _get_member_document(document_id)
+    content = document.get_version(seq)
+    if content is None:
+        abort(404)
+    return jsonify(seq=seq, content=content)
+
+# ─── Document content + delta saves ─────────────────────────────────────────
+@app.route('/documents/<int:document_id>')
+@login_required
+def document_content(document_id):
+    document = _get_member_document(document_id)
+    return jsonify(id=document.id, version=document.version, content=document.content)
+
+@app.route('/documents/<int:document_id>', methods=['PATCH'])
+@login_required
+def patch_document(document_id):
+    """Save an edit as a delta against a known version.
+
+    Body: {"base_version": 7, "delta": [["c", 1200], ["s", 5], ["i", "word"], ["c", 88000]],
+           "summary": "typo fix"}
+    Replies 409 with the current version if someone else saved first.
+    """
+    document = _get_member_document(document_id)
+    data = request.get_json(silent=True) or {}
+
+    base_version = data.get('base_version')
+    if not isinstance(base_version, int):
+        return jsonify(error='base_version is required'), 400
+    if base_version != document.version:
+        return jsonify(error='stale version', version=document.version), 409
+
+    try:
+        sent = deltas.validate_delta(data.get('delta'))
+        ops = document.apply_patch(sent)[1]
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+
+    try:
+        document.add_revision(current_user.id, data.get('summary') or 'Edit', delta=ops)
+        db.session.commit()
+    except StaleDataError:
+        # Lost the race between our version check and the UPDATE
+        db.session.rollback()
+        current = db.session.get(Document, document_id)
+        return jsonify(error='stale version', version=current.version), 409
+
+    # cleaned: the sanitizer changed what was sent – the editor should reload the content
+    return jsonify(id=document.id, version=document.version,
+                   cleaned=ops is not sent)
+
+# ─── Chunked documents: read / save one section ──────────────────────────────
+def _get_chunk(document, chunk_id):
+    chunk = db.session.get(DocumentChunk, chunk_id)
+    if chunk is None or chunk.document_id != document.id:
+        abort(404)
+    return chunk
+
+@app.route('/documents/<int:document_id>/chunks')
+@login_required
+@read_only
+def document_chunks(document_id):
+    """Section list (ids, positions, lengths) – no paragraph text is loaded."""
+    document = _get_member_document(document_id)
+    if document.storage != 'chunked':
+        abort(404)
+    chunks = (DocumentChunk.query
+              .options(db.load_only(DocumentChunk.id, DocumentChunk.position, DocumentChunk.length))
+              .filter_by(document_id=document.id)
+              .order_by(DocumentChunk.position).all())
+    return jsonify(id=document.id, version=document.version, chunks=[c.to_dict() for c in chunks])
+
+@app.route('/documents/<int:document_id>/chunks/<int:chunk_id>')
+@login_required
+@read_only
+def document_chunk(document_id, chunk_id):
+    document = _get_member_document(document_id)
+    chunk = _get_chunk(document, chunk_id)
+    return jsonify(version=document.version, **chunk.to_dict(with_content=True))
+
+@app.route('/documents/<int:document_id>/chunks/<int:chunk_id>', methods=['PUT'])
+@login_required
+def save_document_chunk(document_id, chunk_id):
+    """Replace one section. Body: {"base_version": 7, "content": "<p>…</p>", "summary": "…"}.
+
+    The content may hold several paragraphs (they become new chunks after this
+    one) or none (the section is deleted). Replies 409 on a stale version.
+    """
+    document = _get_member_document(document_id)
+    chunk = _get_chunk(document, chunk_id)
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('base_version'), int) or not isinstance(data.get('content'), str):
+        return jsonify(error='base_version and content are required'), 400
+    if data['base_version'] != document.version:
+        return jsonify(error='stale version', version=document.version), 409
+
+    try:
+        ops, chunks = document.replace_chunk(chunk, data['content'])
+        document.add_revision(current_user.id, data.get('summary') or 'Edit', delta=ops)
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        current = db.session.get(Document, document_id)
+        return jsonify(error='stale version', version=current.version), 409
+
+    return jsonify(id=document.id, version=document.version, chunks=[c.to_dict() for c in chunks])
+
+@app.route('/documents/<int:document_id>/read')
+@login_required
+@read_only
+def read_document(document_id):
+    # Content (deferred column or chunks) stays unloaded unless the body is not cached yet
+    document = Document.query.get_or_404(document_id)
+    if not memberships.is_member(document.thread_id):
+        abort(403)
+    return render_template('document.html', document=document, body=fragments.document_html(document))
+
+# ─── Live collaborative editing (collab.py) ─────────────────────────────────
+def _collab_session(document_id):
+    document = _get_member_document(document_id)
+    return collab.manager.get(document.id)
+
+@app.route('/documents/<int:document_id>/collab/join', methods=['POST'])
+@login_required
+def collab_join(document_id):
+    """Enter (or re-sync with) the document's live session: text and rev to edit against."""
+    session = _collab_session(document_id)
+    data = request.get_json(silent=True) or {}
+    client_id, rev, text = session.join(current_user.id, data.get('client_id'))
+    return jsonify(client_id=client_id, rev=rev, content=text,
+                   ops_url=url_for('collab_ops', document_id=document_id),
+                   stream_url=url_for('collab_stream', document_id=document_id, client_id=client_id))
+
+@app.route('/documents/<int:document_id>/collab/ops', methods=['POST'])
+@login_required
+def collab_ops(document_id):
+    """Apply an edit. Body: {"client_id": "…", "base_rev": 41, "ops": [["c", 120], ["i", "word"], …]}.
+
+    Replies with the op's rev and the ops as applied (rebased over anything the
+    client hadn't seen). 409 means base_rev is too old: join again.
+    """
+    session = _collab_session(document_id)
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('base_rev'), int) or not isinstance(data.get('client_id'), str):
+        return jsonify(error='client_id and base_rev are required'), 400
+    try:
+        ops = deltas.validate_delta(data.get('ops'))
+        rev, applied = collab.submit(document_id, data['client_id'][:32], current_user.id,
+                                     data['base_rev'], ops)
+    except collab.ResyncError:
+        return jsonify(error='resync', rev=session.rev), 409
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+    return jsonify(rev=rev, ops=applied)
+
+@app.route('/documents/<int:document_id>/collab/stream')
+@login_required
+def collab_stream(document_id):
+    """Other editors' ops as SSE 'ops' events ({from, rev, client, ops}), after ?rev= / Last-Event-ID."""
+    session = _collab_session(document_id)
+    # Subscribe before reading the backlog so nothing falls in between
+    subscription = live.hub.subscribe(collab.channel(document_id))
+    last_rev = request.headers.get('Last-Event-ID', type=int)
+    if last_rev is None:
+        last_rev = request.args.get('rev', session.rev, type=int)
+    db.session.close()
+    return Response(collab.events(session, subscription, last_rev),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/documents/<int:document_id>/collab/leave', methods=['POST'])
+@login_required
+def collab_leave(document_id):
+    document = _get_member_document(document_id)
+    session = collab.manager.get(document.id, create=False)
+    if session is not None:
+        session.leave((request.get_json(silent=True) or {}).get('client_id'), current_user.id)
+    return jsonify(ok=True)
+
+# ─── AI jobs (run by `flask ai-workers`, never in the request) ──────────────
+@app.route('/documents/<int:document_id>/ai/<kind>', methods=['POST'])
+@login_required
+def request_ai_job(document_id, kind):
+    if kind not in ai_jobs.KINDS:
+        abort(404)
+    document = _get_member_document(document_id)
+    try:
+        job = ai_jobs.enqueue(current_user.id, kind, document)
+    except ai_jobs.QueueFullError:
+        return jsonify(error='too many AI jobs pending, try again shortly'), 429
+    data = dict(job.to_dict(),
+                status_url=url_for('ai_job_status', job_id=job.id),
+                stream_url=url_for('ai_job_stream', job_id=job.id))
+    return jsonify(data), 200 if job.finished else 202
+
+def _get_own_job(job_id):
+    job = db.session.get(AiJob, job_id)
+    if job is None or job.user_id != current_user.id:
+        abort(404)
+    return job
+
+@app.route('/ai/jobs/<int:job_id>')
+@login_required
+def ai_job_status(job_id):
+    """Poll for a result; Retry-After says when to ask again."""
+    job = _get_own_job(job_id)
+    response = jsonify(job.to_dict())
+    if not job.finished:
+        response.headers['Retry-After'] = '2'
+    return response
+
+@app.route('/ai/jobs/<int:job_id>/stream')
+@login_required
+def ai_job_stream(job_id):
+    """SSE alternative to polling: one 'job' event when the job finishes."""
+    _get_own_job(job_id)
+    subscription = live.hub.subscribe(f'ai_job:{job_id}')
+    return Response(stream_with_context(ai_jobs.job_events(job_id, subscription)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# ─── Search ──────────────────────────────────────────────────────────────────
+@app.route('/search')
+@login_required
+@read_only
+def search_results():
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind', 'posts')
+    if kind not in search.KINDS:
+        kind = 'posts'
+    results = search.search(current_user.id, query, kind=kind,
+                            page=request.args.get('page', 1, type=int))
+    return render_template('search.html', query=query, kind=kind, results=results)
+
+# ─── Static vendor bundles (assets.py) ───────────────────────────────────────
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    return assets.serve(filename)
+
+# CKEditor test page (minimal). ?document=<id> joins that document's live session.
 @app.route('/test-editor', methods=['GET', 'POST'])
 def test_editor():
     if request.method == 'POST':
         content = request.form.get('editor_content', '')
-        # Later: save to a Document row
-        return f"<h1>Saved content:</h1><div>{content}</div>"
-    
-    return render_template('test_editor.html')
+        return render_template('test_editor.html', saved=sanitize.clean_html(content))
+
+    document = None
+    document_id = request.args.get('document', type=int)
+    if document_id is not None:
+        if not current_user.is_authenticated:
+            return login_manager.unauthorized()
+        document = _get_member_document(document_id)
+    return render_template('test_editor.html', document=document)
 
 @app.route('/workspace/<int:workspace_id>')
 @login_required
@@ -337,28 +705,54 @@ def workspace_dashboard(workspace_id):
     if not workspace.is_private_workspace:
         abort(404)
 
-    membership = GroupMembership.query.filter_by(
-        user_id=current_user.id, thread_id=workspace.id
-    ).first()
-    if not membership:
+    if not memberships.is_member(workspace.id):
         abort(403)
 
-    sub_threads = Thread.query.filter_by(parent_thread_id=workspace.id).all()
+    # Sub-threads and documents bump workspace.changed_at (models.py change markers);
+    # reading a sub-thread moves the viewer's read marker (unread badges)
+    etag = conditional.make_etag('workspace', workspace.id, workspace.changed_at, conditional.viewer_key(),
+                                 activity.read_marker_time(current_user.id, workspace.id))
+    not_modified = conditional.check(etag, workspace.changed_at)
+    if not_modified:
+        return not_modified
+
+    # Every thread below the workspace, any depth, with post/unread counts: one query
+    sub_threads = list(hierarchy.tree(workspace.id, current_user.id).walk())[1:]
     documents = Document.query.filter_by(thread_id=workspace.id).order_by(Document.title).all()
 
-    return render_template('workspace_dashboard.html',
-                           workspace=workspace,
-                           sub_threads=sub_threads,
-                           documents=documents)
+    return conditional.stamp(render_template('workspace_dashboard.html',
+                                             workspace=workspace,
+                                             sub_threads=sub_threads,
+                                             documents=documents),
+                             etag, workspace.changed_at)
+
+@app.route('/workspace/<int:workspace_id>/export.<fmt>')
+@login_required
+@read_only
+def export_workspace(workspace_id, fmt):
+    """The whole book (chapter_text documents by chapter_num), streamed."""
+    workspace = Thread.query.get_or_404(workspace_id)
+    if not workspace.is_private_workspace or fmt not in export.FORMATS:
+        abort(404)
+    if not memberships.is_member(workspace.id):
+        abort(403)
+
+    key, stream = export.export_book(workspace, fmt)
+    etag = conditional.make_etag('export', key)
+    not_modified = conditional.check(etag)
+    if not_modified:
+        return not_modified
+    extension, mimetype = export.FORMATS[fmt]
+    filename = secure_filename(workspace.title) or f'workspace-{workspace.id}'
+    response = Response(stream_with_context(stream), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename="{filename}.{extension}"'})
+    return conditional.stamp(response, etag)
 
 @app.route('/my-workspaces')
 @login_required
 def my_workspaces():
-    workspaces = Thread.query.join(GroupMembership).filter(
-        GroupMembership.user_id == current_user.id,
-        Thread.is_private_workspace == True,
-        Thread.status == 'active'
-    ).order_by(Thread.created_at.desc()).all()
+    # One query: memberships → threads → thread_activity → read markers (activity.py)
+    workspaces = activity.workspace_summaries(current_user.id)
     return render_template('my_workspaces.html', workspaces=workspaces)
 
 # ─── Create tables & run ─────────────────────────────────────────────────────
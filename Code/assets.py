@@ -0,0 +1,189 @@
+# assets.py
+# Vendor bundles (CKEditor, …) copied out of node_modules with content-hashed
+# names and precompressed, so browsers cache them for a year and never
+# download the same bytes twice.
+#
+#   npm install && flask build-assets
+#       node_modules/…/ckeditor.js ──▶ ASSETS_BUILD_DIR/ckeditor.3f2a9c1d0e7b.js
+#                                                     ckeditor.3f2a9c1d0e7b.js.br   (brotli, if installed)
+#                                                     ckeditor.3f2a9c1d0e7b.js.gz
+#                                                     manifest.json
+#
+# Templates link them with {{ asset_url('ckeditor.js') }}. /assets/<file> picks
+# the smallest variant the browser accepts (Accept-Encoding) and marks hashed
+# files immutable. Before the first build, asset_url falls back to the
+# unhashed name, served straight from node_modules without caching.
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+import click
+from flask import abort, current_app, request, send_file, url_for
+from flask.sessions import SecureCookieSessionInterface
+
+try:
+    import brotli
+except ImportError:   # optional: without it only .gz variants are built
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+# logical name → file under ASSETS_SOURCE_DIR
+ASSETS = {
+    'ckeditor.js': 'node_modules/@ckeditor/ckeditor5-build-classic/build/ckeditor.js',
+}
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))   # preferred first when the client rates them equally
+MANIFEST = 'manifest.json'
+
+_manifest = {}   # logical name → {'file': hashed name, 'encodings': [...]}
+
+
+def hashed_name(name, data):
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def _write(path, data):
+    tmp = f'{path}.tmp-{uuid.uuid4().hex}'
+    with open(tmp, 'wb') as out:
+        out.write(data)
+    os.replace(tmp, path)
+
+
+def _compress(encoding, data):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11) if brotli is not None else None
+    return gzip.compress(data, compresslevel=9, mtime=0)   # mtime=0: same bytes on every build
+
+
+def build(source_dir, build_dir, clean=False):
+    """Fingerprint and precompress every asset; returns the new manifest.
+
+    Files from earlier builds stay (pages already served may still link them)
+    unless clean is set. Missing sources are skipped with a warning.
+    """
+    os.makedirs(build_dir, exist_ok=True)
+    manifest = {}
+    for name, source in ASSETS.items():
+        path = os.path.join(source_dir, source)
+        if not os.path.exists(path):
+            log.warning('asset %s: %s not found (run npm install)', name, path)
+            continue
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        filename = hashed_name(name, data)
+        target = os.path.join(build_dir, filename)
+        if not os.path.exists(target):
+            _write(target, data)
+        entry = {'file': filename, 'size': len(data), 'encodings': []}
+        for encoding, suffix in ENCODINGS:
+            if not os.path.exists(target + suffix):
+                compressed = _compress(encoding, data)
+                if compressed is None or len(compressed) >= len(data):
+                    continue
+                _write(target + suffix, compressed)
+            entry['encodings'].append(encoding)
+        manifest[name] = entry
+    _write(os.path.join(build_dir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+
+    if clean:
+        keep = {MANIFEST}
+        for entry in manifest.values():
+            keep.add(entry['file'])
+            keep.update(entry['file'] + suffix for _, suffix in ENCODINGS)
+        for filename in os.listdir(build_dir):
+            if filename not in keep:
+                os.remove(os.path.join(build_dir, filename))
+    return manifest
+
+
+def load_manifest(build_dir):
+    global _manifest
+    try:
+        with open(os.path.join(build_dir, MANIFEST), encoding='utf-8') as fh:
+            _manifest = json.load(fh)
+    except FileNotFoundError:
+        _manifest = {}
+    return _manifest
+
+
+def asset_url(name):
+    """URL of an asset by logical name: the hashed file once built, else the dev fallback."""
+    entry = _manifest.get(name)
+    return url_for('asset', filename=entry['file'] if entry else name)
+
+
+# ─── Serving ─────────────────────────────────────────────────────────
+def _choose_encoding(available):
+    best, best_quality = None, 0
+    for encoding, _ in ENCODINGS:
+        if encoding in available:
+            quality = request.accept_encodings.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+    if best is not None and request.accept_encodings.quality('identity') > best_quality:
+        return None   # the client explicitly prefers it uncompressed
+    return best
+
+
+def serve(filename):
+    """Response for /assets/<filename>: a hashed build file, or (unbuilt) the raw source."""
+    config = current_app.config
+    entry = next((e for e in _manifest.values() if e['file'] == filename), None)
+    if entry is None:
+        if filename not in ASSETS:
+            abort(404)
+        path = os.path.join(config['ASSETS_SOURCE_DIR'], ASSETS[filename])
+        if not os.path.exists(path):
+            abort(404)
+        response = send_file(path, conditional=True, max_age=0)
+        response.cache_control.no_cache = True
+        return response
+
+    path = os.path.join(config['ASSETS_BUILD_DIR'], filename)
+    encoding = _choose_encoding(entry['encodings'])
+    suffix = dict(ENCODINGS)[encoding] if encoding else ''
+    if not os.path.exists(path + suffix):
+        abort(404)
+    response = send_file(path + suffix, download_name=filename, conditional=True, etag=True,
+                         max_age=config.get('ASSETS_MAX_AGE', 365 * 24 * 3600))
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+class SessionInterface(SecureCookieSessionInterface):
+    """Leave /assets responses alone: Flask-Login reads the session after every
+    request, which would add Vary: Cookie and keep shared caches from storing them."""
+
+    def save_session(self, app, session, response):
+        if request.endpoint != 'asset':
+            super().save_session(app, session, response)
+
+
+def init_app(app):
+    load_manifest(app.config['ASSETS_BUILD_DIR'])
+    app.session_interface = SessionInterface()
+    app.jinja_env.globals['asset_url'] = asset_url
+
+    @app.cli.command('build-assets')
+    @click.option('--clean', is_flag=True, help='remove files from earlier builds')
+    def build_assets_command(clean):
+        """Copy vendor bundles into ASSETS_BUILD_DIR with hashed names and .br/.gz variants."""
+        if brotli is None:
+            click.echo('brotli is not installed: building gzip variants only.')
+        manifest = build(app.config['ASSETS_SOURCE_DIR'], app.config['ASSETS_BUILD_DIR'], clean=clean)
+        load_manifest(app.config['ASSETS_BUILD_DIR'])
+        for name, entry in sorted(manifest.items()):
+            click.echo(f"{name} → {entry['file']} ({', '.join(entry['encodings']) or 'uncompressed'})")
+        missing = sorted(set(ASSETS) - set(manifest))
+        if missing:
+            click.echo(f"Not found (run npm install): {', '.join(missing)}")
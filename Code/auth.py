@@ -0,0 +1,378 @@
+# auth.py
+# Keeps logins and registrations from taking the site down with them.
+#
+# Password hashes (scrypt) cost ~100 ms of CPU each. Computed in the request
+# thread, a burst of login attempts (credential stuffing, a registration spike)
+# occupies every worker and every core, and all other pages wait behind it.
+#
+#   POST /login ──▶ throttles ──▶ hash pool ──▶ last_login buffer
+#                   (429)         (503)         (one UPDATE per LAST_LOGIN_FLUSH_SECONDS)
+#
+#   - throttles: sliding-window counters per username + client address (all
+#     attempts) and per username (failures only), checked before any hashing;
+#   - hash pool: at most PASSWORD_HASH_WORKERS hashes run at once and at most
+#     PASSWORD_HASH_QUEUE wait; anything beyond that is turned away at once
+#     instead of queueing behind the flood;
+#   - last_login: recorded in memory and written in one batched UPDATE, so a
+#     login is no longer a database write.
+#
+# Throttle counters live in this process by default. With several worker
+# processes, LOGIN_THROTTLE_BACKEND = 'redis' shares them (or plug in any
+# object with hit/peek/reset, see MemoryBackend).
+#
+# The client address is request.remote_addr. Behind reverse proxies that is the
+# proxy's, and every client would share one bucket: set PROXY_FIX_HOPS to the
+# number of proxies in front of the app and it is taken from X-Forwarded-For
+# (werkzeug's ProxyFix). Never set it higher than the proxies you run, or
+# clients can pick their own address with a forged header.
+
+import atexit
+import concurrent.futures
+import importlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from extensions import db
+from models import User
+
+try:
+    import redis
+except ImportError:   # optional: only needed for LOGIN_THROTTLE_BACKEND = 'redis'
+    redis = None
+
+log = logging.getLogger(__name__)
+
+
+class Throttled(Exception):
+    """Too many attempts from this address or against this account."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'throttled, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    """Every hash worker is busy and the queue is full (or the wait timed out)."""
+
+
+# ─── Hash pool ───────────────────────────────────────────────────────
+class HashPool:
+    """Runs password hashing on a few threads with a bounded queue.
+
+    hashlib releases the GIL while it hashes, so the pool caps how many cores
+    hashing can take; the request threads just wait for their result.
+    """
+
+    def __init__(self):
+        self.workers = 0
+        self.queue_size = 0
+        self.timeout = None
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def configure(self, workers, queue_size=0, timeout=None):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self.workers, self.queue_size, self.timeout = workers, queue_size, timeout
+            self._executor = None
+            self._slots = threading.BoundedSemaphore(workers + queue_size) if workers else None
+
+    def _get_executor(self):
+        with self._lock:   # created on first use, so forked workers each get their own threads
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(self.workers, 'password-hash')
+            return self._executor
+
+    def run(self, fn, *args):
+        """fn(*args) on a hash worker. Raises Overloaded rather than queue past the limit."""
+        if not self.workers:
+            return fn(*args)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self.rejected += 1
+            raise Overloaded()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())   # also runs when cancelled
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self.rejected += 1
+            raise Overloaded() from None
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+pool = HashPool()
+_dummy_hash = None
+
+
+def hash_password(password):
+    """A new password hash, computed on the hash pool."""
+    return pool.run(generate_password_hash, password)
+
+
+def verify_password(user, password):
+    """Check a password on the hash pool. user may be None: a dummy hash is
+    checked anyway, so unknown usernames take as long as wrong passwords."""
+    global _dummy_hash
+    if user is None:
+        if _dummy_hash is None:
+            _dummy_hash = pool.run(generate_password_hash, 'not a real password')
+        pool.run(check_password_hash, _dummy_hash, password or '')
+        return False
+    return pool.run(check_password_hash, user.password_hash, password or '')
+
+
+# ─── Throttles ───────────────────────────────────────────────────────
+def _estimate(current, previous, now, window):
+    """Sliding-window count: this fixed window's hits plus the previous window's,
+    weighted by how much of it the sliding window still covers."""
+    elapsed = (now % window) / window
+    return current + previous * (1 - elapsed)
+
+
+class MemoryBackend:
+    """Sliding-window counters in this process: two counts per key, not a
+    timestamp per attempt. Keys idle for two windows are pruned as it goes."""
+
+    PRUNE_EVERY = 1024
+
+    def __init__(self):
+        self._counts = {}   # key → [window, window index, count in it, count in the one before]
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def _entry(self, key, window, now):
+        index = int(now // window)
+        entry = self._counts.get(key)
+        if entry is None or entry[1] < index - 1:
+            return [window, index, 0, 0]
+        if entry[1] == index - 1:
+            return [window, index, 0, entry[2]]
+        return entry
+
+    def hit(self, key, window, now=None):
+        """Count one attempt; returns the sliding-window count including it."""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._counts[key] = self._entry(key, window, now)
+            entry[2] += 1
+            self._hits += 1
+            if self._hits % self.PRUNE_EVERY == 0:
+                self._prune(now)
+            return _estimate(entry[2], entry[3], now, window)
+
+    def peek(self, key, window, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entry(key, window, now)
+        return _estimate(entry[2], entry[3], now, window)
+
+    def reset(self, key, window):
+        with self._lock:
+            self._counts.pop(key, None)
+
+    def _prune(self, now):
+        stale = [key for key, (window, index, _, _) in self._counts.items() if int(now // window) - index > 1]
+        for key in stale:
+            del self._counts[key]
+
+    def __len__(self):
+        return len(self._counts)
+
+
+class RedisBackend:
+    """The same counters in Redis, shared by every worker process: one key per
+    (key, fixed window), expiring after two windows."""
+
+    PREFIX = 'plotforge:throttle:'
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("LOGIN_THROTTLE_BACKEND = 'redis' needs the redis package (pip install redis)")
+        self._redis = redis.Redis.from_url(url)
+
+    def _keys(self, key, window, now):
+        index = int(now // window)
+        return f'{self.PREFIX}{key}:{window}:{index}', f'{self.PREFIX}{key}:{window}:{index - 1}'
+
+    def hit(self, key, window, now=None):
+        now = time.time() if now is None else now
+        current_key, previous_key = self._keys(key, window, now)
+        pipe = self._redis.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, window * 2)
+        pipe.get(previous_key)
+        current, _, previous = pipe.execute()
+        return _estimate(current, int(previous or 0), now, window)
+
+    def peek(self, key, window, now=None):
+        now = time.time() if now is None else now
+        current, previous = self._redis.mget(self._keys(key, window, now))
+        return _estimate(int(current or 0), int(previous or 0), now, window)
+
+    def reset(self, key, window):
+        self._redis.delete(*self._keys(key, window, time.time()))
+
+
+BACKENDS = {'memory': lambda config: MemoryBackend(),
+            'redis': lambda config: RedisBackend(config['LOGIN_THROTTLE_REDIS_URL'])}
+
+
+def load_backend(config):
+    spec = config.get('LOGIN_THROTTLE_BACKEND', 'memory')
+    if spec in BACKENDS:
+        return BACKENDS[spec](config)
+    module_name, _, class_name = spec.partition(':')
+    if not class_name:
+        raise ValueError(f"LOGIN_THROTTLE_BACKEND must be one of {sorted(BACKENDS)} or 'module:Class', "
+                         f"got {spec!r}")
+    return getattr(importlib.import_module(module_name), class_name)(config)
+
+
+backend = MemoryBackend()
+
+
+def _retry_after(window):
+    return max(1, math.ceil(window - time.time() % window))
+
+
+def _check(key, limit, window, count=True):
+    """Raise Throttled if key is at its limit; with count, this attempt counts too."""
+    if not limit:
+        return
+    used = backend.hit(key, window) if count else backend.peek(key, window)
+    if used > limit:
+        raise Throttled(_retry_after(window))
+
+
+def _account(username):
+    return (username or '').strip().lower()
+
+
+def _account_key(username):
+    return f'account:{_account(username)}'
+
+
+# ─── Login / registration ────────────────────────────────────────────
+def authenticate(username, password, address):
+    """The user if username/password are right, else None.
+
+    Raises Throttled before anything is hashed when this address has tried the
+    account too often or the account has had too many failures, and Overloaded
+    when the hash pool is full.
+    """
+    config = current_app.config
+    _check(f'ip:{address}:{_account(username)}', config['LOGIN_IP_LIMIT'], config['LOGIN_IP_WINDOW'])
+    account_key, account_window = _account_key(username), config['LOGIN_ACCOUNT_WINDOW']
+    if config['LOGIN_ACCOUNT_LIMIT'] and backend.peek(account_key, account_window) >= config['LOGIN_ACCOUNT_LIMIT']:
+        raise Throttled(_retry_after(account_window))
+
+    user = User.query.filter_by(username=username).first()
+    if verify_password(user, password):
+        backend.reset(account_key, account_window)
+        return user
+    if config['LOGIN_ACCOUNT_LIMIT']:
+        backend.hit(account_key, account_window)
+    return None
+
+
+def check_registration(address):
+    """Count a registration attempt from address; raises Throttled over REGISTER_IP_LIMIT."""
+    config = current_app.config
+    _check(f'register:{address}', config['REGISTER_IP_LIMIT'], config['REGISTER_IP_WINDOW'])
+
+
+# ─── Batched last_login ──────────────────────────────────────────────
+class LastLoginBuffer:
+    """users.last_login, collected in memory and written in one UPDATE per interval."""
+
+    def __init__(self):
+        self.app = None
+        self.interval = 0
+        self._pending = {}   # user id → datetime
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def record(self, user_id, when=None):
+        with self._lock:
+            self._pending[user_id] = when or datetime.utcnow()
+        if not self.interval:
+            self.flush()
+        elif self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='last-login', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                log.exception('last_login flush failed; will retry')
+
+    def flush(self):
+        """Write what's pending; returns how many users were updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            with self.app.app_context():
+                db.session.execute(db.update(User), [{'id': user_id, 'last_login': when}
+                                                     for user_id, when in pending.items()])
+                db.session.commit()
+        except Exception:
+            with self._lock:   # put them back unless a newer login came in meanwhile
+                for user_id, when in pending.items():
+                    self._pending.setdefault(user_id, when)
+            raise
+        return len(pending)
+
+    def shutdown(self):
+        try:
+            self.flush()
+        except Exception:
+            log.exception('could not save pending last_login times at shutdown')
+
+
+last_logins = LastLoginBuffer()
+
+
+def trust_proxies(app, hops):
+    """Take the client address from the X-Forwarded-For entries of `hops` proxies."""
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops)
+
+
+def init_app(app):
+    global backend
+    config = app.config
+    trust_proxies(app, config.get('PROXY_FIX_HOPS', 0))
+    pool.configure(config.get('PASSWORD_HASH_WORKERS', 2), config.get('PASSWORD_HASH_QUEUE', 8),
+                   config.get('PASSWORD_HASH_TIMEOUT'))
+    backend = load_backend(config)
+    last_logins.app = app
+    last_logins.interval = config.get('LAST_LOGIN_FLUSH_SECONDS', 30)
+    atexit.register(last_logins.shutdown)   # don't lose the last interval's logins on a clean shutdown
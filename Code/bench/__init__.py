@@ -0,0 +1,3 @@
+# bench/
+# Benchmarks for PlotForge. Run from the Code/ directory, e.g.
+#   python -m bench.db_concurrency
@@ -0,0 +1,171 @@
+# bench/datagen.py
+# Seeded synthetic data for benchmarks: users, proposals + workspaces (built by
+# provisioning.py from the default template), memberships, posts and some
+# multi-megabyte chapter documents. Same seed → same data.
+#
+# Writes to whatever database the app is configured for, so point it at a
+# scratch file first:
+#   DATABASE_URL=sqlite:////tmp/plotforge-bench.db python -m bench.datagen --users 500 --workspaces 200
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, update
+from werkzeug.security import generate_password_hash
+
+from extensions import db
+from models import User, Thread, Post, Document, GroupMembership, ListBoundaryOption
+import activity
+import provisioning
+
+PASSWORD = 'bench-password'   # every generated user can log in with this
+
+WORDS = ('the ember dragon river crown shadow whisper storm quiet lantern forest oath '
+         'ancient silver broken mountain voice letter harbor winter secret blade song '
+         'market tower stranger promise ruin garden child iron mirror bridge').split()
+
+
+def _sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def _paragraph(rng):
+    return '<p>' + ' '.join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(3, 7))) + '</p>'
+
+
+def chapter_text(rng, size_bytes):
+    """HTML prose of roughly size_bytes."""
+    parts, total = [], 0
+    while total < size_bytes:
+        paragraph = _paragraph(rng)
+        parts.append(paragraph)
+        total += len(paragraph) + 1
+    return '\n'.join(parts)
+
+
+def generate(users=100, workspaces=50, members_per_workspace=4, posts_per_thread=40,
+             big_chapters=5, chapter_kb=2048, seed=42, batch_size=500, log=print):
+    """Fill the current app's database. Needs an app context. Returns a summary dict."""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    base_time = datetime(2025, 1, 1)
+
+    # ─── Users (one shared hash – hashing N passwords would dominate the run) ──
+    password_hash = generate_password_hash(PASSWORD)
+    first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    db.session.execute(insert(User), [
+        {'username': f'bench_user_{seed}_{n}', 'email': f'bench_{seed}_{n}@example.com',
+         'password_hash': password_hash, 'created_at': base_time, 'membership_version': 0}
+        for n in range(users)])
+    db.session.commit()
+    user_ids = list(range(first_user, first_user + users))
+    log(f'users: {users}')
+
+    # ─── Proposals + workspaces through the real provisioning service ───────
+    options = {name: [o.id for o in ListBoundaryOption.query.filter(getattr(ListBoundaryOption, f'for_{name}'))]
+               for name in ('genre', 'political', 'violence', 'sex', 'style', 'audience')}
+    specs = []
+    for n in range(workspaces):
+        boundary_ids = {f'{name}_id': rng.choice(ids) for name, ids in options.items() if ids and rng.random() < 0.7}
+        specs.append({'leader_id': rng.choice(user_ids), 'title': f'{_sentence(rng, 4)[:-1]} #{n}',
+                      'description': _paragraph(rng), 'max_members': rng.randint(4, 15),
+                      'boundary_ids': boundary_ids})
+    results = provisioning.provision_many(specs, batch_size=100)
+    log(f'workspaces: {len(results)}')
+
+    # ─── Memberships (workspace + its recruitment thread) ───────────────────
+    membership_rows = []
+    for result in results:
+        leader = result.workspace.leader_id
+        capacity = min(members_per_workspace, result.workspace.max_members - 1)
+        joined = rng.sample([u for u in user_ids if u != leader], min(capacity, len(user_ids) - 1))
+        for user_id in joined:
+            for thread in (result.workspace, result.recruitment):
+                membership_rows.append({'user_id': user_id, 'thread_id': thread.id, 'role': 'member',
+                                        'joined_at': base_time})
+        for thread in (result.workspace, result.recruitment):
+            db.session.execute(update(Thread).where(Thread.id == thread.id)
+                               .values(member_count=len(joined) + 1))
+    for start in range(0, len(membership_rows), batch_size):
+        db.session.execute(insert(GroupMembership), membership_rows[start:start + batch_size])
+    db.session.commit()
+    log(f'memberships: {len(membership_rows)}')
+
+    # ─── Posts in recruitment threads and workspace sub-threads ─────────────
+    workspace_ids = [r.workspace.id for r in results]
+    sub_threads = (Thread.query.with_entities(Thread.id, Thread.parent_thread_id)
+                   .filter(Thread.parent_thread_id.in_(workspace_ids)).all()) if workspace_ids else []
+    members = {}
+    for row in membership_rows:
+        members.setdefault(row['thread_id'], []).append(row['user_id'])
+    targets = [(r.recruitment.id, r.recruitment.id) for r in results] + \
+              [(thread_id, parent_id) for thread_id, parent_id in sub_threads]
+    leaders = {r.workspace.id: r.workspace.leader_id for r in results}
+    leaders.update({r.recruitment.id: r.recruitment.leader_id for r in results})
+
+    post_rows, post_count = [], 0
+    for thread_id, owner_id in targets:
+        authors = members.get(owner_id, []) + [leaders[owner_id]]
+        when = base_time
+        for _ in range(posts_per_thread):
+            when += timedelta(seconds=rng.randint(5, 3600))
+            post_rows.append({'thread_id': thread_id, 'user_id': rng.choice(authors),
+                              'content': _paragraph(rng), 'created_at': when})
+            if len(post_rows) >= batch_size:
+                db.session.execute(insert(Post), post_rows)
+                post_count += len(post_rows)
+                post_rows = []
+    if post_rows:
+        db.session.execute(insert(Post), post_rows)
+        post_count += len(post_rows)
+    db.session.commit()
+    log(f'posts: {post_count}')
+    activity.rebuild()   # bulk inserts skip the thread_activity mapper events
+
+    # ─── Multi-megabyte chapter documents ───────────────────────────────────
+    chapters = (Document.query.filter(Document.thread_id.in_(workspace_ids), Document.type == 'chapter_text')
+                .limit(big_chapters).all()) if workspace_ids else []
+    for document in chapters:
+        document.content = chapter_text(rng, chapter_kb * 1024)
+    db.session.commit()
+    log(f'big chapters: {len(chapters)} x {chapter_kb} KiB')
+
+    return {
+        'seed': seed,
+        'user_ids': user_ids,
+        'usernames': [f'bench_user_{seed}_{n}' for n in range(users)],
+        'workspace_ids': workspace_ids,
+        'recruitment_ids': [r.recruitment.id for r in results],
+        'sub_thread_ids': [thread_id for thread_id, _ in sub_threads],
+        'posts': post_count,
+        'big_chapter_ids': [d.id for d in chapters],
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill the configured database with seeded synthetic data.')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--workspaces', type=int, default=50)
+    parser.add_argument('--members-per-workspace', type=int, default=4)
+    parser.add_argument('--posts-per-thread', type=int, default=40)
+    parser.add_argument('--big-chapters', type=int, default=5)
+    parser.add_argument('--chapter-kb', type=int, default=2048)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        db.create_all()
+        summary = generate(users=args.users, workspaces=args.workspaces,
+                           members_per_workspace=args.members_per_workspace,
+                           posts_per_thread=args.posts_per_thread, big_chapters=args.big_chapters,
+                           chapter_kb=args.chapter_kb, seed=args.seed)
+    print(f"done in {summary['seconds']:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# bench/db_concurrency.py
+# Concurrent posting against a scratch SQLite file, once with the old engine
+# setup (driver defaults: rollback journal, synchronous=FULL, no pool sizing)
+# and once with the profile from database.py/config.py. Reports throughput,
+# read latency and "database is locked" error rates for each.
+#
+#   python -m bench.db_concurrency --writers 8 --readers 16 --seconds 10 [--json out.json]
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+
+import database
+from config import DefaultConfig
+from extensions import db
+from models import User, Thread, Post
+
+THREADS = 20   # threads the posts are spread over
+
+
+def _config(**overrides):
+    config = {k: v for k, v in vars(DefaultConfig).items() if k.isupper()}
+    config.update(overrides)
+    return config
+
+
+def make_engine(path, profile, busy_timeout):
+    url = f'sqlite:///{path}'
+    if profile == 'before':
+        # What the app used to get: driver defaults, no pragmas
+        return create_engine(url, connect_args={'timeout': busy_timeout / 1000})
+    config = _config(SQLITE_BUSY_TIMEOUT=busy_timeout)
+    engine = create_engine(url, **database.engine_options(config, url))
+    database.install_sqlite_pragmas(engine, config)
+    return engine
+
+
+def seed(engine):
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [{'username': 'bench', 'email': 'bench@example.com',
+                                               'password_hash': 'x', 'membership_version': 0}])
+        conn.execute(insert(Thread.__table__), [{'title': f'Thread {n}', 'leader_id': 1,
+                                                 'is_private_workspace': False, 'member_count': 0}
+                                                for n in range(THREADS)])
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(profile, writers, readers, seconds, busy_timeout):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    engine = make_engine(path, profile, busy_timeout)
+    try:
+        seed(engine)
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {'writes': 0, 'reads': 0, 'write_errors': 0, 'read_errors': 0, 'read_ms': []}
+        posts = Post.__table__
+
+        def writer(n):
+            i = 0
+            while not stop.is_set():
+                i += 1
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(insert(posts).values(
+                            thread_id=(n + i) % THREADS + 1, user_id=1,
+                            content=f'<p>post {n}-{i} ' + 'lorem ipsum ' * 20 + '</p>',
+                            created_at=datetime.utcnow()))
+                    key = 'writes'
+                except OperationalError:
+                    key = 'write_errors'
+                with lock:
+                    stats[key] += 1
+
+        def reader(n):
+            i = 0
+            while not stop.is_set():
+                i += 1
+                started = time.perf_counter()
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(select(posts)
+                                     .where(posts.c.thread_id == (n + i) % THREADS + 1)
+                                     .order_by(posts.c.created_at.desc(), posts.c.id.desc())
+                                     .limit(30)).all()
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        stats['reads'] += 1
+                        stats['read_ms'].append(elapsed)
+                except OperationalError:
+                    with lock:
+                        stats['read_errors'] += 1
+
+        workers = ([threading.Thread(target=writer, args=(n,)) for n in range(writers)] +
+                   [threading.Thread(target=reader, args=(n,)) for n in range(readers)])
+        for w in workers:
+            w.start()
+        time.sleep(seconds)
+        stop.set()
+        for w in workers:
+            w.join()
+    finally:
+        engine.dispose()
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    attempts_w = stats['writes'] + stats['write_errors']
+    attempts_r = stats['reads'] + stats['read_errors']
+    return {
+        'profile': profile,
+        'writes_per_s': stats['writes'] / seconds,
+        'reads_per_s': stats['reads'] / seconds,
+        'write_lock_error_rate': stats['write_errors'] / attempts_w if attempts_w else 0.0,
+        'read_lock_error_rate': stats['read_errors'] / attempts_r if attempts_r else 0.0,
+        'read_p50_ms': _percentile(stats['read_ms'], 50),
+        'read_p95_ms': _percentile(stats['read_ms'], 95),
+        'read_p99_ms': _percentile(stats['read_ms'], 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite write/read contention: old engine setup vs. database.py profile.')
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--busy-timeout', type=int, default=100,
+                        help='ms; kept short so lock contention shows up as errors')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    results = [run(profile, args.writers, args.readers, args.seconds, args.busy_timeout)
+               for profile in ('before', 'after')]
+
+    print(f"{'profile':8} {'writes/s':>9} {'reads/s':>9} {'w-err%':>7} {'r-err%':>7} "
+          f"{'r-p50':>7} {'r-p95':>7} {'r-p99':>7}")
+    for r in results:
+        print(f"{r['profile']:8} {r['writes_per_s']:9.0f} {r['reads_per_s']:9.0f} "
+              f"{r['write_lock_error_rate'] * 100:7.2f} {r['read_lock_error_rate'] * 100:7.2f} "
+              f"{r['read_p50_ms']:7.2f} {r['read_p95_ms']:7.2f} {r['read_p99_ms']:7.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump({'benchmark': 'db_concurrency', 'args': vars(args), 'results': results}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# bench/deltas.py
+# make_delta (deltas.py) on chapter-sized documents: time and stored delta size
+# for a one-spot edit, edits spread over the whole text (the worst case: the
+# changed middle is the whole document), and a change at both ends (what a
+# sanitizer pass looks like). No database needed.
+#
+# --unbounded-words also runs the old, uncapped diff on documents up to that
+# many words, for comparison (it is superlinear: keep it small).
+#
+#   python -m bench.deltas
+#   python -m bench.deltas --words 1000,4000,16000 --unbounded-words 1000 --out deltas.json
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+
+import deltas
+from bench.load import _git_commit, _percentile
+
+WORDS = ('the ember dragon river crown shadow whisper storm quiet lantern forest oath '
+         'ancient silver broken mountain voice letter harbor winter secret blade song').split()
+
+
+def _document(rng, words):
+    paragraphs, left = [], words
+    while left > 0:
+        n = min(left, rng.randint(40, 120))
+        paragraphs.append('<p>' + ' '.join(rng.choice(WORDS) for _ in range(n)) + '</p>')
+        left -= n
+    return ''.join(paragraphs)
+
+
+def _edits(rng, text):
+    """(scenario, new text) pairs for one document."""
+    middle = len(text) // 2
+    spread = text.split(' ')
+    for i in range(0, len(spread), 50):
+        if '<' not in spread[i]:
+            spread[i] = rng.choice(WORDS).upper()
+    return [
+        ('one_spot', text[:middle] + ' a freshly typed sentence.' + text[middle:]),
+        ('spread', ' '.join(spread)),
+        ('both_ends', '<p>Prologue.</p>' + text + '<p>The end.</p>'),
+    ]
+
+
+def _time(old, new, repeats):
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        ops = deltas.make_delta(old, new)
+        latencies.append((time.perf_counter() - started) * 1000)
+    assert deltas.apply_delta(old, ops) == new
+    return {'p50_ms': _percentile(latencies, 50), 'max_ms': max(latencies),
+            'delta_bytes': len(deltas.pack_delta(ops)), 'snapshot_bytes': len(deltas.pack_text(new))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='make_delta time and delta size on large documents.')
+    parser.add_argument('--words', default='1000,2000,4000,8000', help='document sizes, comma separated')
+    parser.add_argument('--unbounded-words', type=int, default=0,
+                        help='also time the uncapped diff on documents up to this many words')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='bench_results_deltas.json')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cap = deltas.MAX_DIFF_WORK
+    results = {}
+    for words in (int(w) for w in args.words.split(',')):
+        text = _document(rng, words)
+        for scenario, new in _edits(rng, text):
+            key = f'{scenario}_{words}'
+            results[key] = {'words': words, 'scenario': scenario,
+                            'bounded': _time(text, new, args.repeats)}
+            if words <= args.unbounded_words:
+                deltas.MAX_DIFF_WORK = float('inf')
+                try:
+                    results[key]['unbounded'] = _time(text, new, 1)
+                finally:
+                    deltas.MAX_DIFF_WORK = cap
+
+    for key, r in results.items():
+        b = r['bounded']
+        line = (f"{r['scenario']:10} {r['words']:6d} words  p50 {b['p50_ms']:8.2f}  max {b['max_ms']:8.2f} ms"
+                f"  delta {b['delta_bytes']:7d} B (snapshot {b['snapshot_bytes']:7d} B)")
+        if 'unbounded' in r:
+            u = r['unbounded']
+            line += f"   | uncapped {u['max_ms']:9.2f} ms, delta {u['delta_bytes']:7d} B"
+        print(line)
+
+    with open(args.out, 'w') as fh:
+        json.dump({'benchmark': 'deltas', 'commit': _git_commit(),
+                   'timestamp': datetime.utcnow().isoformat(), 'args': vars(args),
+                   'max_diff_work': cap, 'results': results}, fh, indent=2)
+    print(f'results written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
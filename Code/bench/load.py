@@ -0,0 +1,206 @@
+# bench/load.py
+# Per-route load benchmark. Drives the hot routes through the Flask test client
+# with concurrent workers (each logged in as a different generated user) and
+# records throughput, latency percentiles, SQL queries and response size per
+# route. Results go to a JSON file tagged with the git commit, so runs can be
+# diffed across commits.
+#
+#   python -m bench.load                               # scratch DB, default data size
+#   python -m bench.load --workers 8 --seconds 10 --workspaces 500 --out before.json
+#   python -m bench.load --database /tmp/big.db --reuse   # keep/reuse generated data
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROUTES = ('proposals', 'thread_detail', 'workspace_dashboard', 'my_workspaces', 'post_in_thread')
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class QueryCounter:
+    """Counts SQL statements per thread (one request runs on one thread)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+def _targets(app):
+    """Users with at least one workspace, and what each of them can open."""
+    from extensions import db
+    from models import Thread, GroupMembership, User
+    from bench.datagen import PASSWORD
+
+    with app.app_context():
+        rows = (db.session.query(User.username, GroupMembership.thread_id)
+                .join(GroupMembership, GroupMembership.user_id == User.id)
+                .join(Thread, Thread.id == GroupMembership.thread_id)
+                .filter(Thread.is_private_workspace == True, User.username.like('bench_user_%'))
+                .all())
+        proposals = [t.id for t in Thread.query.with_entities(Thread.id)
+                     .filter(Thread.is_proposal == True, Thread.status == 'open').all()]
+    workspaces = {}
+    for username, thread_id in rows:
+        workspaces.setdefault(username, []).append(thread_id)
+    return [(u, PASSWORD, ws) for u, ws in workspaces.items()], proposals
+
+
+def _request(client, route, rng, workspaces, proposals):
+    if route == 'proposals':
+        return client.get('/proposals')
+    if route == 'thread_detail':
+        return client.get(f'/threads/{rng.choice(proposals)}')
+    if route == 'workspace_dashboard':
+        return client.get(f'/workspace/{rng.choice(workspaces)}')
+    if route == 'my_workspaces':
+        return client.get('/my-workspaces')
+    if route == 'post_in_thread':
+        return client.post(f'/threads/{rng.choice(proposals)}/post',
+                           data={'content': f'<p>load test reply {rng.random()}</p>'},
+                           headers={'Accept': 'application/json'})
+    raise ValueError(route)
+
+
+def run_route(app, counter, route, users, proposals, workers, seconds, seed):
+    stop = threading.Event()
+    lock = threading.Lock()
+    samples = []   # (ms, queries, bytes, ok)
+
+    def worker(n):
+        rng = random.Random(seed * 1000 + n)
+        username, password, workspaces = users[n % len(users)]
+        client = app.test_client()
+        client.post('/login', data={'username': username, 'password': password},
+                    environ_base={'REMOTE_ADDR': f'10.0.{n // 250}.{n % 250 + 1}'})   # under LOGIN_IP_LIMIT
+        local = []
+        while not stop.is_set():
+            counter.reset()
+            started = time.perf_counter()
+            response = _request(client, route, rng, workspaces, proposals)
+            body = response.get_data()
+            elapsed = (time.perf_counter() - started) * 1000
+            local.append((elapsed, counter.count, len(body), response.status_code < 400))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies = [s[0] for s in samples]
+    queries = [s[1] for s in samples]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if not s[3]),
+        'throughput_rps': len(samples) / seconds,
+        'p50_ms': _percentile(latencies, 50),
+        'p95_ms': _percentile(latencies, 95),
+        'p99_ms': _percentile(latencies, 99),
+        'queries_mean': sum(queries) / len(queries) if queries else 0.0,
+        'queries_max': max(queries, default=0),
+        'bytes_mean': sum(s[2] for s in samples) / len(samples) if samples else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-route load benchmark using the Flask test client.')
+    parser.add_argument('--database', help='SQLite file to use (default: a scratch file)')
+    parser.add_argument('--reuse', action='store_true', help='use the data already in --database')
+    parser.add_argument('--routes', default=','.join(ROUTES))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5, help='per route')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--workspaces', type=int, default=50)
+    parser.add_argument('--posts-per-thread', type=int, default=40)
+    parser.add_argument('--big-chapters', type=int, default=2)
+    parser.add_argument('--chapter-kb', type=int, default=1024)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='bench_results.json')
+    args = parser.parse_args()
+
+    path = args.database
+    scratch = path is None
+    if scratch:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(path)}'   # read by config.py on import
+
+    from app import app
+    from extensions import db
+    from bench.datagen import generate
+    import auth
+
+    try:
+        with app.app_context():
+            db.create_all()
+            if not args.reuse:
+                generate(users=args.users, workspaces=args.workspaces,
+                         posts_per_thread=args.posts_per_thread, big_chapters=args.big_chapters,
+                         chapter_kb=args.chapter_kb, seed=args.seed)
+            counter = QueryCounter(db.engine)
+
+        users, proposals = _targets(app)
+        if not users or not proposals:
+            parser.error('no generated data found (drop --reuse or run bench.datagen first)')
+
+        results = {}
+        for route in args.routes.split(','):
+            results[route] = run_route(app, counter, route, users, proposals,
+                                       args.workers, args.seconds, args.seed)
+            r = results[route]
+            print(f"{route:20} {r['throughput_rps']:8.1f} req/s  p50 {r['p50_ms']:7.2f}  "
+                  f"p95 {r['p95_ms']:7.2f}  p99 {r['p99_ms']:7.2f} ms  "
+                  f"{r['queries_mean']:5.1f} q/req  {r['errors']} errors")
+    finally:
+        auth.last_logins.flush()   # now, not at exit: a scratch database is gone by then
+        if scratch:
+            with app.app_context():
+                db.engine.dispose()
+            for suffix in ('', '-wal', '-shm', '-journal'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    with open(args.out, 'w') as fh:
+        json.dump({'benchmark': 'load', 'commit': _git_commit(),
+                   'timestamp': datetime.utcnow().isoformat(), 'args': vars(args),
+                   'routes': results}, fh, indent=2)
+    print(f'results written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+# bench/login_flood.py
+# Login flood (auth.py): how much the rest of the site slows down while
+# --flooders threads hammer POST /login with wrong passwords, half from one
+# address and half from a new address each time (the distributed kind the
+# per-address throttle can't see). Three phases of --seconds each:
+#
+#   baseline      readers only
+#   unprotected   flood with hashing in the request thread and no throttles (the old login)
+#   protected     flood with the hash pool and throttles from config
+#
+# Readers are --readers logged-in users browsing the usual pages; their latency
+# is what should stay put.
+#
+#   python -m bench.login_flood
+#   python -m bench.login_flood --readers 4 --flooders 16 --hash-workers 2 --out flood.json
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from bench.load import _git_commit, _percentile, _request, _targets
+
+READ_ROUTES = ('proposals', 'thread_detail', 'workspace_dashboard', 'my_workspaces')
+
+
+def _summary(latencies, elapsed):
+    return {'requests': len(latencies), 'throughput_rps': len(latencies) / elapsed,
+            'p50_ms': _percentile(latencies, 50), 'p95_ms': _percentile(latencies, 95),
+            'p99_ms': _percentile(latencies, 99)}
+
+
+def run_phase(app, readers, flooders, usernames, proposals, seconds, seed):
+    stop = threading.Event()
+    lock = threading.Lock()
+    read_ms, flood_ms, statuses = [], [], Counter()
+
+    def reader(n, client, workspaces):
+        rng = random.Random(seed * 1000 + n)
+        local = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = _request(client, rng.choice(READ_ROUTES), rng, workspaces, proposals)
+            response.get_data()
+            local.append((time.perf_counter() - started) * 1000)
+        with lock:
+            read_ms.extend(local)
+
+    def flooder(n):
+        rng = random.Random(seed * 2000 + n)
+        client = app.test_client()
+        local, codes = [], Counter()
+        while not stop.is_set():
+            address = '203.0.113.7' if n % 2 else f'198.51.{rng.randint(0, 255)}.{rng.randint(1, 254)}'
+            started = time.perf_counter()
+            response = client.post('/login', data={'username': rng.choice(usernames),
+                                                   'password': f'guess-{rng.random()}'},
+                                   environ_base={'REMOTE_ADDR': address})
+            response.get_data()
+            local.append((time.perf_counter() - started) * 1000)
+            codes[response.status_code] += 1
+        with lock:
+            flood_ms.extend(local)
+            statuses.update(codes)
+
+    threads = [threading.Thread(target=reader, args=(n, client, workspaces))
+               for n, (client, workspaces) in enumerate(readers)]
+    threads += [threading.Thread(target=flooder, args=(n,)) for n in range(flooders)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    result = {'readers': _summary(read_ms, elapsed)}
+    if flooders:
+        result['flood'] = dict(_summary(flood_ms, elapsed), statuses={str(k): v for k, v in sorted(statuses.items())})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Page latency for logged-in users during a login flood.')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--flooders', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5, help='per phase')
+    parser.add_argument('--hash-workers', type=int, help='default: PASSWORD_HASH_WORKERS')
+    parser.add_argument('--hash-queue', type=int, help='default: PASSWORD_HASH_QUEUE')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--workspaces', type=int, default=25)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='bench_results_login_flood.json')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'   # read by config.py on import
+
+    from app import app
+    from extensions import db
+    from bench.datagen import generate
+    import auth
+
+    config = app.config
+    workers = config['PASSWORD_HASH_WORKERS'] if args.hash_workers is None else args.hash_workers
+    queue_size = config['PASSWORD_HASH_QUEUE'] if args.hash_queue is None else args.hash_queue
+    limits = {key: config[key] for key in ('LOGIN_IP_LIMIT', 'LOGIN_ACCOUNT_LIMIT')}
+    try:
+        with app.app_context():
+            db.create_all()
+            generate(users=args.users, workspaces=args.workspaces, posts_per_thread=10, big_chapters=0,
+                     seed=args.seed)
+        users, proposals = _targets(app)
+        usernames = [username for username, _, _ in users]
+
+        readers = []
+        for n, (username, password, workspaces) in enumerate(users[:args.readers]):
+            client = app.test_client()
+            client.post('/login', data={'username': username, 'password': password},
+                        environ_base={'REMOTE_ADDR': f'10.0.0.{n + 1}'})
+            readers.append((client, workspaces))
+
+        results = {'baseline': run_phase(app, readers, 0, usernames, proposals, args.seconds, args.seed)}
+
+        auth.pool.configure(0)
+        config.update({key: 0 for key in limits})
+        results['unprotected'] = run_phase(app, readers, args.flooders, usernames, proposals,
+                                           args.seconds, args.seed)
+
+        auth.pool.configure(workers, queue_size, config['PASSWORD_HASH_TIMEOUT'])
+        config.update(limits)
+        auth.backend = auth.MemoryBackend()
+        results['protected'] = run_phase(app, readers, args.flooders, usernames, proposals,
+                                         args.seconds, args.seed)
+        results['protected']['hash_pool'] = {'workers': workers, 'queue': queue_size,
+                                             'rejected': auth.pool.rejected}
+    finally:
+        auth.pool.shutdown()
+        auth.last_logins.flush()   # before the scratch database goes
+        with app.app_context():
+            db.engine.dispose()
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    for phase in ('baseline', 'unprotected', 'protected'):
+        r = results[phase]['readers']
+        line = (f"{phase:12} readers {r['throughput_rps']:7.1f} req/s  p50 {r['p50_ms']:7.2f}  "
+                f"p95 {r['p95_ms']:7.2f}  p99 {r['p99_ms']:7.2f} ms")
+        flood = results[phase].get('flood')
+        if flood:
+            line += f"   | flood {flood['throughput_rps']:7.1f} req/s  statuses {flood['statuses']}"
+        print(line)
+
+    with open(args.out, 'w') as fh:
+        json.dump({'benchmark': 'login_flood', 'commit': _git_commit(),
+                   'timestamp': datetime.utcnow().isoformat(), 'args': vars(args),
+                   'results': results}, fh, indent=2)
+    print(f'results written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
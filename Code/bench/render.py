@@ -0,0 +1,117 @@
+# bench/render.py
+# Render cost of a thread page with and without the fragment cache
+# (fragments.py), plus the one-off cost of sanitizing content on write.
+# Thread pages are fetched through the test client without If-None-Match, so
+# every request renders; the "cold" pass starts from an empty cache.
+#
+#   python -m bench.render
+#   python -m bench.render --posts-per-thread 100 --requests 300 --out render.json
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from bench.load import _git_commit, _percentile
+
+
+def _time_pages(client, paths, requests, rng):
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.get(rng.choice(paths))
+        response.get_data()
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.status_code
+    return {
+        'requests': requests,
+        'mean_ms': sum(latencies) / len(latencies),
+        'p50_ms': _percentile(latencies, 50),
+        'p95_ms': _percentile(latencies, 95),
+    }
+
+
+def _time_sanitize(rng, posts, chapter_kb):
+    from sanitize import clean_html
+    from bench.datagen import _paragraph, chapter_text
+
+    samples = [_paragraph(rng) + '<script>alert(1)</script>' for _ in range(posts)]
+    started = time.perf_counter()
+    for text in samples:
+        clean_html(text)
+    per_post = (time.perf_counter() - started) * 1000 / posts
+    chapter = chapter_text(rng, chapter_kb * 1024)
+    started = time.perf_counter()
+    clean_html(chapter)
+    return {'per_post_ms': per_post, 'chapter_kb': chapter_kb,
+            'chapter_ms': (time.perf_counter() - started) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Thread page render cost with and without the fragment cache.')
+    parser.add_argument('--workspaces', type=int, default=20)
+    parser.add_argument('--posts-per-thread', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=200, help='per pass')
+    parser.add_argument('--chapter-kb', type=int, default=1024, help='size of the sanitize-on-write sample')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='bench_results_render.json')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'   # read by config.py on import
+
+    from app import app
+    from extensions import db
+    from fragments import fragment_cache
+    from bench.datagen import generate, PASSWORD
+    import auth
+
+    app.config['CONDITIONAL_GET_ENABLED'] = False
+    rng = random.Random(args.seed)
+    try:
+        with app.app_context():
+            db.create_all()
+            summary = generate(users=args.workspaces * 2, workspaces=args.workspaces,
+                               posts_per_thread=args.posts_per_thread, big_chapters=0,
+                               seed=args.seed, log=lambda *a: None)
+        paths = [f'/threads/{thread_id}' for thread_id in summary['recruitment_ids']]
+        client = app.test_client()
+        client.post('/login', data={'username': summary['usernames'][0], 'password': PASSWORD})
+
+        results = {}
+        capacity = fragment_cache.max_bytes
+        fragment_cache.max_bytes = 0
+        results['no_cache'] = _time_pages(client, paths, args.requests, rng)
+        fragment_cache.max_bytes = capacity
+        fragment_cache.clear()
+        results['cold_cache'] = _time_pages(client, paths, len(paths), rng)
+        results['warm_cache'] = _time_pages(client, paths, args.requests, rng)
+        results['cache'] = fragment_cache.stats()
+        results['sanitize'] = _time_sanitize(rng, 200, args.chapter_kb)
+    finally:
+        auth.last_logins.flush()   # before the scratch database goes
+        with app.app_context():
+            db.engine.dispose()
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    for name in ('no_cache', 'cold_cache', 'warm_cache'):
+        r = results[name]
+        print(f"{name:12} mean {r['mean_ms']:7.2f}  p50 {r['p50_ms']:7.2f}  p95 {r['p95_ms']:7.2f} ms")
+    s = results['sanitize']
+    print(f"sanitize     {s['per_post_ms']:.3f} ms/post, {s['chapter_ms']:.1f} ms per {s['chapter_kb']} KiB chapter")
+
+    with open(args.out, 'w') as fh:
+        json.dump({'benchmark': 'render', 'commit': _git_commit(),
+                   'timestamp': datetime.utcnow().isoformat(), 'args': vars(args),
+                   'results': results}, fh, indent=2)
+    print(f'results written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
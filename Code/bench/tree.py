@@ -0,0 +1,187 @@
+# bench/tree.py
+# Nested thread trees (hierarchy.py): fetching a whole workspace tree with post
+# counts through thread_closure, against walking it level by level and node by
+# node the way parent_thread_id alone allows; moving subtrees; and the
+# workspace page on top of it. Workspaces get --parts part threads holding
+# --chapters chapter threads between them, each chapter --scenes scene threads.
+#
+#   python -m bench.tree
+#   python -m bench.tree --workspaces 5 --chapters 500 --scenes 2 --out tree.json
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.load import QueryCounter, _git_commit, _percentile
+
+
+def _timed(fn, repeats, counter):
+    latencies, queries = [], 0
+    for _ in range(repeats):
+        counter.reset()
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries = counter.count
+    return {'repeats': repeats, 'queries': queries, 'mean_ms': sum(latencies) / len(latencies),
+            'p50_ms': _percentile(latencies, 50), 'p95_ms': _percentile(latencies, 95)}
+
+
+def _build_trees(args, rng, leader_id):
+    from sqlalchemy import insert
+    from extensions import db
+    from models import Post, Thread
+    import activity
+    import provisioning
+
+    workspaces, parts_by_workspace, posts = [], {}, []
+    base_time = datetime.utcnow() - timedelta(days=30)
+    for n in range(args.workspaces):
+        workspace = provisioning.provision_workspace(leader_id, f'Tree bench {n}').workspace
+        parts = [Thread(title=f'Part {p + 1}', is_proposal=False, parent_thread_id=workspace.id,
+                        leader_id=leader_id, status='active') for p in range(args.parts)]
+        db.session.add_all(parts)
+        db.session.flush()
+        chapters = [Thread(title=f'Chapter {c + 1}', is_proposal=False,
+                           parent_thread_id=parts[c * args.parts // args.chapters].id,
+                           leader_id=leader_id, status='active') for c in range(args.chapters)]
+        db.session.add_all(chapters)
+        db.session.flush()
+        scenes = [Thread(title=f'Scene {s + 1}', is_proposal=False, parent_thread_id=chapter.id,
+                         leader_id=leader_id, status='active')
+                  for chapter in chapters for s in range(args.scenes)]
+        db.session.add_all(scenes)
+        db.session.commit()
+        for thread in chapters + scenes:
+            for _ in range(rng.randint(0, args.posts_per_thread * 2)):
+                posts.append({'thread_id': thread.id, 'user_id': leader_id, 'content': '<p>…</p>',
+                              'created_at': base_time + timedelta(seconds=rng.randint(0, 30 * 86400))})
+        workspaces.append(workspace.id)
+        parts_by_workspace[workspace.id] = [part.id for part in parts]
+    for start in range(0, len(posts), 5000):
+        db.session.execute(insert(Post), posts[start:start + 5000])
+    db.session.commit()
+    activity.rebuild()   # bulk inserts skip the mapper events
+    return workspaces, parts_by_workspace, len(posts)
+
+
+def _per_level(root_id):
+    """Baseline: parent_thread_id only – one children query and one count query per level."""
+    from extensions import db
+    from models import Post, Thread
+
+    level, found = [root_id], 0
+    while level:
+        children = Thread.query.filter(Thread.parent_thread_id.in_(level)).all()
+        dict(db.session.query(Post.thread_id, db.func.count(Post.id))
+             .filter(Post.thread_id.in_(level)).group_by(Post.thread_id))
+        found += len(children)
+        level = [child.id for child in children]
+    return found
+
+
+def _per_node(thread_id):
+    """Baseline: the naive recursive walk – two queries per thread."""
+    from models import Post, Thread
+
+    Post.query.filter_by(thread_id=thread_id).count()
+    children = Thread.query.filter_by(parent_thread_id=thread_id).all()
+    return len(children) + sum(_per_node(child.id) for child in children)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Workspace tree fetch and subtree moves with the closure table.')
+    parser.add_argument('--workspaces', type=int, default=3)
+    parser.add_argument('--parts', type=int, default=10, help='part threads per workspace')
+    parser.add_argument('--chapters', type=int, default=300, help='chapter threads per workspace')
+    parser.add_argument('--scenes', type=int, default=1, help='scene threads per chapter')
+    parser.add_argument('--posts-per-thread', type=int, default=5, help='average')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='bench_results_tree.json')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'   # read by config.py on import
+
+    from app import app
+    from extensions import db
+    from models import User
+    import hierarchy
+    import auth
+
+    app.config['CONDITIONAL_GET_ENABLED'] = False
+    rng = random.Random(args.seed)
+    try:
+        with app.app_context():
+            db.create_all()
+            leader = User(username='tree_bench', email='tree_bench@example.com')
+            leader.set_password('bench-password')
+            db.session.add(leader)
+            db.session.commit()
+            started = time.perf_counter()
+            workspaces, parts, post_count = _build_trees(args, rng, leader.id)
+            build_seconds = time.perf_counter() - started
+            counter = QueryCounter(db.engine)
+            root = workspaces[0]
+            threads = sum(1 for _ in hierarchy.tree(root).walk())
+
+            results = {
+                'threads_per_workspace': threads,
+                'posts': post_count,
+                'build_seconds': build_seconds,
+                'closure_tree': _timed(lambda: hierarchy.tree(root, leader.id), args.repeats, counter),
+                'per_level': _timed(lambda: _per_level(root), args.repeats, counter),
+                'per_node': _timed(lambda: _per_node(root), max(1, args.repeats // 5), counter),
+            }
+
+            # Move a part (its chapters and scenes come along) back and forth between parts
+            mover, targets = parts[root][0], parts[root][1:] or [root]
+            moves = iter(targets * args.repeats)
+            home = hierarchy.ancestor_ids(mover)[-1]
+
+            def move():
+                hierarchy.move_thread(mover, next(moves))
+            results['move_subtree'] = _timed(move, args.repeats, counter)
+            results['move_subtree']['subtree_threads'] = sum(1 for _ in hierarchy.tree(mover).walk())
+            hierarchy.move_thread(mover, home)
+
+        client = app.test_client()
+        client.post('/login', data={'username': 'tree_bench', 'password': 'bench-password'})
+        client.get('/dashboard')
+
+        def page():
+            response = client.get(f'/workspace/{root}')
+            response.get_data()
+            assert response.status_code == 200, response.status_code
+        with app.app_context():
+            counter = QueryCounter(db.engine)
+        results['workspace_page'] = _timed(page, args.repeats, counter)
+    finally:
+        auth.last_logins.flush()   # before the scratch database goes
+        with app.app_context():
+            db.engine.dispose()
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    print(f"{results['threads_per_workspace']} threads per workspace, {results['posts']} posts")
+    for name in ('closure_tree', 'per_level', 'per_node', 'move_subtree', 'workspace_page'):
+        r = results[name]
+        print(f"{name:15} mean {r['mean_ms']:8.2f}  p50 {r['p50_ms']:8.2f}  p95 {r['p95_ms']:8.2f} ms"
+              f"  {r['queries']:5d} queries")
+
+    with open(args.out, 'w') as fh:
+        json.dump({'benchmark': 'tree', 'commit': _git_commit(),
+                   'timestamp': datetime.utcnow().isoformat(), 'args': vars(args),
+                   'results': results}, fh, indent=2)
+    print(f'results written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# boundaries.py
+# Process-local cache of the ListBoundaryOption vocabulary.
+# The table is tiny and almost never changes, so it is read once, grouped by the
+# for_* category flags and kept in memory. Dropdowns and thread pages resolve
+# labels from here instead of querying. Any commit that touches
+# ListBoundaryOption clears the cache; BOUNDARY_CACHE_TTL (seconds) is a safety
+# net for changes made by other processes.
+
+import hashlib
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import event
+
+from extensions import db
+from models import ListBoundaryOption
+
+# (category, label shown on thread pages)
+CATEGORIES = (
+    ('genre', 'Genre'),
+    ('political', 'Political'),
+    ('violence', 'Violence'),
+    ('sex', 'Sex/Nudity'),
+    ('style', 'Style'),
+    ('audience', 'Audience'),
+)
+
+BoundaryOption = namedtuple('BoundaryOption', 'id option_text sort_order')
+
+
+class BoundaryCache:
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._by_id = None
+        self._by_category = None
+        self._loaded_at = 0.0
+        self._fingerprint = ''
+
+    # ─── Loading / invalidation ──────────────────────────────────
+    def _ensure_loaded(self):
+        if self._by_id is not None and (not self.ttl or time.monotonic() - self._loaded_at < self.ttl):
+            return
+        with self._lock:
+            if self._by_id is not None and (not self.ttl or time.monotonic() - self._loaded_at < self.ttl):
+                return
+            rows = ListBoundaryOption.query.order_by(ListBoundaryOption.sort_order,
+                                                     ListBoundaryOption.id).all()
+            by_id = {}
+            by_category = {name: [] for name, _ in CATEGORIES}
+            for row in rows:
+                option = BoundaryOption(row.id, row.option_text, row.sort_order)
+                by_id[row.id] = option
+                for name, _ in CATEGORIES:
+                    if getattr(row, f'for_{name}'):
+                        by_category[name].append(option)
+            self._by_category = {name: tuple(opts) for name, opts in by_category.items()}
+            self._by_id = by_id
+            self._fingerprint = hashlib.sha1(repr(sorted(by_id.items())).encode()).hexdigest()[:12]
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._by_id = None
+            self._by_category = None
+
+    # ─── Lookups ─────────────────────────────────────────────────
+    @property
+    def fingerprint(self):
+        """Hash of the loaded vocabulary – the same in every process (used in ETags)."""
+        self._ensure_loaded()
+        return self._fingerprint
+
+    def options_for(self, category):
+        """Options for one dropdown, in sort_order."""
+        self._ensure_loaded()
+        return self._by_category[category]
+
+    def get(self, option_id):
+        if option_id is None:
+            return None
+        self._ensure_loaded()
+        return self._by_id.get(option_id)
+
+    def is_valid(self, category, option_id) -> bool:
+        """True if option_id exists and is flagged for this category."""
+        option = self.get(option_id)
+        return option is not None and option in self.options_for(category)
+
+    def dropdowns(self):
+        """Keyword args for new_proposal.html: genre_options=..., political_options=..."""
+        return {f'{name}_options': self.options_for(name) for name, _ in CATEGORIES}
+
+    def thread_boundaries(self, thread):
+        """[(label, option_text), …] for the boundaries set on a thread – no queries."""
+        labels = []
+        for name, label in CATEGORIES:
+            option = self.get(getattr(thread, f'{name}_id'))
+            if option is not None:
+                labels.append((label, option.option_text))
+        return labels
+
+
+boundary_cache = BoundaryCache()
+
+
+def init_app(app):
+    boundary_cache.ttl = app.config.get('BOUNDARY_CACHE_TTL', boundary_cache.ttl)
+
+    # Flag sessions that write boundary options, then drop the cache once they commit
+    @event.listens_for(db.session, 'before_flush')
+    def _track_boundary_writes(session, flush_context, instances):
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(obj, ListBoundaryOption):
+                session.info['boundaries_changed'] = True
+                return
+
+    @event.listens_for(db.session, 'after_commit')
+    def _invalidate_on_commit(session):
+        if session.info.pop('boundaries_changed', False):
+            boundary_cache.invalidate()
+
+    @event.listens_for(db.session, 'after_rollback')
+    def _forget_on_rollback(session):
+        session.info.pop('boundaries_changed', None)
@@ -0,0 +1,76 @@
+# chunking.py
+# Paragraph-level chunks for long documents (chapter_text). A chunked
+# Document keeps its body in document_chunks, one row per top-level block
+# (<p>, <h2>, <blockquote>, …), so one section can be read or saved without
+# loading or rewriting the rest of the chapter. ''.join(split_blocks(html))
+# always gives back html exactly.
+
+import re
+
+import click
+
+_TAG_RE = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)[^>]*>')
+_VOID_TAGS = frozenset(('br', 'hr', 'img'))
+_WHITESPACE_RE = re.compile(r'\s*')
+
+POSITION_GAP = 1024   # spacing of DocumentChunk.position, leaves room for inserts
+
+
+def split_blocks(html) -> list:
+    """Split (sanitized, balanced) HTML into top-level blocks, trailing whitespace included."""
+    html = html or ''
+    blocks = []
+    start = 0
+    depth = 0
+    for match in _TAG_RE.finditer(html):
+        closing, tag = match.group(1), match.group(2).lower()
+        if tag in _VOID_TAGS:
+            if depth or tag == 'br':
+                continue   # <br> stays inside its paragraph
+        elif not closing:
+            depth += 1
+            continue
+        else:
+            depth = max(depth - 1, 0)
+            if depth:
+                continue
+        end = _WHITESPACE_RE.match(html, match.end()).end()
+        blocks.append(html[start:end])
+        start = end
+    if start < len(html):
+        if blocks and not html[start:].strip():
+            blocks[-1] += html[start:]
+        else:
+            blocks.append(html[start:])
+    return blocks
+
+
+def positions_between(low, high, count):
+    """count increasing integer positions strictly between low and high (None = open), or None if no room."""
+    if count <= 0:
+        return []
+    if high is None:
+        base = low if low is not None else 0
+        return [base + POSITION_GAP * (n + 1) for n in range(count)]
+    low = low if low is not None else high - POSITION_GAP * (count + 1)
+    step = (high - low) // (count + 1)
+    if step < 1:
+        return None
+    return [low + step * (n + 1) for n in range(count)]
+
+
+def init_app(app):
+    @app.cli.command('chunk-documents')
+    def chunk_documents_command():
+        """Move chapter_text documents stored inline into document_chunks."""
+        from extensions import db
+        from models import Document   # models imports this module
+
+        converted = 0
+        ids = [row.id for row in Document.query.with_entities(Document.id)
+               .filter(Document.storage == 'inline', Document.type.in_(Document.CHUNKED_TYPES))]
+        for document_id in ids:
+            db.session.get(Document, document_id).convert_to_chunks()
+            db.session.commit()
+            converted += 1
+        click.echo(f'Converted {converted} documents to chunked storage.')
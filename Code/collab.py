@@ -0,0 +1,416 @@
+# collab.py
+# Live collaborative editing of a Document. Editors in the same session share
+# one in-memory copy of the text; the database is written behind them.
+#
+#   editor ──POST op (base_rev)──▶ CollabSession: rebase over newer ops (deltas.transform) ─▶ ack {rev}
+#                                   ├─ unlogged ──tick──▶ document_ops (crash log, one batch per tick)
+#                                   ├─ outbox ──relay tick──▶ live.hub 'doc:<id>' ──▶ other editors (SSE)
+#                                   │           consecutive ops by one editor are composed into one
+#                                   └─ unsaved delta ──flush──▶ Document content + one DocumentRevision
+#
+# - Nothing touches the database under the session lock while editors type:
+#   an op is acked from memory and logged by the session thread on its next
+#   tick (COLLAB_RELAY_INTERVAL), so a crash can lose at most that last tick.
+# - A flush happens COLLAB_FLUSH_SECONDS after the first unsaved op, or sooner
+#   once COLLAB_FLUSH_OPS ops / COLLAB_FLUSH_BYTES characters are waiting, and
+#   when the last editor leaves. It deletes the saved ops from document_ops in
+#   the same commit, and records how far it got in Document.collab_rev.
+# - After a crash, ops past collab_rev are replayed onto the stored content
+#   the next time the document is opened (or by `flask collab-recover`).
+# - A save that bypassed the session (PATCH, section save) is merged in at the
+#   next flush and sent to the editors as a server op.
+# - Stored content is sanitized on write as usual; if that changes the text,
+#   the difference goes out to the editors as a server op too.
+#
+# Sessions live in the process that opened them. Relays go through live.hub,
+# so they cross workers with LIVE_BACKEND = 'broker', but all requests for one
+# document must reach the same worker (route by document id, or run one). If
+# two workers do open the same document, the second to log an op number loses
+# on document_ops' unique (document_id, rev): its session is dropped and its
+# editors are told to resync.
+
+import atexit
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+import click
+from sqlalchemy.exc import IntegrityError
+
+import deltas
+import live
+from extensions import db
+from models import Document, DocumentOp
+
+log = logging.getLogger(__name__)
+
+SERVER = 'server'   # client_id of ops made by the session itself
+
+
+class ResyncError(Exception):
+    """The client's base_rev is unknown here; it should reload the document."""
+
+
+def channel(document_id):
+    return f'doc:{document_id}'
+
+
+def _weight(ops):
+    """Characters inserted or deleted by a delta (the size bound for flushing)."""
+    return sum(len(arg) if kind == 'i' else arg for kind, arg in ops if kind != 'c')
+
+
+class CollabSession:
+    """Live state of one document. All methods need an app context."""
+
+    def __init__(self, document, config):
+        self.document_id = document.id
+        self.text = document.content or ''
+        self.saved_text = self.text       # content as last stored
+        self.version = document.version   # Document.version of saved_text
+        self.rev = document.collab_rev
+        self.config = config
+        self.history = deque(maxlen=config.get('COLLAB_HISTORY', 500))   # (rev, client_id, ops)
+        self.outbox = []                  # accepted ops not relayed yet
+        self.unlogged = []                # accepted ops not in document_ops yet: (rev, client_id, user_id, ops)
+        self.lost = False                 # another process logged our op numbers: editors must resync
+        self.unsaved = []                 # one delta: saved_text → text
+        self.unsaved_ops = 0
+        self.unsaved_bytes = 0
+        self.unsaved_since = None
+        self.last_user_id = None
+        self.participants = {}            # client_id → (user_id, last seen)
+        self.lock = threading.RLock()
+
+    # ─── Editing ─────────────────────────────────────────────────────
+    def join(self, user_id, client_id=None):
+        client_id = client_id or uuid.uuid4().hex
+        with self.lock:
+            self.participants[client_id] = (user_id, time.monotonic())
+            return client_id, self.rev, self.text
+
+    def leave(self, client_id, user_id):
+        """Drop client_id from the session, if it is one of user_id's."""
+        with self.lock:
+            participant = self.participants.get(client_id)
+            if participant is not None and participant[0] == user_id:
+                del self.participants[client_id]
+
+    def submit(self, client_id, user_id, base_rev, ops):
+        """Apply a client's ops made against base_rev. Returns (rev, ops as applied).
+
+        Only memory is touched: the op reaches document_ops on the next tick
+        (write_ops). Raises ResyncError if base_rev is too old (or from the
+        future) or the session was lost, ValueError if the ops don't fit.
+        """
+        with self.lock:
+            if self.lost or base_rev > self.rev or base_rev < self.rev - len(self.history):
+                raise ResyncError(self.rev)
+            for rev, _, applied in self.history:
+                if rev > base_rev:
+                    ops = deltas.transform(applied, ops)[1]   # earlier op wins ties
+            text = deltas.apply_delta(self.text, ops)
+            rev = self.rev + 1
+            self.participants[client_id] = (user_id, time.monotonic())
+            self.last_user_id = user_id
+            self._accept(rev, client_id, ops, text)
+            self.unlogged.append((rev, client_id, user_id, ops))
+            return rev, ops
+
+    def _accept(self, rev, client_id, ops, text):
+        self.rev, self.text = rev, text
+        self.history.append((rev, client_id, ops))
+        self.outbox.append((rev, client_id, ops))
+        self.unsaved = deltas.compose(self.unsaved, ops) if self.unsaved else ops
+        self.unsaved_ops += 1
+        self.unsaved_bytes += _weight(ops)
+        if self.unsaved_since is None:
+            self.unsaved_since = time.monotonic()
+
+    def changes_since(self, rev):
+        """Coalesced events for the ops after rev, or None if they are no longer in history."""
+        with self.lock:
+            if rev > self.rev or rev < self.rev - len(self.history):
+                return None
+            return _coalesce([entry for entry in self.history if entry[0] > rev])
+
+    # ─── Op log ──────────────────────────────────────────────────────
+    def write_ops(self):
+        """Append the ops accepted since the last call to document_ops, in one commit.
+
+        Runs on the session thread, outside the lock. Returns False if another
+        process has already logged one of these op numbers (the session is then
+        marked lost). Any other failure puts the ops back for the next tick.
+        """
+        with self.lock:
+            batch, self.unlogged = self.unlogged, []
+        if not batch:
+            return not self.lost
+        try:
+            db.session.execute(db.insert(DocumentOp), [
+                {'document_id': self.document_id, 'rev': rev, 'client_id': client_id,
+                 'user_id': user_id, 'payload': deltas.pack_delta(ops)}
+                for rev, client_id, user_id, ops in batch])
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            log.error('document %s: ops %s-%s were logged by another process; dropping this session '
+                      '(its edits since the last save are lost)', self.document_id, batch[0][0], batch[-1][0])
+            with self.lock:
+                self.lost = True
+            return False
+        except Exception:
+            with self.lock:
+                self.unlogged[:0] = batch
+            raise
+        return True
+
+    def resync_message(self):
+        """Hub message telling this session's editors to join again."""
+        return {'id': self.rev + 1, 'event': 'resync', 'data': json.dumps({'rev': self.rev})}
+
+    # ─── Relay ───────────────────────────────────────────────────────
+    def relay(self):
+        with self.lock:
+            outbox, self.outbox = self.outbox, []
+        for message in _coalesce(outbox):
+            live.hub.publish(channel(self.document_id), message)
+
+    # ─── Write-behind ────────────────────────────────────────────────
+    def flush_due(self, now):
+        if not self.unsaved_ops:
+            return False
+        return (now - self.unsaved_since >= self.config.get('COLLAB_FLUSH_SECONDS', 5.0)
+                or self.unsaved_ops >= self.config.get('COLLAB_FLUSH_OPS', 200)
+                or self.unsaved_bytes >= self.config.get('COLLAB_FLUSH_BYTES', 64 * 1024))
+
+    def flush(self, force=False):
+        """Save the unsaved ops as one content write and one revision. Commits.
+
+        Returns False if the document row is gone. Runs on the session thread,
+        not in a request; a failed save leaves the ops unsaved for the next tick.
+        """
+        with self.lock:
+            document = db.session.get(Document, self.document_id)
+            if document is None:
+                return False
+            if not self.unsaved_ops and document.version == self.version and not force:
+                return True
+            if self.unsaved_ops or document.version != self.version:
+                ops = self.unsaved or ([['c', len(self.saved_text)]] if self.saved_text else [])
+                if document.version != self.version:
+                    # Saved outside the session since our last flush: ours go on top of theirs
+                    external = deltas.make_delta(self.saved_text, document.content or '')
+                    ops = deltas.transform(external, ops)[1]
+                previous, stored_ops = document.apply_patch(ops)
+            else:
+                previous, stored_ops = self.saved_text, None
+            stored = document.content or ''
+            rev = self.rev
+            server_ops = deltas.make_delta(self.text, stored) if stored != self.text else None
+            if server_ops is not None:
+                rev += 1   # merged outside save, or sanitizer cleanup: goes out as a server op
+            document.collab_rev = rev
+            if stored != previous:
+                count = self.unsaved_ops
+                document.add_revision(self.last_user_id,
+                                      f"Live edit ({count} change{'s' if count != 1 else ''})",
+                                      delta=stored_ops)
+            db.session.execute(db.delete(DocumentOp).where(DocumentOp.document_id == self.document_id,
+                                                          DocumentOp.rev <= self.rev))
+            db.session.commit()
+
+            self.unlogged = []   # saved in content; no need to log them any more
+            if server_ops is not None:
+                self.history.append((rev, SERVER, server_ops))
+                self.outbox.append((rev, SERVER, server_ops))
+                self.rev, self.text = rev, stored
+            self.saved_text = stored
+            self.version = document.version
+            self.unsaved, self.unsaved_ops, self.unsaved_bytes, self.unsaved_since = [], 0, 0, None
+            return True
+
+    def expire_participants(self, now):
+        idle = self.config.get('COLLAB_IDLE_SECONDS', 120)
+        with self.lock:
+            for client_id, (_, seen) in list(self.participants.items()):
+                if now - seen > idle:
+                    del self.participants[client_id]
+            return bool(self.participants)
+
+
+def _coalesce(entries):
+    """Hub messages for (rev, client_id, ops) entries; runs by one client become one delta."""
+    messages = []
+    run = None
+    for rev, client_id, ops in entries:
+        if run is not None and run['client'] == client_id:
+            run['ops'] = deltas.compose(run['ops'], ops)
+            run['rev'] = rev
+            continue
+        if run is not None:
+            messages.append(run)
+        run = {'from': rev - 1, 'rev': rev, 'client': client_id, 'ops': ops}
+    if run is not None:
+        messages.append(run)
+    return [{'id': m['rev'], 'event': 'ops', 'data': json.dumps(m)} for m in messages]
+
+
+# ─── Session manager ─────────────────────────────────────────────────
+class SessionManager:
+    """Open sessions of this process, plus the thread that relays, flushes and closes them."""
+
+    def __init__(self):
+        self.app = None
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def get(self, document_id, create=True):
+        """The document's session, opened (and recovered from document_ops) on first use."""
+        with self._lock:
+            session = self.sessions.get(document_id)
+            if session is None and create:
+                document = db.session.get(Document, document_id)
+                if document is None:
+                    return None
+                session = CollabSession(document, self.app.config)
+                replay(session)
+                self.sessions[document_id] = session
+                self._start()
+            return session
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='collab-sessions', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = self.app.config.get('COLLAB_RELAY_INTERVAL', 0.05)
+        while not self._stopped.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                self.tick()
+            except Exception:
+                log.exception('collab session tick failed')
+
+    def tick(self, force=False):
+        """Relay pending ops; flush sessions that are due; close those nobody is in."""
+        now = time.monotonic()
+        with self._lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            with self.app.app_context():
+                try:
+                    logged = session.write_ops()
+                except Exception:
+                    db.session.rollback()
+                    log.exception('collab op log write failed for document %s; will retry', session.document_id)
+                    logged = True
+            if not logged:
+                self._drop(session)
+                continue
+            session.relay()
+            active = session.expire_participants(now)
+            if not (force or not active or session.flush_due(now)):
+                continue
+            with self.app.app_context():
+                try:
+                    exists = session.flush()
+                except Exception:
+                    db.session.rollback()
+                    log.exception('collab flush failed for document %s; will retry', session.document_id)
+                    continue
+            session.relay()   # server ops from the flush
+            if not exists or not active:
+                with self._lock, session.lock:
+                    if not session.participants or not exists:
+                        self.sessions.pop(session.document_id, None)
+
+    def _drop(self, session):
+        """Forget a lost session; its editors resync (the next request opens a fresh one)."""
+        with self._lock:
+            if self.sessions.get(session.document_id) is session:
+                del self.sessions[session.document_id]
+        live.hub.publish(channel(session.document_id), session.resync_message())
+
+    def nudge(self):
+        """Run the next tick now (a session just passed its size bound)."""
+        self._wake.set()
+
+    def shutdown(self):
+        self._stopped.set()
+        if self.app is not None and self.sessions:
+            self.tick(force=True)
+
+
+def replay(session):
+    """Re-apply logged ops the document content doesn't have yet (after a crash)."""
+    rows = (DocumentOp.query
+            .filter(DocumentOp.document_id == session.document_id, DocumentOp.rev > session.rev)
+            .order_by(DocumentOp.rev).all())
+    for row in rows:
+        ops = deltas.unpack_delta(row.payload)
+        try:
+            text = deltas.apply_delta(session.text, ops)
+        except ValueError:
+            log.error('document %s: op %s does not apply, dropping it and the rest of the log',
+                      session.document_id, row.rev)
+            break
+        session.last_user_id = row.user_id
+        session._accept(row.rev, row.client_id, ops, text)
+    session.outbox = []   # nobody has seen them, nobody is listening yet
+    return len(rows)
+
+
+manager = SessionManager()
+
+
+# ─── Request helpers ─────────────────────────────────────────────────
+def submit(document_id, client_id, user_id, base_rev, ops):
+    session = manager.get(document_id)
+    result = session.submit(client_id, user_id, base_rev, ops)
+    if session.flush_due(time.monotonic()):
+        manager.nudge()
+    return result
+
+
+def events(session, subscription, last_rev):
+    """SSE frames for an editor: ops after last_rev, then live ones.
+
+    A 'resync' event means the editor must reload (its rev is too old).
+    """
+    backlog = session.changes_since(last_rev)
+    if backlog is None:
+        subscription.close()
+        return iter([f'retry: {live.RETRY_MS}\n\n',
+                     live.sse_event(json.dumps({'rev': session.rev}), 'resync')])
+    return live.stream(subscription, backlog, last_id=last_rev)
+
+
+def init_app(app):
+    manager.app = app
+    atexit.register(manager.shutdown)   # save what's in memory on a clean shutdown
+
+    @app.cli.command('collab-recover')
+    def collab_recover_command():
+        """Save ops left in document_ops by a crashed process into their documents."""
+        ids = [row.document_id for row in
+               db.session.query(DocumentOp.document_id).distinct()]
+        recovered = 0
+        for document_id in ids:
+            document = db.session.get(Document, document_id)
+            if document is None:
+                DocumentOp.query.filter_by(document_id=document_id).delete()
+                db.session.commit()
+                continue
+            session = CollabSession(document, app.config)
+            recovered += replay(session)
+            session.flush(force=True)
+        click.echo(f'Recovered {recovered} ops in {len(ids)} documents.')
@@ -0,0 +1,74 @@
+# conditional.py
+# Conditional GET for the heavy read pages (thread, proposals, workspace).
+# Each view builds a weak ETag from the few values its page depends on –
+# Thread.changed_at (bumped by the change markers in models.py), the viewer and
+# their membership_version, the boundary vocabulary fingerprint – and answers
+# 304 Not Modified before running the expensive queries and the template.
+#
+#   etag = conditional.make_etag(thread.id, thread.changed_at, ...)
+#   not_modified = conditional.check(etag, thread.changed_at)
+#   if not_modified:
+#       return not_modified
+#   ...
+#   return conditional.stamp(render_template(...), etag, thread.changed_at)
+
+import hashlib
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+import schema
+from extensions import db
+from models import Thread
+
+
+def viewer_key():
+    """Who is looking, and which version of their memberships (changes what the page shows)."""
+    if not current_user.is_authenticated:
+        return 'anon'
+    return f'{current_user.id}.{current_user.membership_version or 0}'
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag over parts plus ETAG_SALT (bump the salt when templates change)."""
+    raw = '|'.join(str(p) for p in (current_app.config.get('ETAG_SALT', ''), *parts))
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def check(etag, last_modified=None):
+    """A ready 304 response if the client's copy is current, else None.
+
+    Only If-None-Match is honoured: the ETag includes the viewer, a bare
+    If-Modified-Since date does not (another login on the same browser).
+    """
+    if not current_app.config.get('CONDITIONAL_GET_ENABLED', True):
+        return None
+    if session.get('_flashes'):
+        return None   # the cached copy would not show the pending flash message
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return stamp(make_response('', 304), etag, last_modified)
+
+
+def stamp(response, etag, last_modified=None):
+    """Attach the validators to a rendered page (str or Response)."""
+    response = make_response(response)
+    if not current_app.config.get('CONDITIONAL_GET_ENABLED', True):
+        return response
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Per-user pages: browsers must revalidate, shared caches must not store them
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+
+def stamp_changed_at():
+    """threads.changed_at for rows older than the column: their created_at."""
+    db.session.execute(db.update(Thread).where(Thread.changed_at.is_(None)).values(changed_at=Thread.created_at))
+    db.session.commit()
+
+
+def init_app(app):
+    schema.register_backfill(('threads', 'changed_at'), stamp_changed_at)   # `flask upgrade-db`
@@ -0,0 +1,121 @@
+# config.py
+# App configuration, applied in this order (later wins):
+#   1. DefaultConfig below
+#   2. a config file named by PLOTFORGE_CONFIG (.py or .json)
+#   3. PLOTFORGE_* environment variables, e.g. PLOTFORGE_DB_POOL_SIZE=20
+#      (values are parsed as JSON, so numbers/booleans work)
+#   4. the usual unprefixed DATABASE_URL / READ_DATABASE_URL / SECRET_KEY
+
+import json
+import os
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+class DefaultConfig:
+    SECRET_KEY = 'dev-key-change-this-later-please-use-env-var'
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, '..', 'DB', 'database.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Optional read replica for @read_only views (database.py)
+    READ_DATABASE_URL = None
+
+    # Connection pool (ignored for in-memory SQLite)
+    DB_POOL_SIZE = 10
+    DB_MAX_OVERFLOW = 20
+    DB_POOL_TIMEOUT = 30        # seconds to wait for a free connection
+    DB_POOL_RECYCLE = 1800      # seconds; server databases only
+
+    # SQLite pragmas run on every new connection
+    SQLITE_JOURNAL_MODE = 'WAL'      # readers no longer block behind writers
+    SQLITE_SYNCHRONOUS = 'NORMAL'    # safe with WAL, one fsync per checkpoint instead of per commit
+    SQLITE_BUSY_TIMEOUT = 5000       # ms to wait for a write lock before "database is locked"
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE = -64 * 1024   # negative = KiB, i.e. 64 MiB page cache
+
+    # Request/SQL instrumentation and /metrics (instrumentation.py)
+    METRICS_ENABLED = False
+    SLOW_QUERY_MS = 100
+    SLOW_REQUEST_MS = 500
+    N_PLUS_ONE_THRESHOLD = 5     # same statement this many times in one request
+
+    # Conditional GET / 304s on thread, proposals and workspace pages (conditional.py)
+    CONDITIONAL_GET_ENABLED = True
+    ETAG_SALT = '1'              # bump when templates change so old ETags stop matching
+
+    # Live updates over Server-Sent Events (live.py)
+    LIVE_BACKEND = 'local'        # or 'broker': relay through `flask live-broker` (several worker processes)
+    LIVE_BROKER_HOST = '127.0.0.1'   # keep the broker on a private interface
+    LIVE_BROKER_PORT = 6390
+    LIVE_QUEUE_SIZE = 100         # events buffered per subscriber before a slow one is cut off
+
+    # Rendered post/document fragments kept in memory per process (fragments.py); 0 = off
+    FRAGMENT_CACHE_BYTES = 32 * 1024 * 1024
+
+    # AI jobs (ai_jobs.py, ai_providers.py); workers run with `flask ai-workers`
+    AI_PROVIDER = 'fake'          # or 'package.module:ProviderClass'
+    AI_MODEL = None
+    AI_WORKERS = 2                # worker processes
+    AI_MAX_CONCURRENT = 2         # provider calls in flight across all workers
+    AI_BATCH_SIZE = 8             # jobs claimed (and prompts sent) per provider call
+    AI_MAX_ATTEMPTS = 3
+    AI_JOB_TIMEOUT = 300          # seconds before a 'running' job is presumed dead and requeued
+    AI_CACHE_TTL = 7 * 24 * 3600  # seconds an identical prompt is answered from ai_results
+    AI_MAX_PENDING_PER_USER = 5
+    AI_MAX_PROMPT_CHARS = 48_000
+    AI_POLL_INTERVAL = 1.0        # idle worker sleep, seconds
+    AI_FAKE_LATENCY_MS = 0
+
+    # Live collaborative editing sessions (collab.py)
+    COLLAB_FLUSH_SECONDS = 5.0    # longest an accepted op waits before it is saved to the document
+    COLLAB_FLUSH_OPS = 200        # …or save as soon as this many ops are waiting
+    COLLAB_FLUSH_BYTES = 64 * 1024   # …or this many characters inserted/deleted
+    COLLAB_RELAY_INTERVAL = 0.05  # seconds between relays of (coalesced) ops to the other editors
+    COLLAB_IDLE_SECONDS = 120     # a participant not heard from for this long has left
+    COLLAB_HISTORY = 500          # recent ops kept for rebasing late edits; older base_rev → resync
+
+    # Fingerprinted vendor bundles (assets.py, `flask build-assets`)
+    ASSETS_SOURCE_DIR = os.path.join(basedir, '..')            # where package.json / node_modules live
+    ASSETS_BUILD_DIR = os.path.join(basedir, 'static', 'build')
+    ASSETS_MAX_AGE = 365 * 24 * 3600   # hashed names never change content: cache for a year
+
+    # Compiled book exports and per-chapter parts (export.py)
+    EXPORT_CACHE_DIR = os.path.join(basedir, '..', 'instance', 'exports')
+
+    # Login / registration protection (auth.py)
+    PASSWORD_HASH_WORKERS = 2     # hashes computed at once per process; 0 = in the request thread
+    PASSWORD_HASH_QUEUE = 8       # attempts allowed to wait for a hash worker before new ones get a 503
+    PASSWORD_HASH_TIMEOUT = 5.0   # seconds an attempt waits for its hash before giving up
+    LOGIN_THROTTLE_BACKEND = 'memory'   # 'redis' (shared by all workers) or 'package.module:BackendClass'
+    LOGIN_THROTTLE_REDIS_URL = 'redis://localhost:6379/0'
+    LOGIN_IP_LIMIT = 30           # login attempts per username from one client address…
+    LOGIN_IP_WINDOW = 60          # …per this many seconds (sliding)
+    LOGIN_ACCOUNT_LIMIT = 10      # failed logins per username…
+    LOGIN_ACCOUNT_WINDOW = 900    # …per this many seconds; a successful login clears it
+    REGISTER_IP_LIMIT = 10        # registrations per client address…
+    REGISTER_IP_WINDOW = 3600
+    # Reverse proxies in front of the app that append to X-Forwarded-For. The
+    # client address the throttles key on is taken from that many hops back;
+    # 0 = none (request.remote_addr is the client). Never more than you run:
+    # clients could then choose their own address with a forged header.
+    PROXY_FIX_HOPS = 0
+    LAST_LOGIN_FLUSH_SECONDS = 30  # users.last_login is written in batches this often; 0 = every login
+
+
+def load_config(app):
+    app.config.from_object(DefaultConfig)
+
+    path = os.environ.get('PLOTFORGE_CONFIG')
+    if path:
+        if path.endswith('.json'):
+            app.config.from_file(path, load=json.load)
+        else:
+            app.config.from_pyfile(path)
+
+    app.config.from_prefixed_env('PLOTFORGE')
+
+    for env_name, key in (('DATABASE_URL', 'SQLALCHEMY_DATABASE_URI'),
+                          ('READ_DATABASE_URL', 'READ_DATABASE_URL'),
+                          ('SECRET_KEY', 'SECRET_KEY')):
+        if os.environ.get(env_name):
+            app.config[key] = os.environ[env_name]
@@ -0,0 +1,134 @@
+# database.py
+# Engine profile for PlotForge: pool sizing, SQLite pragmas and an optional
+# read/write split. Everything is driven by app.config (see config.py), and
+# server databases (Postgres/MySQL URLs) get pooling without any SQLite pragmas.
+#
+# Read/write split: set READ_DATABASE_URL and decorate read-only views with
+# @read_only. Their queries go to the 'read' engine. A @read_only view that
+# tries to write (flush, or an INSERT/UPDATE/DELETE statement) raises
+# ReadOnlyViolation – with or without a replica configured, so the mistake
+# shows up in development too.
+
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+READ_BIND = 'read'
+
+
+def _is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def _is_sqlite_memory(url):
+    url = make_url(url)
+    return _is_sqlite(url) and url.database in (None, '', ':memory:')
+
+
+def engine_options(config, url) -> dict:
+    """SQLAlchemy create_engine() kwargs for one database URL."""
+    if _is_sqlite_memory(url):
+        return {}   # Flask-SQLAlchemy uses a StaticPool here
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    }
+    if _is_sqlite(url):
+        # Python-level lock wait, in seconds; matches PRAGMA busy_timeout
+        options['connect_args'] = {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000}
+    else:
+        options['pool_recycle'] = config['DB_POOL_RECYCLE']
+        options['pool_pre_ping'] = True
+    return options
+
+
+def configure(app):
+    """Fill in the SQLAlchemy config keys before db.init_app()."""
+    config = app.config
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                      engine_options(config, config['SQLALCHEMY_DATABASE_URI']))
+    read_url = config.get('READ_DATABASE_URL')
+    if read_url:
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(READ_BIND, {'url': read_url, **engine_options(config, read_url)})
+        config['SQLALCHEMY_BINDS'] = binds
+
+
+# ─── SQLite pragmas ──────────────────────────────────────────────────
+def sqlite_pragmas(config) -> list:
+    return [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}",
+    ]
+
+
+def install_sqlite_pragmas(engine, config):
+    """Run the configured pragmas on every new SQLite connection of engine."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def init_app(app, db):
+    """Call after db.init_app(): hooks pragmas onto every engine."""
+    with app.app_context():
+        for engine in db.engines.values():
+            install_sqlite_pragmas(engine, app.config)
+
+
+# ─── Read/write routing ──────────────────────────────────────────────
+class ReadOnlyViolation(RuntimeError):
+    """A @read_only view tried to write to the database."""
+
+
+def _in_read_only_view():
+    return has_app_context() and g.get('db_read_only', False)
+
+
+def read_only(view):
+    """Send this view's queries to the read engine when one is configured."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that honours @read_only."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_app_context()
+                and g.get('db_read_only')):
+            engines = self._db.engines
+            if READ_BIND in engines:
+                return engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _refuse_flush(session, flush_context, instances):
+    if _in_read_only_view():
+        raise ReadOnlyViolation('write in a @read_only view (it would run against the read replica); '
+                                'drop @read_only from the view or move the write elsewhere')
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _refuse_dml(orm_execute_state):
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete) \
+            and _in_read_only_view():
+        raise ReadOnlyViolation('INSERT/UPDATE/DELETE in a @read_only view')
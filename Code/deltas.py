@@ -0,0 +1,267 @@
+# deltas.py
+# Small text-delta codec used by the document revision store (and the patch
+# save endpoint). A delta is a list of ops applied left-to-right over the
+# base text:
+#   ['c', n]     copy the next n characters of the base
+#   ['s', n]     skip (delete) the next n characters of the base
+#   ['i', text]  insert text
+# Deltas and snapshots are stored zlib-compressed.
+
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+
+_TOKEN_RE = re.compile(r'\s+|[^\s<>]+|<[^>]*>?|[<>]')   # whitespace, words, html tags
+# paragraphs and other blocks: text up to and including a closing block tag or newline
+_BLOCK_RE = re.compile(r'.*?(?:</(?:p|h[1-6]|li|ul|ol|blockquote|pre|div|table)>|\n)|.+', re.S | re.I)
+
+# SequenceMatcher is roughly quadratic (worse on prose, where the same few
+# tokens repeat). A changed middle bigger than this many tokens × tokens is
+# diffed paragraph by paragraph instead, and any region still over the limit
+# is replaced wholesale: a bigger delta, but bounded time (~20 ms per region).
+MAX_DIFF_WORK = 500 * 500
+
+
+def _tokens(text):
+    return _TOKEN_RE.findall(text)
+
+
+def _diff(a, b, ops, refine=None):
+    """Append ops turning the token list a into b; refine(old, new) handles changed runs."""
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(['c', sum(len(t) for t in a[i1:i2])])
+        elif refine is not None and tag == 'replace' and i2 - i1 == j2 - j1:
+            for old, new in zip(a[i1:i2], b[j1:j2]):   # paragraph for paragraph
+                refine(old, new, ops)
+        elif refine is not None:
+            refine(''.join(a[i1:i2]), ''.join(b[j1:j2]), ops)
+        else:
+            if i2 > i1:
+                ops.append(['s', sum(len(t) for t in a[i1:i2])])
+            if j2 > j1:
+                ops.append(['i', ''.join(b[j1:j2])])
+
+
+def _diff_words(old, new, ops):
+    a, b = _tokens(old), _tokens(new)
+    if len(a) * len(b) <= MAX_DIFF_WORK:
+        _diff(a, b, ops)
+    else:
+        ops.extend(replace_delta(old, new))
+
+
+def make_delta(old: str, new: str) -> list:
+    """Ops turning `old` into `new`. Cost scales with the changed region, not the
+    document, and is capped by MAX_DIFF_WORK however large that region is."""
+    old = old or ''
+    new = new or ''
+
+    # Trim the common prefix/suffix first – a typical edit touches one spot
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < limit - prefix
+           and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]):
+        suffix += 1
+
+    ops = []
+    if prefix:
+        ops.append(['c', prefix])
+
+    # Word-level diff of whatever is left in the middle; paragraphs first if it is big
+    old_middle, new_middle = old[prefix:len(old) - suffix], new[prefix:len(new) - suffix]
+    a, b = _tokens(old_middle), _tokens(new_middle)
+    if len(a) * len(b) <= MAX_DIFF_WORK:
+        _diff(a, b, ops)
+    else:
+        a, b = _BLOCK_RE.findall(old_middle), _BLOCK_RE.findall(new_middle)
+        if len(a) * len(b) <= MAX_DIFF_WORK:
+            _diff(a, b, ops, refine=_diff_words)
+        else:
+            ops.extend(replace_delta(old_middle, new_middle))
+
+    if suffix:
+        ops.append(['c', suffix])
+    return _merge([op for op in ops if op[1]])
+
+
+def replace_delta(old: str, new: str) -> list:
+    """Ops that delete all of `old` and insert `new` – no diffing at all."""
+    ops = []
+    if old:
+        ops.append(['s', len(old)])
+    if new:
+        ops.append(['i', new])
+    return ops
+
+
+def _merge(ops):
+    """Collapse neighbouring ops of the same kind."""
+    merged = []
+    for op in ops:
+        if merged and merged[-1][0] == op[0]:
+            merged[-1][1] += op[1]
+        else:
+            merged.append(list(op))
+    return merged
+
+
+def embed_delta(ops: list, before: int, after: int) -> list:
+    """Widen a delta over one slice of a text to the whole text: copy `before`
+    characters, apply ops, copy the remaining `after` characters."""
+    ops = [['c', before]] + list(ops) + [['c', after]]
+    return _merge([op for op in ops if op[1]])
+
+
+def apply_delta(base: str, ops: list) -> str:
+    """Apply ops to base. Raises ValueError if the ops don't fit the base text."""
+    base = base or ''
+    out = []
+    pos = 0
+    for op in ops:
+        kind, arg = op[0], op[1]
+        if kind == 'c':
+            if pos + arg > len(base):
+                raise ValueError('delta copies past the end of the base text')
+            out.append(base[pos:pos + arg])
+            pos += arg
+        elif kind == 's':
+            if pos + arg > len(base):
+                raise ValueError('delta skips past the end of the base text')
+            pos += arg
+        elif kind == 'i':
+            out.append(arg)
+        else:
+            raise ValueError(f'unknown delta op {kind!r}')
+    if pos != len(base):
+        raise ValueError('delta does not cover the whole base text')
+    return ''.join(out)
+
+
+def validate_delta(ops) -> list:
+    """Check the shape of client-supplied ops; returns them as a list of lists."""
+    if not isinstance(ops, list):
+        raise ValueError('delta must be a list of ops')
+    clean = []
+    for op in ops:
+        if not isinstance(op, (list, tuple)) or len(op) != 2:
+            raise ValueError('each delta op must be a [kind, arg] pair')
+        kind, arg = op
+        if kind in ('c', 's'):
+            if not isinstance(arg, int) or isinstance(arg, bool) or arg < 0:
+                raise ValueError(f'{kind!r} op needs a non-negative integer')
+        elif kind == 'i':
+            if not isinstance(arg, str):
+                raise ValueError("'i' op needs a string")
+        else:
+            raise ValueError(f'unknown delta op {kind!r}')
+        clean.append([kind, arg])
+    return clean
+
+
+# ─── Operational transform (collaborative sessions, collab.py) ───────
+def _length(op):
+    return len(op[1]) if op[0] == 'i' else op[1]
+
+
+def _split(op, n):
+    """(first n characters of op, the rest or None)."""
+    if op[0] == 'i':
+        head, tail = ['i', op[1][:n]], ['i', op[1][n:]]
+    else:
+        head, tail = [op[0], n], [op[0], op[1] - n]
+    return head, (tail if _length(tail) else None)
+
+
+def _reader(ops):
+    items = iter([list(op) for op in ops if _length(op)])
+    return lambda: next(items, None)
+
+
+def transform(a: list, b: list):
+    """Rebase two concurrent deltas over the same base text.
+
+    Returns (a2, b2) with apply(apply(base, a), b2) == apply(apply(base, b), a2).
+    When both insert at the same spot, a's text goes first.
+    """
+    next_a, next_b = _reader(a), _reader(b)
+    op1, op2 = next_a(), next_b()
+    a2, b2 = [], []
+    while op1 is not None or op2 is not None:
+        if op1 is not None and op1[0] == 'i':
+            a2.append(op1)
+            b2.append(['c', len(op1[1])])
+            op1 = next_a()
+            continue
+        if op2 is not None and op2[0] == 'i':
+            a2.append(['c', len(op2[1])])
+            b2.append(op2)
+            op2 = next_b()
+            continue
+        if op1 is None or op2 is None:
+            raise ValueError('deltas do not share a base text')
+        n = min(op1[1], op2[1])
+        if op1[0] == 'c' and op2[0] == 'c':
+            a2.append(['c', n])
+            b2.append(['c', n])
+        elif op1[0] == 's' and op2[0] == 'c':
+            a2.append(['s', n])
+        elif op1[0] == 'c' and op2[0] == 's':
+            b2.append(['s', n])
+        # both deleted the same text: nothing left to do
+        _, op1 = _split(op1, n)
+        _, op2 = _split(op2, n)
+        op1 = op1 if op1 is not None else next_a()
+        op2 = op2 if op2 is not None else next_b()
+    return _merge(a2), _merge(b2)
+
+
+def compose(a: list, b: list) -> list:
+    """One delta with the effect of applying a, then b."""
+    next_a, next_b = _reader(a), _reader(b)
+    op1, op2 = next_a(), next_b()
+    out = []
+    while op1 is not None or op2 is not None:
+        if op1 is not None and op1[0] == 's':
+            out.append(op1)
+            op1 = next_a()
+            continue
+        if op2 is not None and op2[0] == 'i':
+            out.append(op2)
+            op2 = next_b()
+            continue
+        if op1 is None or op2 is None:
+            raise ValueError('second delta does not fit the result of the first')
+        n = min(_length(op1), op2[1])
+        head, rest1 = _split(op1, n)
+        _, rest2 = _split(op2, n)
+        if op2[0] == 'c':
+            out.append(head)               # kept: copy or inserted text survives
+        elif op1[0] == 'c':
+            out.append(['s', n])           # b deletes base text a had kept
+        # else b deletes text a inserted: it never existed
+        op1 = rest1 if rest1 is not None else next_a()
+        op2 = rest2 if rest2 is not None else next_b()
+    return _merge(out)
+
+
+# ─── Storage encoding ────────────────────────────────────────────────
+def pack_text(text: str) -> bytes:
+    return zlib.compress((text or '').encode('utf-8'))
+
+
+def unpack_text(blob: bytes) -> str:
+    return zlib.decompress(blob).decode('utf-8')
+
+
+def pack_delta(ops: list) -> bytes:
+    return zlib.compress(json.dumps(ops, separators=(',', ':')).encode('utf-8'))
+
+
+def unpack_delta(blob: bytes) -> list:
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
@@ -0,0 +1,99 @@
+# discovery.py
+# Paginated, filterable listing of open proposals for /proposals.
+# Pages are keyset-paginated on (created_at, id) newest first (same cursors as
+# feed.py) and every filter combination lines up with one of the composite
+# indexes declared on Thread. Total counts are the only part that has to scan,
+# so they are cached for a few seconds per filter combination.
+
+import threading
+import time
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import joinedload
+
+from extensions import db
+from feed import encode_cursor, decode_cursor
+from models import Thread
+
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+COUNT_TTL = 30          # seconds a total count may be stale
+COUNT_CACHE_SIZE = 512  # filter combinations remembered
+
+FILTER_COLUMNS = ('genre_id', 'political_id', 'violence_id', 'sex_id', 'style_id', 'audience_id')
+
+
+def parse_filters(args):
+    """Pull boundary filters and the open-seats flag out of request.args."""
+    filters = {}
+    for column in FILTER_COLUMNS:
+        value = args.get(column, type=int)
+        if value:
+            filters[column] = value
+    open_seats = args.get('open_seats', '') in ('1', 'true', 'on')
+    return filters, open_seats
+
+
+def _filtered(query, filters, open_seats):
+    query = query.filter(Thread.is_proposal == True, Thread.status == 'open')
+    for column, value in filters.items():
+        query = query.filter(getattr(Thread, column) == value)
+    if open_seats:
+        query = query.filter(Thread.member_count < Thread.max_members)
+    return query
+
+
+# ─── Pages ───────────────────────────────────────────────────────────
+class ProposalPage:
+    def __init__(self, threads, next_cursor):
+        self.threads = threads
+        self.next_cursor = next_cursor
+
+    def to_dict(self):
+        return {
+            'items': [{
+                'id': thread.id,
+                'title': thread.title,
+                'leader': thread.leader.username,
+                'created_at': thread.created_at.isoformat(),
+                'members': thread.member_count,
+                'max_members': thread.max_members,
+                **{column: getattr(thread, column) for column in FILTER_COLUMNS},
+            } for thread in self.threads],
+            'next_cursor': self.next_cursor,
+        }
+
+
+def proposal_page(filters, open_seats=False, cursor=None, limit=None) -> ProposalPage:
+    """One page of open proposals, newest first. Raises ValueError on a bad cursor."""
+    limit = min(max(limit or PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    query = Thread.query.options(joinedload(Thread.leader))
+    query = _filtered(query, filters, open_seats)
+    if cursor:
+        query = query.filter(tuple_(Thread.created_at, Thread.id) < decode_cursor(cursor))
+    rows = (query.order_by(Thread.created_at.desc(), Thread.id.desc())
+            .limit(limit + 1).all())
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return ProposalPage(rows[:limit], next_cursor)
+
+
+# ─── Cached totals ───────────────────────────────────────────────────
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+def proposal_count(filters, open_seats=False) -> int:
+    """Total matching proposals; cached for COUNT_TTL seconds per filter combination."""
+    key = (tuple(sorted(filters.items())), open_seats)
+    now = time.monotonic()
+    cached = _count_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    total = _filtered(db.session.query(func.count(Thread.id)), filters, open_seats).scalar()
+    with _count_lock:
+        if len(_count_cache) >= COUNT_CACHE_SIZE:
+            _count_cache.clear()
+        _count_cache[key] = (now + COUNT_TTL, total)
+    return total
@@ -0,0 +1,382 @@
+# export.py
+# Compile a workspace's chapters (Documents of type chapter_text, by
+# chapter_num) into one book: HTML, Markdown, plain text or EPUB.
+#
+# Memory stays bounded: chapters are read one at a time (chunked chapters one
+# paragraph batch at a time) and the result is streamed to the client as it
+# is produced. Nothing holds the whole manuscript.
+#
+# Disk cache under EXPORT_CACHE_DIR:
+#   parts/<document_id>-<version>.<format>   one rendered chapter
+#   books/<workspace_id>-<key>.<ext>         the assembled book
+# <key> hashes the format and every chapter's (id, version, last_updated,
+# title, chapter_num), so an unchanged book is streamed straight from disk.
+# When some chapters change only their parts are re-rendered; the rest are
+# copied from parts/. Superseded files are removed as new ones are written.
+
+import glob
+import hashlib
+import os
+import re
+import uuid
+import zipfile
+from datetime import datetime
+from html import escape
+from html.entities import html5
+from html.parser import HTMLParser
+
+import click
+from flask import current_app
+
+import chunking
+from extensions import db
+from models import Document, DocumentChunk, Thread
+
+FORMATS = {
+    # format: (file extension, mimetype)
+    'html': ('html', 'text/html; charset=utf-8'),
+    'md': ('md', 'text/markdown; charset=utf-8'),
+    'txt': ('txt', 'text/plain; charset=utf-8'),
+    'epub': ('epub', 'application/epub+zip'),
+}
+READ_BLOCK = 64 * 1024
+CHUNK_BATCH = 200   # chunk rows fetched per round trip
+RENDER_VERSION = 2  # bump when rendering changes: cached parts and books are rebuilt
+
+
+# ─── Chapter metadata / book key ─────────────────────────────────────
+def chapters_for(workspace_id):
+    """Chapter documents in book order – metadata only, content stays unloaded."""
+    return (Document.query
+            .filter(Document.thread_id == workspace_id, Document.type == 'chapter_text')
+            .order_by(Document.chapter_num, Document.id).all())
+
+
+def book_key(workspace, chapters, fmt) -> str:
+    parts = [fmt, str(RENDER_VERSION), workspace.title]
+    parts.extend(f'{c.id}:{c.version}:{c.last_updated.isoformat() if c.last_updated else ""}:'
+                 f'{c.title}:{c.chapter_num}' for c in chapters)
+    return hashlib.sha1('\x1f'.join(parts).encode()).hexdigest()[:20]
+
+
+def _blocks(document):
+    """A chapter's HTML one top-level block at a time."""
+    if document.storage == 'chunked':
+        query = (db.session.query(DocumentChunk.content)
+                 .filter(DocumentChunk.document_id == document.id)
+                 .order_by(DocumentChunk.position)
+                 .execution_options(yield_per=CHUNK_BATCH))
+        for (content,) in query:
+            yield content
+    else:
+        yield from chunking.split_blocks(document.content or '')
+
+
+# ─── HTML → Markdown / text ──────────────────────────────────────────
+_SPACES = re.compile(r'[ \t\n\r\f]+')   # not \s: a no-break space must survive
+
+
+class _TextRenderer(HTMLParser):
+    """Sanitized HTML block → Markdown (markdown=True) or plain text."""
+
+    _INLINE_MD = {'strong': '**', 'b': '**', 'em': '*', 'i': '*', 's': '~~', 'strike': '~~', 'code': '`'}
+
+    def __init__(self, markdown):
+        super().__init__(convert_charrefs=True)
+        self.markdown = markdown
+        self.out = []
+        self.lists = []          # stack of [kind, counter]
+        self.quote = 0
+        self.href = None
+
+    def _newline(self, blank=False):
+        self.out.append('\n\n' if blank else '\n')
+        if self.quote and self.markdown:
+            self.out.append('> ' * self.quote)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        md = self.markdown
+        if tag in ('p', 'div', 'figure', 'table', 'pre'):
+            self._newline(blank=True)
+            if tag == 'pre' and md:
+                self.out.append('```\n')
+        elif tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+            self._newline(blank=True)
+            if md:
+                self.out.append('#' * int(tag[1]) + ' ')
+        elif tag == 'blockquote':
+            self.quote += 1
+            self._newline(blank=True)
+        elif tag in ('ul', 'ol'):
+            self.lists.append([tag, 0])
+        elif tag == 'li':
+            self._newline()
+            indent = '  ' * (len(self.lists) - 1)
+            if self.lists and self.lists[-1][0] == 'ol':
+                self.lists[-1][1] += 1
+                self.out.append(f'{indent}{self.lists[-1][1]}. ')
+            else:
+                self.out.append(f'{indent}- ' if md else f'{indent}* ')
+        elif tag == 'br':
+            self.out.append('  ' if md else '')
+            self._newline()
+        elif tag == 'hr':
+            self._newline(blank=True)
+            self.out.append('---' if md else '* * *')
+        elif tag == 'tr':
+            self._newline()
+        elif tag in ('td', 'th'):
+            self.out.append(' | ' if md else '\t')
+        elif tag == 'img' and md:
+            self.out.append(f"![{attrs.get('alt', '')}]({attrs.get('src', '')})")
+        elif tag == 'a' and md:
+            self.href = attrs.get('href')
+            self.out.append('[')
+        elif md and tag in self._INLINE_MD:
+            self.out.append(self._INLINE_MD[tag])
+
+    def handle_endtag(self, tag):
+        md = self.markdown
+        if tag == 'blockquote':
+            self.quote = max(self.quote - 1, 0)
+        elif tag in ('ul', 'ol') and self.lists:
+            self.lists.pop()
+        elif tag == 'pre' and md:
+            self.out.append('\n```')
+        elif tag == 'a' and md:
+            self.out.append(f']({self.href})' if self.href else ']')
+            self.href = None
+        elif md and tag in self._INLINE_MD:
+            self.out.append(self._INLINE_MD[tag])
+
+    def handle_data(self, data):
+        self.out.append(_SPACES.sub(' ', data))   # keep the space next to inline tags: "Then <b>stop</b>"
+
+    def render(self, html):
+        self.out = []
+        self.feed(html)
+        return ''.join(self.out)
+
+
+_BLANK_LINES = re.compile(r'\n[ \t>]*\n(?:[ \t>]*\n)+')
+
+
+def _tidy(text):
+    return _BLANK_LINES.sub('\n\n', text)
+
+
+# ─── Chapter parts ───────────────────────────────────────────────────
+_VOID_RE = re.compile(r'<(br|hr|img)(\s[^>]*)?>')
+
+
+_AMP_RE = re.compile(r'&(?:(#[0-9]+|#[xX][0-9a-fA-F]+)|([A-Za-z][A-Za-z0-9]*));|&')
+_XML_ENTITIES = {'amp', 'lt', 'gt', 'quot', 'apos'}
+
+
+def _xml_reference(match):
+    """XHTML is XML: only the five XML entities exist, so &nbsp; and friends
+    become numeric references (and a stray & becomes &amp;)."""
+    numeric, name = match.groups()
+    if numeric or name in _XML_ENTITIES:
+        return match.group(0)
+    if name and name + ';' in html5:
+        return ''.join(f'&#{ord(char)};' for char in html5[name + ';'])
+    return '&amp;' + match.group(0)[1:]
+
+
+def _xhtml(html):
+    html = _AMP_RE.sub(_xml_reference, html)
+    return _VOID_RE.sub(lambda m: f'<{m.group(1)}{m.group(2) or ""}/>', html)
+
+
+def render_chapter(document, fmt):
+    """One chapter in fmt, as a stream of strings."""
+    title = document.title
+    if fmt == 'html':
+        yield f'<section class="chapter" id="chapter-{document.id}">\n<h2>{escape(title)}</h2>\n'
+        yield from _blocks(document)
+        yield '\n</section>\n'
+    elif fmt in ('md', 'txt'):
+        renderer = _TextRenderer(markdown=fmt == 'md')
+        yield f'\n\n## {title}\n' if fmt == 'md' else f'\n\n{title}\n{"=" * len(title)}\n'
+        for block in _blocks(document):
+            yield _tidy(renderer.render(block))
+        yield '\n'
+    elif fmt == 'epub':
+        yield ('<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+               '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+               f'<head><title>{escape(title)}</title></head>\n<body>\n<section epub:type="chapter">\n'
+               f'<h2>{escape(title)}</h2>\n')
+        for block in _blocks(document):
+            yield _xhtml(block)
+        yield '\n</section>\n</body>\n</html>\n'
+
+
+class ExportCache:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, 'parts'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'books'), exist_ok=True)
+
+    def part_path(self, document, fmt):
+        return os.path.join(self.root, 'parts', f'{document.id}-{document.version}-r{RENDER_VERSION}.{fmt}')
+
+    def book_path(self, workspace_id, key, fmt):
+        return os.path.join(self.root, 'books', f'{workspace_id}-{key}.{FORMATS[fmt][0]}')
+
+    def _replace(self, tmp, path, stale_pattern):
+        os.replace(tmp, path)
+        for old in glob.glob(stale_pattern):
+            if old != path and '.tmp-' not in old:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+
+    def chapter(self, document, fmt):
+        """Stream a chapter part from disk, rendering (and saving) it first if needed."""
+        path = self.part_path(document, fmt)
+        if os.path.exists(path):
+            yield from read_text(path)
+            return
+        tmp = f'{path}.tmp-{uuid.uuid4().hex}'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as out:
+                for piece in render_chapter(document, fmt):
+                    out.write(piece)
+                    yield piece
+            self._replace(tmp, path, os.path.join(self.root, 'parts', f'{document.id}-*.{fmt}'))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def write_book(self, workspace, chapters, fmt, path):
+        """Write the book to path while streaming it (epub: once the zip is complete)."""
+        tmp = f'{path}.tmp-{uuid.uuid4().hex}'
+        stale = os.path.join(self.root, 'books', f'{workspace.id}-*.{FORMATS[fmt][0]}')
+        try:
+            if fmt == 'epub':
+                _write_epub(self, workspace, chapters, tmp)
+                self._replace(tmp, path, stale)
+                yield from read_bytes(path)
+                return
+            with open(tmp, 'w', encoding='utf-8') as out:
+                for piece in _book_text(self, workspace, chapters, fmt):
+                    out.write(piece)
+                    yield piece
+            self._replace(tmp, path, stale)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)   # client went away mid-stream: don't keep a partial book
+
+
+def read_text(path):
+    with open(path, encoding='utf-8') as fh:
+        while True:
+            block = fh.read(READ_BLOCK)
+            if not block:
+                return
+            yield block
+
+
+def read_bytes(path):
+    with open(path, 'rb') as fh:
+        while True:
+            block = fh.read(READ_BLOCK)
+            if not block:
+                return
+            yield block
+
+
+def _book_text(cache, workspace, chapters, fmt):
+    title = workspace.title
+    if fmt == 'html':
+        yield (f'<!doctype html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+               f'<title>{escape(title)}</title>\n</head>\n<body>\n<h1>{escape(title)}</h1>\n')
+    elif fmt == 'md':
+        yield f'# {title}\n'
+    else:
+        yield f'{title.upper()}\n'
+    for document in chapters:
+        yield from cache.chapter(document, fmt)
+    if fmt == 'html':
+        yield '</body>\n</html>\n'
+
+
+def _write_epub(cache, workspace, chapters, path):
+    """EPUB 3 container; chapters are copied into the zip part by part."""
+    title = escape(workspace.title)
+    identifier = f'urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, f"plotforge:workspace:{workspace.id}")}'
+    modified = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+    names = [f'chapter-{n + 1}.xhtml' for n in range(len(chapters))]
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as book:
+        book.writestr(zipfile.ZipInfo('mimetype'), 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        book.writestr('META-INF/container.xml',
+                      '<?xml version="1.0" encoding="utf-8"?>\n'
+                      '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+                      '<rootfiles><rootfile full-path="OEBPS/content.opf" '
+                      'media-type="application/oebps-package+xml"/></rootfiles>\n</container>\n')
+        manifest = ''.join(f'<item id="c{n}" href="{name}" media-type="application/xhtml+xml"/>\n'
+                           for n, name in enumerate(names))
+        spine = ''.join(f'<itemref idref="c{n}"/>\n' for n in range(len(names)))
+        book.writestr('OEBPS/content.opf',
+                      '<?xml version="1.0" encoding="utf-8"?>\n'
+                      '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">\n'
+                      '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+                      f'<dc:identifier id="book-id">{identifier}</dc:identifier>\n'
+                      f'<dc:title>{title}</dc:title>\n<dc:language>en</dc:language>\n'
+                      f'<meta property="dcterms:modified">{modified}</meta>\n</metadata>\n'
+                      '<manifest>\n<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" '
+                      f'properties="nav"/>\n{manifest}</manifest>\n<spine>\n{spine}</spine>\n</package>\n')
+        toc = ''.join(f'<li><a href="{name}">{escape(doc.title)}</a></li>\n'
+                      for name, doc in zip(names, chapters))
+        book.writestr('OEBPS/nav.xhtml',
+                      '<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+                      '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+                      f'<head><title>{title}</title></head>\n<body>\n<nav epub:type="toc"><h1>{title}</h1>\n'
+                      f'<ol>\n{toc}</ol></nav>\n</body>\n</html>\n')
+        for name, document in zip(names, chapters):
+            with book.open(f'OEBPS/{name}', 'w') as entry:
+                for piece in cache.chapter(document, 'epub'):
+                    entry.write(piece.encode('utf-8'))
+
+
+# ─── Entry point ─────────────────────────────────────────────────────
+def export_book(workspace, fmt, chapters=None):
+    """(key, stream) for the compiled book; stream yields str (text formats) or bytes (epub).
+
+    Run the stream inside stream_with_context – uncached chapters are read from the DB.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown export format: {fmt}')
+    chapters = chapters_for(workspace.id) if chapters is None else chapters
+    key = book_key(workspace, chapters, fmt)
+    cache = ExportCache(current_app.config['EXPORT_CACHE_DIR'])
+    path = cache.book_path(workspace.id, key, fmt)
+
+    def stream():
+        if os.path.exists(path):
+            yield from (read_bytes(path) if fmt == 'epub' else read_text(path))
+        else:
+            yield from cache.write_book(workspace, chapters, fmt, path)
+
+    return key, stream()
+
+
+def init_app(app):
+    @app.cli.command('export-book')
+    @click.argument('workspace_id', type=int)
+    @click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), default='html')
+    @click.option('--out', type=click.Path(dir_okay=False), required=True)
+    def export_book_command(workspace_id, fmt, out):
+        """Compile a workspace's chapters into one file."""
+        workspace = db.session.get(Thread, workspace_id)
+        if workspace is None:
+            raise click.ClickException(f'no workspace {workspace_id}')
+        _, stream = export_book(workspace, fmt)
+        with open(out, 'wb') as fh:
+            for piece in stream:
+                fh.write(piece if isinstance(piece, bytes) else piece.encode('utf-8'))
+        click.echo(f'Wrote {out}')
@@ -2,5 +2,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 
-db = SQLAlchemy()  # unbound here — will be initialized later
+from database import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})  # unbound here — will be initialized later
 login_manager = LoginManager()
\ No newline at end of file
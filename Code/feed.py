@@ -0,0 +1,110 @@
+# feed.py
+# Cursor (keyset) pagination for the posts inside a thread.
+# Pages are keyed on (created_at, id) so every page is a single indexed range
+# scan no matter how deep into the thread you are, and authors are joined into
+# the same query so templates can read post.author without extra selects.
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import contains_eager
+
+from models import Post
+
+PAGE_SIZE = 30       # posts per page on thread_detail
+MAX_PAGE_SIZE = 100  # upper bound for ?limit= on the feed endpoints
+
+
+# ─── Cursors ─────────────────────────────────────────────────────────
+def encode_cursor(post) -> str:
+    """Opaque, URL-safe cursor pointing at one row (anything with created_at and id)."""
+    raw = f"{post.created_at.isoformat()}|{post.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """Return (created_at, id) for a cursor, or raise ValueError if it is garbage."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, post_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(created_at), int(post_id)
+    except Exception as exc:
+        raise ValueError(f'invalid cursor: {cursor!r}') from exc
+
+
+# ─── Page object ─────────────────────────────────────────────────────
+class PostPage:
+    """One page of posts, always in display (oldest → newest) order."""
+
+    def __init__(self, posts, has_older, has_newer):
+        self.posts = posts
+        self.has_older = has_older
+        self.has_newer = has_newer
+
+    @property
+    def older_cursor(self):
+        return encode_cursor(self.posts[0]) if self.posts and self.has_older else None
+
+    @property
+    def newer_cursor(self):
+        # Always handed out (even when there is nothing newer yet) so clients
+        # can poll for replies that arrive after the page was rendered.
+        return encode_cursor(self.posts[-1]) if self.posts else None
+
+    def to_dict(self):
+        return {
+            'count': len(self.posts),
+            'has_older': self.has_older,
+            'has_newer': self.has_newer,
+            'older_cursor': self.older_cursor,
+            'newer_cursor': self.newer_cursor,
+        }
+
+
+# ─── Queries ─────────────────────────────────────────────────────────
+def _base_query(thread_id):
+    return (Post.query
+            .join(Post.author)
+            .options(contains_eager(Post.author))
+            .filter(Post.thread_id == thread_id))
+
+
+def _clamp(limit):
+    if not limit or limit < 1:
+        return PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def latest_posts(thread_id, limit=None) -> PostPage:
+    """Newest page of a thread (what thread_detail shows first)."""
+    limit = _clamp(limit)
+    rows = (_base_query(thread_id)
+            .order_by(Post.created_at.desc(), Post.id.desc())
+            .limit(limit + 1).all())
+    has_older = len(rows) > limit
+    return PostPage(list(reversed(rows[:limit])), has_older=has_older, has_newer=False)
+
+
+def posts_before(thread_id, cursor, limit=None) -> PostPage:
+    """Page of posts strictly older than the cursor ("load older")."""
+    limit = _clamp(limit)
+    key = decode_cursor(cursor)
+    rows = (_base_query(thread_id)
+            .filter(tuple_(Post.created_at, Post.id) < key)
+            .order_by(Post.created_at.desc(), Post.id.desc())
+            .limit(limit + 1).all())
+    has_older = len(rows) > limit
+    return PostPage(list(reversed(rows[:limit])), has_older=has_older, has_newer=True)
+
+
+def posts_after(thread_id, cursor, limit=None) -> PostPage:
+    """Page of posts strictly newer than the cursor ("load newer" / polling)."""
+    limit = _clamp(limit)
+    key = decode_cursor(cursor)
+    rows = (_base_query(thread_id)
+            .filter(tuple_(Post.created_at, Post.id) > key)
+            .order_by(Post.created_at.asc(), Post.id.asc())
+            .limit(limit + 1).all())
+    has_newer = len(rows) > limit
+    return PostPage(rows[:limit], has_older=True, has_newer=has_newer)
@@ -0,0 +1,130 @@
+# fragments.py
+# Size-bounded LRU cache of rendered HTML fragments: one post card, one
+# document body. Keys carry the row's id and its last-change stamp
+# (Post.updated_at/created_at, Document.version), so an edited row simply gets
+# a new key and its old fragment ages out – no invalidation messages needed.
+# The cache is per process; FRAGMENT_CACHE_BYTES = 0 turns it off.
+#
+# Content is sanitized when it is written (sanitize.py), so fragments are
+# safe to mark up as-is.
+
+import threading
+from collections import OrderedDict
+
+import click
+from flask import current_app
+from markupsafe import Markup
+
+import sanitize
+from extensions import db
+from models import Post, Document
+
+
+class FragmentCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items = OrderedDict()   # key -> str, least recently used first
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        if not self.max_bytes:
+            return render()
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = render()   # outside the lock: rendering is the slow part
+        size = len(value)
+        if size > self.max_bytes // 4:
+            return value   # one huge chapter must not flush everything else
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = value
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._items.popitem(last=False)
+                    self._bytes -= len(evicted)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._items), 'bytes': self._bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+fragment_cache = FragmentCache()
+
+
+# ─── Fragments ───────────────────────────────────────────────────────
+def post_card(thread, post, is_leader=False):
+    """One rendered post card (_post.html). Leaders' cards carry the "Add to Group" button."""
+    show_add = is_leader and post.user_id != thread.leader_id
+    key = ('post', post.id, post.updated_at or post.created_at, show_add)
+    return Markup(fragment_cache.get_or_render(
+        key, lambda: current_app.jinja_env.get_template('_post.html')
+        .render(thread=thread, post=post, show_add=show_add)))
+
+
+def post_cards(thread, posts, is_leader=False):
+    return Markup(''.join(post_card(thread, post, is_leader) for post in posts))
+
+
+def document_html(document):
+    """A document's stored (sanitized) content as markup, cached per version."""
+    key = ('document', document.id, document.version)
+    return Markup(fragment_cache.get_or_render(key, lambda: document.content or ''))
+
+
+def sanitize_existing(batch_size=500) -> dict:
+    """Re-save rows written before write-time sanitizing.
+
+    Only rows whose sanitized content differs are written: assigning
+    Document.content bumps the version (and rewrites chunks) even when
+    nothing changed.
+    """
+    changed = {'posts': 0, 'documents': 0}
+    last_id = 0
+    while True:
+        posts = Post.query.filter(Post.id > last_id).order_by(Post.id).limit(batch_size).all()
+        if not posts:
+            break
+        for post in posts:
+            cleaned = sanitize.clean_html(post.content)
+            if cleaned != post.content:
+                post.content = cleaned
+                changed['posts'] += 1
+        db.session.commit()
+        last_id = posts[-1].id
+    for (document_id,) in db.session.query(Document.id).order_by(Document.id).all():
+        document = db.session.get(Document, document_id)
+        previous = document.content or ''
+        cleaned = sanitize.clean_html(previous)
+        if cleaned != previous:
+            document.content = cleaned
+            document.add_revision(None, 'Sanitized')   # snapshot
+            changed['documents'] += 1
+            db.session.commit()
+    return changed
+
+
+def init_app(app):
+    fragment_cache.max_bytes = app.config.get('FRAGMENT_CACHE_BYTES', fragment_cache.max_bytes)
+    app.jinja_env.globals['post_cards'] = post_cards
+
+    @app.cli.command('sanitize-content')
+    def sanitize_content_command():
+        """Sanitize posts and documents stored before write-time sanitizing."""
+        changed = sanitize_existing()
+        click.echo(f"Sanitized {changed['posts']} posts and {changed['documents']} documents.")
@@ -0,0 +1,167 @@
+# hierarchy.py
+# Nested threads: workspace → parts → chapters → scenes, to any depth.
+#
+# thread_closure holds every (ancestor, descendant, depth) pair, self
+# included, so:
+#   - a whole tree is one query (closure ⋈ threads ⋈ thread_activity), post
+#     counts included, however deep or wide it is;
+#   - ancestors of a thread are one indexed lookup (descendant_id, depth);
+#   - moving a subtree is two statements (unlink from the old ancestors,
+#     cross-join onto the new ones), whatever its size; the tree post counts
+#     and users' read counts above it move with it in the same transaction.
+# Threads.parent_thread_id stays the direct parent; `flask rebuild-thread-tree`
+# rebuilds the closure from it.
+
+import click
+
+import activity
+import schema
+from extensions import db
+from models import ReadMarker, Thread, ThreadActivity, ThreadClosure, touch_thread
+
+
+class HierarchyError(Exception):
+    """A move that would break the tree (cycle, missing thread)."""
+
+
+class Node:
+    """One thread in a fetched tree, with its counts and children (in id order)."""
+
+    __slots__ = ('thread', 'depth', 'post_count', 'tree_post_count', 'last_activity_at', 'unread', 'children')
+
+    def __init__(self, thread, depth, post_count, tree_post_count, last_activity_at, read_count):
+        self.thread = thread
+        self.depth = depth
+        self.post_count = post_count or 0
+        self.tree_post_count = tree_post_count or 0
+        self.last_activity_at = last_activity_at
+        self.unread = max(self.post_count - read_count, 0) if read_count is not None else 0
+        self.children = []
+
+    def walk(self):
+        """This node and everything below it, depth first (the order a tree is drawn in)."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+
+def tree(root_id, user_id=None):
+    """The thread root_id and everything below it as a Node tree, in one query.
+
+    With user_id, each node's unread count is filled in from read_markers
+    (a thread the user never opened counts every post as unread).
+    """
+    read = db.func.coalesce(ReadMarker.read_post_count, 0) if user_id is not None else db.null()
+    query = (db.session.query(Thread, ThreadClosure.depth, ThreadActivity.post_count,
+                              ThreadActivity.tree_post_count, ThreadActivity.last_activity_at, read)
+             .options(db.load_only(Thread.id, Thread.title, Thread.parent_thread_id, Thread.leader_id))
+             .join(ThreadClosure, ThreadClosure.descendant_id == Thread.id)
+             .outerjoin(ThreadActivity, ThreadActivity.thread_id == Thread.id)
+             .filter(ThreadClosure.ancestor_id == root_id)
+             .order_by(ThreadClosure.depth, Thread.id))
+    if user_id is not None:
+        query = query.outerjoin(ReadMarker, db.and_(ReadMarker.thread_id == Thread.id,
+                                                    ReadMarker.user_id == user_id))
+    nodes = {}
+    root = None
+    for thread, depth, *counts in query:
+        node = nodes[thread.id] = Node(thread, depth, *counts)
+        if depth == 0:
+            root = node
+        elif thread.parent_thread_id in nodes:   # parents come first: rows are in depth order
+            nodes[thread.parent_thread_id].children.append(node)
+    return root
+
+
+def ancestor_ids(thread_id, include_self=False) -> list:
+    """Ids from the top-level thread down to thread_id's parent (or thread_id itself)."""
+    query = (db.session.query(ThreadClosure.ancestor_id)
+             .filter(ThreadClosure.descendant_id == thread_id)
+             .order_by(ThreadClosure.depth.desc()))
+    if not include_self:
+        query = query.filter(ThreadClosure.depth > 0)
+    return [row.ancestor_id for row in query]
+
+
+def root_id(thread_id):
+    """The top-level thread (usually the workspace) above thread_id."""
+    ids = ancestor_ids(thread_id, include_self=True)
+    return ids[0] if ids else thread_id
+
+
+# ─── Moving subtrees ─────────────────────────────────────────────────
+def move_thread(thread_id, new_parent_id):
+    """Re-parent a thread together with everything below it. Commits.
+
+    new_parent_id None makes it top-level. Raises HierarchyError for a
+    missing thread or a move under itself.
+    """
+    thread = db.session.get(Thread, thread_id)
+    if thread is None:
+        raise HierarchyError('Thread not found.')
+    if new_parent_id is not None:
+        if db.session.get(Thread, new_parent_id) is None:
+            raise HierarchyError('New parent thread not found.')
+        inside = (db.session.query(ThreadClosure.depth)
+                  .filter(ThreadClosure.ancestor_id == thread_id, ThreadClosure.descendant_id == new_parent_id)
+                  .first())
+        if inside is not None:
+            raise HierarchyError('A thread cannot be moved under itself.')
+    old_parent_id = thread.parent_thread_id
+    if old_parent_id == new_parent_id:
+        return thread
+    old_ancestors = ancestor_ids(thread_id)
+
+    closure = ThreadClosure.__table__
+    subtree = db.select(closure.c.descendant_id).where(closure.c.ancestor_id == thread_id)
+    above = db.select(closure.c.ancestor_id).where(closure.c.descendant_id == thread_id, closure.c.depth > 0)
+    db.session.execute(closure.delete().where(closure.c.descendant_id.in_(subtree),
+                                              closure.c.ancestor_id.in_(above)))
+    if new_parent_id is not None:
+        upper, lower = closure.alias('upper'), closure.alias('lower')
+        db.session.execute(closure.insert().from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            db.select(upper.c.ancestor_id, lower.c.descendant_id, upper.c.depth + lower.c.depth + 1)
+            .select_from(upper.join(lower, db.true()))   # every new ancestor × every subtree thread
+            .where(upper.c.descendant_id == new_parent_id, lower.c.ancestor_id == thread_id)))
+
+    thread.parent_thread_id = new_parent_id
+    db.session.flush()
+    connection = db.session.connection()
+    touch_thread(connection, old_parent_id)   # both workspace pages list their sub-threads
+    touch_thread(connection, new_parent_id)
+    new_ancestors = ancestor_ids(thread_id)
+    activity.refresh_trees(old_ancestors + new_ancestors)
+    activity.move_read_counts(thread_id, old_ancestors, new_ancestors)   # unread counts above stay right
+    db.session.commit()
+    return thread
+
+
+# ─── Rebuild ─────────────────────────────────────────────────────────
+def rebuild():
+    """Recompute thread_closure from threads.parent_thread_id (repairs / old databases)."""
+    parents = dict(db.session.query(Thread.id, Thread.parent_thread_id))
+    rows = []
+    for thread_id in parents:
+        ancestor, depth, seen = thread_id, 0, set()
+        while ancestor is not None and ancestor not in seen:
+            rows.append({'ancestor_id': ancestor, 'descendant_id': thread_id, 'depth': depth})
+            seen.add(ancestor)
+            ancestor, depth = parents.get(ancestor), depth + 1
+    db.session.execute(db.delete(ThreadClosure))
+    if rows:
+        db.session.execute(db.insert(ThreadClosure), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def init_app(app):
+    schema.register_backfill('thread_closure', rebuild)   # `flask upgrade-db`
+
+    @app.cli.command('rebuild-thread-tree')
+    def rebuild_thread_tree_command():
+        """Rebuild thread_closure from threads.parent_thread_id, then the activity rollups."""
+        click.echo(f'Thread tree rebuilt: {rebuild()} closure rows.')
+        click.echo(f'Activity rebuilt for {activity.rebuild()} threads.')
@@ -0,0 +1,171 @@
+# instrumentation.py
+# Per-request SQL and timing instrumentation, exported at /metrics in the
+# Prometheus text format.
+#
+# Turned on with METRICS_ENABLED = True. When it is off nothing is hooked into
+# SQLAlchemy or the request cycle at all, so it costs nothing. When it is on:
+#   - every statement is counted and timed against the current request
+#   - a statement repeated N_PLUS_ONE_THRESHOLD+ times in one request is logged
+#     as a likely N+1
+#   - queries slower than SLOW_QUERY_MS and requests slower than SLOW_REQUEST_MS
+#     are logged
+#   - latency, query count and response size go into per-endpoint histograms
+# Metrics are per process; with several workers, scrape each one.
+
+import bisect
+import logging
+import threading
+import time
+from collections import Counter
+
+from flask import g, request, has_request_context, Response, abort
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by endpoint, Prometheus style."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}   # endpoint -> [bucket counts…, +Inf count, sum]
+
+    def observe(self, endpoint, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(endpoint)
+            if series is None:
+                series = self._series[endpoint] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for endpoint, series in sorted(snapshot.items()):
+            label = f'endpoint="{endpoint}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {series[-1]}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+        return lines
+
+
+class EndpointCounter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = Counter()
+
+    def inc(self, endpoint, amount=1):
+        with self._lock:
+            self._values[endpoint] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            snapshot = dict(self._values)
+        lines.extend(f'{self.name}{{endpoint="{endpoint}"}} {value}'
+                     for endpoint, value in sorted(snapshot.items()))
+        return lines
+
+
+request_latency = Histogram('plotforge_request_duration_seconds', 'Request latency by endpoint.', LATENCY_BUCKETS)
+request_queries = Histogram('plotforge_request_sql_queries', 'SQL statements per request by endpoint.', QUERY_BUCKETS)
+request_sql_time = Histogram('plotforge_request_sql_seconds', 'Time spent in SQL per request by endpoint.', LATENCY_BUCKETS)
+response_size = Histogram('plotforge_response_size_bytes', 'Response body size by endpoint.', SIZE_BUCKETS)
+slow_queries = EndpointCounter('plotforge_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.')
+n_plus_one = EndpointCounter('plotforge_n_plus_one_total', 'Requests that repeated one statement N_PLUS_ONE_THRESHOLD+ times.')
+METRICS = (request_latency, request_queries, request_sql_time, response_size, slow_queries, n_plus_one)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+# ─── Hooks ───────────────────────────────────────────────────────────
+def _install_sql_hooks(engine, slow_query_s):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if not has_request_context() or 'sql_count' not in g:
+            return
+        g.sql_count += 1
+        g.sql_time += elapsed
+        g.sql_statements[statement] += 1
+        if elapsed >= slow_query_s:
+            slow_queries.inc(_endpoint())
+            log.warning('slow query (%.1f ms) in %s: %s', elapsed * 1000, _endpoint(), statement)
+
+
+def init_app(app, db):
+    @app.route('/metrics')
+    def metrics():
+        if not app.config.get('METRICS_ENABLED'):
+            abort(404)
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    if not app.config.get('METRICS_ENABLED'):
+        return   # nothing hooked in: zero overhead
+
+    slow_query_s = app.config.get('SLOW_QUERY_MS', 100) / 1000
+    slow_request_s = app.config.get('SLOW_REQUEST_MS', 500) / 1000
+    repeat_threshold = app.config.get('N_PLUS_ONE_THRESHOLD', 5)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            _install_sql_hooks(engine, slow_query_s)
+
+    @app.before_request
+    def _start_request():
+        g.request_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+        g.sql_statements = Counter()
+
+    @app.after_request
+    def _finish_request(response):
+        if 'request_start' not in g or request.endpoint == 'metrics':
+            return response
+        elapsed = time.perf_counter() - g.request_start
+        endpoint = _endpoint()
+
+        request_latency.observe(endpoint, elapsed)
+        request_queries.observe(endpoint, g.sql_count)
+        request_sql_time.observe(endpoint, g.sql_time)
+        if not response.is_streamed:
+            response_size.observe(endpoint, response.calculate_content_length() or 0)
+
+        statement, repeats = (g.sql_statements.most_common(1) or [(None, 0)])[0]
+        if repeats >= repeat_threshold:
+            n_plus_one.inc(endpoint)
+            log.warning('possible N+1 in %s: statement ran %d times: %s', endpoint, repeats, statement)
+        if elapsed >= slow_request_s:
+            log.warning('slow request %s %s: %.1f ms, %d queries (%.1f ms SQL)', request.method,
+                        request.path, elapsed * 1000, g.sql_count, g.sql_time * 1000)
+        return response
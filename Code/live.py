@@ -0,0 +1,319 @@
+# live.py
+# Server-Sent Events for threads: new posts are pushed to everyone viewing the
+# thread instead of each reader reloading thread_detail.
+#
+#   post_in_thread ──publish──▶ backend ──▶ LiveHub ──▶ bounded queue per subscriber ──▶ SSE stream
+#
+# Backends are pluggable (LIVE_BACKEND config):
+#   'local'  – fan-out inside this process only (dev server, single worker)
+#   'broker' – every worker connects to a small relay process
+#              (`flask live-broker`) that re-broadcasts to all workers. It is a
+#              stand-in for Redis pub/sub and speaks multiprocessing.connection,
+#              authenticated with SECRET_KEY (refused while that is the shipped
+#              default). Messages are JSON: nothing received is ever unpickled.
+#
+# Slow clients can't pile up memory: each subscriber queue is bounded and a
+# subscriber that falls behind is cut off. Its browser reconnects with
+# Last-Event-ID and catches up from the database.
+
+import json
+import logging
+import queue
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+import click
+
+from config import DefaultConfig
+
+log = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100        # events buffered per subscriber before it is dropped
+HEARTBEAT_SECONDS = 15  # keep-alive comment interval for idle streams
+RETRY_MS = 3000         # browser reconnect delay sent with every stream
+MAX_MESSAGE_BYTES = 4 * 1024 * 1024   # larger broker messages are dropped (and the sender disconnected)
+
+_OVERFLOW = object()    # queue sentinel: subscriber fell too far behind
+
+
+class Subscription:
+    def __init__(self, hub, channel, maxsize):
+        self.hub = hub
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout):
+        """Next message, None on timeout, or _OVERFLOW if we were cut off."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class LiveHub:
+    """Channel → subscribers fan-out. Thread-safe; one per process."""
+
+    def __init__(self, backend=None, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._channels = {}
+        self.backend = None
+        self.set_backend(backend or LocalBackend())
+
+    def set_backend(self, backend):
+        if self.backend is not None:
+            self.backend.stop()
+        self.backend = backend
+        backend.start(self._deliver)
+
+    def subscribe(self, channel) -> Subscription:
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, message):
+        """Send message (a picklable dict) to every subscriber of channel, in every worker."""
+        self.backend.publish(channel, message)
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._channels.get(channel, ()))
+            return sum(len(s) for s in self._channels.values())
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # Too slow: stop feeding it and let the client resume from the DB
+                self.unsubscribe(subscription)
+                _force_put(subscription.queue, _OVERFLOW)
+
+
+def _force_put(q, item):
+    """Make room for item by discarding the oldest entries."""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+
+# ─── Backends ────────────────────────────────────────────────────────
+def _encode(channel, message):
+    return json.dumps([channel, message], separators=(',', ':')).encode()
+
+
+def _decode(data):
+    """(channel, message) from broker bytes; ValueError, TypeError or KeyError if malformed."""
+    channel, message = json.loads(data)
+    if not isinstance(channel, str) or not isinstance(message, dict):
+        raise ValueError('malformed live message')
+    # stream() and the SSE framing rely on these; check them here, not per subscriber
+    if (not isinstance(message['id'], int) or not isinstance(message['event'], str)
+            or not isinstance(message['data'], str)):
+        raise ValueError('malformed live message')
+    return channel, message
+
+
+class LocalBackend:
+    """In-process only: publish goes straight to this process's subscribers."""
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def stop(self):
+        pass
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+
+class BrokerBackend:
+    """Relay through `flask live-broker` so every worker process sees every publish.
+
+    The broker echoes messages back to the sender too, so local subscribers are
+    fed by the same path. If the broker is unreachable, messages are delivered
+    locally only and the connection is retried in the background.
+    """
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self._conn = None
+        self._send_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self, deliver):
+        self._deliver = deliver
+        threading.Thread(target=self._reader, name='live-broker-reader', daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._conn is not None:
+            self._conn.close()
+
+    def publish(self, channel, message):
+        with self._send_lock:
+            if self._conn is not None:
+                try:
+                    self._conn.send_bytes(_encode(channel, message))
+                    return
+                except (OSError, EOFError):
+                    self._conn = None
+        log.warning('live broker unavailable; delivering %s locally only', channel)
+        self._deliver(channel, message)
+
+    def _reader(self):
+        while not self._stopped.is_set():
+            try:
+                conn = Client(self.address, authkey=self.authkey)
+            except OSError:
+                time.sleep(1)
+                continue
+            with self._send_lock:
+                self._conn = conn
+            try:
+                while True:
+                    try:
+                        channel, message = _decode(conn.recv_bytes(MAX_MESSAGE_BYTES))
+                    except (ValueError, TypeError, KeyError):   # e.g. b'5', or a dict without an id
+                        log.warning('live broker sent a malformed message; dropped')
+                        continue
+                    self._deliver(channel, message)
+            except (OSError, EOFError):
+                with self._send_lock:
+                    self._conn = None
+                time.sleep(1)
+
+
+def run_broker(address, authkey):
+    """Blocking relay: every message received from one worker goes to all workers."""
+    listener = Listener(address, authkey=authkey)
+    clients = set()
+    lock = threading.Lock()
+    send_lock = threading.Lock()   # Connection.send isn't safe from several threads at once
+
+    def serve(conn):
+        try:
+            while True:
+                message = conn.recv_bytes(MAX_MESSAGE_BYTES)   # relayed as bytes, never decoded here
+                with lock:
+                    targets = list(clients)
+                for target in targets:
+                    try:
+                        with send_lock:
+                            target.send_bytes(message)
+                    except (OSError, EOFError):
+                        with lock:
+                            clients.discard(target)
+        except (OSError, EOFError):
+            pass
+        finally:
+            with lock:
+                clients.discard(conn)
+            conn.close()
+
+    log.info('live broker listening on %s:%s', *address)
+    while True:
+        try:
+            conn = listener.accept()
+        except (AuthenticationError, OSError, EOFError) as exc:
+            log.warning('live broker: rejected a connection (%s)', exc)
+            continue
+        with lock:
+            clients.add(conn)
+        threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+
+# ─── SSE framing ─────────────────────────────────────────────────────
+def sse_event(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.extend(f'data: {line}' for line in data.splitlines() or [''])
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream(subscription, backlog=(), heartbeat=HEARTBEAT_SECONDS, last_id=0, data_key='data'):
+    """Generator of SSE frames: backlog first, then live messages, with heartbeats.
+
+    backlog / live messages are dicts with 'id', 'event' and 'data'. A message
+    may carry other renderings under other keys (e.g. 'leader_data'); data_key
+    picks which one this subscriber gets, falling back to 'data'. Anything at
+    or below the highest id already sent is skipped, so a message that is in
+    both the backlog and the live queue goes out once.
+    """
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        for message in backlog:
+            last_id = max(last_id, message['id'])
+            yield sse_event(message.get(data_key, message['data']), message['event'], message['id'])
+        while True:
+            message = subscription.get(timeout=heartbeat)
+            if message is None:
+                yield ': keepalive\n\n'
+            elif message is _OVERFLOW:
+                return   # client reconnects with Last-Event-ID and resumes
+            elif message['id'] > last_id:
+                last_id = message['id']
+                yield sse_event(message.get(data_key, message['data']), message['event'], message['id'])
+    finally:
+        subscription.close()
+
+
+hub = LiveHub()
+
+
+def broker_authkey(config):
+    """SECRET_KEY as the broker's shared secret; refuses the shipped default."""
+    if config['SECRET_KEY'] == DefaultConfig.SECRET_KEY:
+        raise RuntimeError("LIVE_BACKEND = 'broker' needs a real SECRET_KEY: with the default one "
+                           'anyone who can reach the broker port can inject events')
+    return config['SECRET_KEY'].encode()
+
+
+def backend_from_config(config):
+    if config['LIVE_BACKEND'] == 'broker':
+        address = (config['LIVE_BROKER_HOST'], config['LIVE_BROKER_PORT'])
+        return BrokerBackend(address, broker_authkey(config))
+    return LocalBackend()
+
+
+def init_app(app):
+    if app.config['LIVE_BACKEND'] == 'broker':
+        hub.set_backend(backend_from_config(app.config))
+    hub.queue_size = app.config['LIVE_QUEUE_SIZE']
+
+    @app.cli.command('live-broker')
+    def live_broker_command():
+        """Run the pub/sub relay used when LIVE_BACKEND = 'broker'."""
+        address = (app.config['LIVE_BROKER_HOST'], app.config['LIVE_BROKER_PORT'])
+        try:
+            authkey = broker_authkey(app.config)
+        except RuntimeError as exc:
+            raise click.ClickException(str(exc))
+        click.echo(f'Live broker listening on {address[0]}:{address[1]}')
+        run_broker(address, authkey)
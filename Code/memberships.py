@@ -0,0 +1,141 @@
+# memberships.py
+# Joining / leaving groups and cheap "am I a member?" checks.
+#
+# Thread.member_count is maintained here. Capacity is enforced with a single
+# conditional UPDATE (… WHERE member_count < max_members), so two concurrent
+# joins can never overfill a group.
+#
+# The current user's {thread_id: role} map is read once and cached in the Flask
+# session, stamped with User.membership_version. Every join/leave bumps that
+# version, and current_user is reloaded on each request anyway, so a stale map
+# is noticed without any extra query – on any worker process.
+
+import click
+from flask import g, session
+from flask_login import current_user
+from sqlalchemy import update, func
+from sqlalchemy.exc import IntegrityError
+
+import schema
+from extensions import db
+from models import Thread, GroupMembership, User
+
+SESSION_KEY = '_memberships'
+SESSION_MAX_ENTRIES = 200   # bigger maps are cached per request only (cookie size)
+
+
+class MembershipError(Exception):
+    """Base class for join/leave failures the UI reports back to the user."""
+
+
+class GroupFullError(MembershipError):
+    pass
+
+
+class AlreadyMemberError(MembershipError):
+    pass
+
+
+class NotMemberError(MembershipError):
+    pass
+
+
+# ─── Join / leave ────────────────────────────────────────────────────
+def bump_membership_version(user_id):
+    db.session.execute(update(User)
+                       .where(User.id == user_id)
+                       .values(membership_version=User.membership_version + 1))
+
+
+def add_member(thread_id, user_id, role='member'):
+    """Add user to thread if there is a free seat. Commits; raises MembershipError."""
+    if GroupMembership.query.filter_by(user_id=user_id, thread_id=thread_id).first():
+        raise AlreadyMemberError('User is already a member.')
+
+    claimed = db.session.execute(
+        update(Thread)
+        .where(Thread.id == thread_id, Thread.member_count < Thread.max_members)
+        .values(member_count=Thread.member_count + 1)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        raise GroupFullError('Group is full.')
+
+    db.session.add(GroupMembership(user_id=user_id, thread_id=thread_id, role=role))
+    bump_membership_version(user_id)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Lost a race with an identical join – the seat claim rolls back too
+        db.session.rollback()
+        raise AlreadyMemberError('User is already a member.')
+
+
+def remove_member(thread_id, user_id):
+    """Remove user from thread and free their seat. Commits; raises NotMemberError."""
+    deleted = (GroupMembership.query
+               .filter_by(user_id=user_id, thread_id=thread_id)
+               .delete(synchronize_session=False))
+    if not deleted:
+        db.session.rollback()
+        raise NotMemberError('User is not a member.')
+
+    db.session.execute(update(Thread)
+                       .where(Thread.id == thread_id)
+                       .values(member_count=Thread.member_count - 1))
+    bump_membership_version(user_id)
+    db.session.commit()
+
+
+def recount_members():
+    """Recompute every Thread.member_count from group_memberships (repairs / old databases)."""
+    counts = (db.session.query(func.count(GroupMembership.id))
+              .filter(GroupMembership.thread_id == Thread.id)
+              .scalar_subquery())
+    db.session.execute(update(Thread).values(member_count=counts))
+    db.session.commit()
+
+
+# ─── Cached role map for the current user ────────────────────────────
+def membership_roles() -> dict:
+    """{thread_id: role} for current_user – at most one query per membership change."""
+    if not current_user.is_authenticated:
+        return {}
+    cached_for_request = g.get('membership_roles')
+    if cached_for_request and cached_for_request[0] == current_user.id:
+        return cached_for_request[1]
+
+    version = current_user.membership_version or 0
+    cached = session.get(SESSION_KEY)
+    if cached and cached.get('user_id') == current_user.id and cached.get('version') == version:
+        roles = {thread_id: role for thread_id, role in cached['roles']}
+    else:
+        roles = dict(db.session.query(GroupMembership.thread_id, GroupMembership.role)
+                     .filter(GroupMembership.user_id == current_user.id).all())
+        if len(roles) <= SESSION_MAX_ENTRIES:
+            session[SESSION_KEY] = {'user_id': current_user.id, 'version': version,
+                                    'roles': [[thread_id, role] for thread_id, role in roles.items()]}
+        else:
+            session.pop(SESSION_KEY, None)
+
+    g.membership_roles = (current_user.id, roles)
+    return roles
+
+
+def is_member(thread_id) -> bool:
+    return thread_id in membership_roles()
+
+
+def role_in(thread_id):
+    """'leader' / 'member' / None for the current user."""
+    return membership_roles().get(thread_id)
+
+
+def init_app(app):
+    schema.register_backfill(('threads', 'member_count'), recount_members)   # `flask upgrade-db`
+
+    @app.cli.command('recount-members')
+    def recount_members_command():
+        """Rebuild threads.member_count from group_memberships."""
+        recount_members()
+        click.echo('Member counts rebuilt.')
@@ -5,10 +5,13 @@
 
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-import json  # used for JSON columns (boundaries, revision history)
+import json  # used for JSON columns (boundaries)
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
+import chunking
+import deltas
+import sanitize
 from extensions import db   # ← Changed to import from extensions.py (breaks circular reference)
 
 ###################################################
@@ -28,6 +31,7 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, nullable=True)
+    membership_version = db.Column(db.Integer, nullable=False, default=0)  # bumped on join/leave (memberships.py)
 
     owned_threads = db.relationship('Thread', back_populates='leader', foreign_keys='Thread.leader_id')
     memberships = db.relationship('GroupMembership', back_populates='user', cascade='all, delete-orphan')
@@ -56,7 +60,7 @@ class GroupMembership(db.Model):
     id = db.Column(db.Integer, primary_key=True)
 
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    thread_id = db.Column(db.Integer, db.ForeignKey('threads.id'), nullable=False)
+    thread_id = db.Column(db.Integer, db.ForeignKey('threads.id'), nullable=False, index=True)
 
     role = db.Column(db.String(20), default='member')
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -80,31 +84,309 @@ class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     thread_id = db.Column(db.Integer, db.ForeignKey('threads.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text, default='')
+    # Body of inline documents. Deferred: listing pages never load it; read it through .content
+    _content = db.deferred(db.Column('content', db.Text, default=''))
+    storage = db.Column(db.String(10), nullable=False, default='inline')   # 'inline' or 'chunked' (document_chunks)
     type = db.Column(db.String(50), default='custom')
     chapter_num = db.Column(db.Integer, nullable=True)
-    revision_history = db.Column(db.Text, default='[]')
+    associated_thread_id = db.Column(db.Integer, db.ForeignKey('threads.id'), nullable=True)  # e.g. the "Chapter 1" sub-thread
     last_updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1)   # bumped on every UPDATE (optimistic locking)
+    collab_rev = db.Column(db.Integer, nullable=False, default=0)   # last live-edit op saved into content (collab.py)
+
+    thread = db.relationship('Thread', back_populates='documents', foreign_keys=[thread_id])
+    associated_thread = db.relationship('Thread', foreign_keys=[associated_thread_id])
+    revisions = db.relationship('DocumentRevision', back_populates='document',
+                                cascade='all, delete-orphan', lazy='dynamic')
+    chunks = db.relationship('DocumentChunk', back_populates='document', order_by='DocumentChunk.position',
+                             cascade='all, delete-orphan')
+
+    CHUNKED_TYPES = ('chapter_text',)   # stored paragraph by paragraph
+
+    # UPDATEs carry "WHERE version = <loaded version>"; a concurrent writer makes
+    # the flush raise StaleDataError instead of silently overwriting.
+    __mapper_args__ = {'version_id_col': version}
+
+    def __init__(self, **kwargs):
+        content = kwargs.pop('content', None)
+        super().__init__(**kwargs)
+        if self.storage is None:
+            self.storage = 'chunked' if self.type in self.CHUNKED_TYPES else 'inline'
+        if content is not None:
+            self.content = content   # needs storage decided first
+
+    # ─── Content (inline column or paragraph chunks) ─────────────────
+    @property
+    def content(self):
+        if self.storage == 'chunked':
+            return ''.join(chunk.content for chunk in self.chunks)
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        value = sanitize.clean_html(value)   # sanitized once, on write
+        if self.storage == 'chunked':
+            self._store_blocks(chunking.split_blocks(value))
+            self.last_updated = datetime.utcnow()   # chunk-only changes still bump version
+        else:
+            self._content = value
+
+    def _store_blocks(self, blocks):
+        """Make self.chunks hold blocks, rewriting only the chunks that changed."""
+        existing = list(self.chunks)
+        old = [chunk.content for chunk in existing]
+        prefix = 0
+        while prefix < min(len(old), len(blocks)) and old[prefix] == blocks[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < min(len(old), len(blocks)) - prefix
+               and old[len(old) - 1 - suffix] == blocks[len(blocks) - 1 - suffix]):
+            suffix += 1
+        changed_old = existing[prefix:len(existing) - suffix]
+        changed_new = blocks[prefix:len(blocks) - suffix]
+
+        middle = []
+        for chunk, text in zip(changed_old, changed_new):
+            if chunk.content != text:
+                chunk.content, chunk.length = text, len(text)
+            middle.append(chunk)
+        added = changed_new[len(changed_old):]
+        if added:
+            low = middle[-1].position if middle else (existing[prefix - 1].position if prefix else None)
+            high = existing[len(existing) - suffix].position if suffix else None
+            positions = chunking.positions_between(low, high, len(added)) or [0] * len(added)
+            middle.extend(DocumentChunk(position=p, content=text, length=len(text))
+                          for p, text in zip(positions, added))
+        final = existing[:prefix] + middle + existing[len(existing) - suffix:]
+        if any(a.position >= b.position for a, b in zip(final, final[1:])):
+            for n, chunk in enumerate(final):   # out of room between neighbours: renumber
+                chunk.position = (n + 1) * chunking.POSITION_GAP
+        self.chunks = final   # chunks no longer listed are deleted (delete-orphan)
+
+    def stored_length(self):
+        """Length of the current content without loading chunk bodies."""
+        if self.storage != 'chunked':
+            return len(self._content or '')
+        return (db.session.query(db.func.coalesce(db.func.sum(DocumentChunk.length), 0))
+                .filter(DocumentChunk.document_id == self.id).scalar())
+
+    def replace_chunk(self, chunk, html):
+        """Replace one section; html may hold several paragraphs (or none, to delete it).
+
+        Only that chunk and the document row are written. Returns the delta for
+        the whole document (for the revision store) and the resulting chunks.
+        """
+        blocks = chunking.split_blocks(sanitize.clean_html(html))
+        before, after = (db.session.query(
+            db.func.coalesce(db.func.sum(db.case((DocumentChunk.position < chunk.position, DocumentChunk.length),
+                                                 else_=0)), 0),
+            db.func.coalesce(db.func.sum(db.case((DocumentChunk.position > chunk.position, DocumentChunk.length),
+                                                 else_=0)), 0))
+            .filter(DocumentChunk.document_id == self.id).one())
+        ops = deltas.embed_delta(deltas.make_delta(chunk.content, ''.join(blocks)), before, after)
+
+        if not blocks:
+            db.session.delete(chunk)
+            result = []
+        else:
+            chunk.content, chunk.length = blocks[0], len(blocks[0])
+            result = [chunk]
+            if len(blocks) > 1:
+                following = (db.session.query(db.func.min(DocumentChunk.position))
+                             .filter(DocumentChunk.document_id == self.id,
+                                     DocumentChunk.position > chunk.position).scalar())
+                positions = chunking.positions_between(chunk.position, following, len(blocks) - 1)
+                if positions is None:
+                    self._spread_positions()
+                    following = (db.session.query(db.func.min(DocumentChunk.position))
+                                 .filter(DocumentChunk.document_id == self.id,
+                                         DocumentChunk.position > chunk.position).scalar())
+                    positions = chunking.positions_between(chunk.position, following, len(blocks) - 1)
+                for position, text in zip(positions, blocks[1:]):
+                    new_chunk = DocumentChunk(document_id=self.id, position=position, content=text,
+                                              length=len(text))
+                    db.session.add(new_chunk)
+                    result.append(new_chunk)
+        self.last_updated = datetime.utcnow()
+        return ops, result
+
+    def _spread_positions(self):
+        """Renumber this document's chunk positions POSITION_GAP apart (no bodies loaded)."""
+        rows = (db.session.query(DocumentChunk.id)
+                .filter(DocumentChunk.document_id == self.id)
+                .order_by(DocumentChunk.position).all())
+        db.session.execute(db.update(DocumentChunk), [
+            {'id': row.id, 'position': (n + 1) * chunking.POSITION_GAP} for n, row in enumerate(rows)])
+        db.session.expire_all()
+
+    def convert_to_chunks(self):
+        """Move an inline document's body into document_chunks."""
+        if self.storage == 'chunked':
+            return
+        text = self._content
+        self.storage = 'chunked'
+        self._content = None
+        self.content = text
+
+    def apply_patch(self, ops):
+        """Apply a client delta (see deltas.py) to the content.
+
+        Returns (old content, ops that produce the stored content) – the ops
+        differ from the client's only when sanitizing changed the result, and
+        are then a plain replace-everything (never a re-diff of the document,
+        whose cost a crafted patch could otherwise blow up).
+        """
+        previous = self.content or ''
+        patched = deltas.apply_delta(previous, ops)
+        self.content = patched
+        if self.content != patched:
+            ops = deltas.replace_delta(previous, self.content)
+        return previous, ops
+
+    # ─── Revision history (stored in document_revisions) ─────────────
+    def add_revision(self, user_id, summary, delta=None):
+        """Append a revision for the current content.
+
+        Pass the delta ops from the previous revision (patch, section and live
+        saves have them) to store just those; without them (or every
+        SNAPSHOT_EVERY revisions) a full compressed snapshot is written instead.
+        Nothing is diffed here and nothing older is read or rewritten, so a
+        section save only reads the whole chapter for snapshots.
+        """
+        seq = (db.session.query(db.func.max(DocumentRevision.seq))
+               .filter(DocumentRevision.document_id == self.id).scalar() or 0) + 1
+        if delta is None or seq % DocumentRevision.SNAPSHOT_EVERY == 1:
+            text = self.content or ''
+            is_snapshot, payload, length = True, deltas.pack_text(text), len(text)
+        else:
+            is_snapshot, payload, length = False, deltas.pack_delta(delta), self.stored_length()
+        revision = DocumentRevision(document=self, seq=seq, user_id=user_id,
+                                    summary=(summary or '')[:200], is_snapshot=is_snapshot,
+                                    payload=payload, content_length=length)
+        db.session.add(revision)
+        return revision
+
+    def get_revision_history(self, before_seq=None, limit=20):
+        """One page of revision metadata, newest first (payloads are not loaded)."""
+        query = self.revisions.order_by(DocumentRevision.seq.desc())
+        if before_seq is not None:
+            query = query.filter(DocumentRevision.seq < before_seq)
+        return query.limit(limit).all()
+
+    def get_version(self, seq):
+        """Rebuild the document content as of revision `seq` (None if it doesn't exist)."""
+        snapshot = (self.revisions
+                    .options(db.undefer(DocumentRevision.payload))
+                    .filter(DocumentRevision.seq <= seq, DocumentRevision.is_snapshot.is_(True))
+                    .order_by(DocumentRevision.seq.desc())
+                    .first())
+        if snapshot is None:
+            return None
+        text = deltas.unpack_text(snapshot.payload)
+        chain = (self.revisions
+                 .options(db.undefer(DocumentRevision.payload))
+                 .filter(DocumentRevision.seq > snapshot.seq, DocumentRevision.seq <= seq)
+                 .order_by(DocumentRevision.seq)
+                 .all())
+        for revision in chain:
+            text = deltas.apply_delta(text, deltas.unpack_delta(revision.payload))
+        reached = chain[-1].seq if chain else snapshot.seq
+        return text if reached == seq else None
 
-    thread = db.relationship('Thread', back_populates='documents')
+    def __repr__(self):
+        return f'<Document {self.title} type={self.type} thread={self.thread_id}>'
 
-    def get_revision_history(self):
-        try:
-            return json.loads(self.revision_history)
-        except:
-            return []
+# ────────────────────────────────────────────────
+# DOCUMENT REVISION MODEL
+# Append-only history for a Document. Every SNAPSHOT_EVERY-th revision holds
+# the full (zlib-compressed) content; the rest hold a compressed delta against
+# the revision before them. See deltas.py for the format.
+# ────────────────────────────────────────────────
+class DocumentRevision(db.Model):
+    __tablename__ = 'document_revisions'
+
+    SNAPSHOT_EVERY = 25
 
-    def add_revision(self, user_id, summary):
-        history = self.get_revision_history()
-        history.append({
-            'user_id': user_id,
-            'timestamp': datetime.utcnow().isoformat(),
-            'summary': summary[:200]
-        })
-        self.revision_history = json.dumps(history)
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)          # 1, 2, 3… per document
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    summary = db.Column(db.String(200), default='')
+    is_snapshot = db.Column(db.Boolean, default=False, nullable=False)
+    content_length = db.Column(db.Integer, default=0)    # length of the rebuilt text
+    payload = db.deferred(db.Column(db.LargeBinary, nullable=False))   # history pages list metadata only
+
+    document = db.relationship('Document', back_populates='revisions')
+    user = db.relationship('User')
+
+    __table_args__ = (
+        db.UniqueConstraint('document_id', 'seq', name='unique_document_revision'),
+        db.Index('ix_document_revisions_document_timestamp', 'document_id', 'timestamp'),
+    )
+
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'user_id': self.user_id,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'summary': self.summary,
+            'is_snapshot': self.is_snapshot,
+            'content_length': self.content_length,
+        }
 
     def __repr__(self):
-        return f'<Document {self.title} type={self.type} thread={self.thread_id}>'
+        return f'<DocumentRevision doc={self.document_id} seq={self.seq} snapshot={self.is_snapshot}>'
+
+
+# ────────────────────────────────────────────────
+# DOCUMENT CHUNK
+# One top-level block (paragraph, heading, …) of a chunked document, in
+# `position` order. Positions are spaced apart so a new paragraph can go
+# between two others without renumbering. See chunking.py.
+# ────────────────────────────────────────────────
+class DocumentChunk(db.Model):
+    __tablename__ = 'document_chunks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False, default='')
+    length = db.Column(db.Integer, nullable=False, default=0)   # len(content), summed for offsets
+
+    document = db.relationship('Document', back_populates='chunks')
+
+    __table_args__ = (db.Index('ix_document_chunks_document_position', 'document_id', 'position'),)
+
+    def to_dict(self, with_content=False):
+        data = {'id': self.id, 'position': self.position, 'length': self.length}
+        if with_content:
+            data['content'] = self.content
+        return data
+
+
+# ────────────────────────────────────────────────
+# DOCUMENT OP (live-edit operation log)
+# Append-only log of the ops accepted in a collaborative editing session
+# (collab.py), written before the op is acknowledged. Ops up to
+# Document.collab_rev are in the stored content and are deleted in the same
+# commit that saves them; anything left after a crash is replayed.
+# ────────────────────────────────────────────────
+class DocumentOp(db.Model):
+    __tablename__ = 'document_ops'
+
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=False)
+    rev = db.Column(db.Integer, nullable=False)           # session op number, continues across sessions
+    client_id = db.Column(db.String(32), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    payload = db.Column(db.LargeBinary, nullable=False)   # deltas.pack_delta, against the text at rev - 1
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('document_id', 'rev', name='unique_document_op'),)
+
+    def __repr__(self):
+        return f'<DocumentOp doc={self.document_id} rev={self.rev}>'
 
 # ────────────────────────────────────────────────
 # THREAD MODEL
@@ -118,9 +400,13 @@ class Thread(db.Model):
     is_proposal = db.Column(db.Boolean, default=True)
     is_private_workspace = db.Column(db.Boolean, default=False, nullable=False)
     leader_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    parent_thread_id = db.Column(db.Integer, db.ForeignKey('threads.id'), nullable=True, index=True)  # sub-threads of a workspace
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='open')
     max_members = db.Column(db.Integer, default=15)
+    member_count = db.Column(db.Integer, nullable=False, default=0)   # maintained by memberships.py
+    # Last time anything shown on this thread's pages changed (conditional GET validator)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     genre_id          = db.Column(db.Integer, db.ForeignKey('list_boundary_options.id'), nullable=True)
     political_id      = db.Column(db.Integer, db.ForeignKey('list_boundary_options.id'), nullable=True)
     violence_id       = db.Column(db.Integer, db.ForeignKey('list_boundary_options.id'), nullable=True)
@@ -131,7 +417,8 @@ class Thread(db.Model):
     leader = db.relationship('User', back_populates='owned_threads', foreign_keys=[leader_id])
     memberships = db.relationship('GroupMembership', back_populates='thread', cascade='all, delete-orphan')
     posts = db.relationship('Post', back_populates='thread', cascade='all, delete-orphan', lazy='dynamic')
-    documents = db.relationship('Document', back_populates='thread', cascade='all, delete-orphan')
+    documents = db.relationship('Document', back_populates='thread', cascade='all, delete-orphan',
+                                foreign_keys='Document.thread_id')
     genre     = db.relationship('ListBoundaryOption', foreign_keys=[genre_id])
     political = db.relationship('ListBoundaryOption', foreign_keys=[political_id])
     violence  = db.relationship('ListBoundaryOption', foreign_keys=[violence_id])
@@ -139,6 +426,15 @@ class Thread(db.Model):
     style     = db.relationship('ListBoundaryOption', foreign_keys=[style_id])
     audience  = db.relationship('ListBoundaryOption', foreign_keys=[audience_id])
 
+    # Proposal discovery (discovery.py): equality filters first, then the
+    # (created_at, id) keyset order, so every boundary filter is a range scan.
+    __table_args__ = (
+        db.Index('ix_threads_discovery', 'is_proposal', 'status', 'created_at', 'id'),
+        db.Index('ix_threads_proposal_changed', 'is_proposal', 'changed_at'),
+        *(db.Index(f'ix_threads_discovery_{name}', f'{name}_id', 'is_proposal', 'status', 'created_at', 'id')
+          for name in ('genre', 'political', 'violence', 'sex', 'style', 'audience')),
+    )
+
     def get_boundaries(self):
         try:
             return json.loads(self.boundaries)
@@ -168,9 +464,73 @@ class Post(db.Model):
     thread = db.relationship('Thread', back_populates='posts')
     author = db.relationship('User', backref='posts')
 
+    # Backs the keyset-paginated feed in feed.py: (thread, created_at, id) range scans
+    __table_args__ = (db.Index('ix_posts_thread_created_id', 'thread_id', 'created_at', 'id'),)
+
+    @db.validates('content')
+    def _clean_content(self, key, value):
+        return sanitize.clean_html(value)   # sanitized once, on write
+
     def __repr__(self):
         return f'<Post by user {self.user_id} in thread {self.thread_id}>'
 
+# ────────────────────────────────────────────────
+# THREAD CLOSURE (hierarchy, see hierarchy.py)
+# One row per (ancestor, descendant) pair, self included at depth 0, so a
+# whole subtree or every ancestor is one indexed lookup at any depth.
+# Threads.parent_thread_id stays the source of truth for the direct parent;
+# rows are added by the Thread insert event below and rewritten by
+# hierarchy.move_thread.
+# ────────────────────────────────────────────────
+class ThreadClosure(db.Model):
+    __tablename__ = 'thread_closure'
+
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('threads.id'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('threads.id'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.Index('ix_thread_closure_descendant_depth', 'descendant_id', 'depth'),)
+
+    def __repr__(self):
+        return f'<ThreadClosure {self.ancestor_id}→{self.descendant_id} depth={self.depth}>'
+
+# ────────────────────────────────────────────────
+# THREAD ACTIVITY (materialized summary, see activity.py)
+# One row per thread, kept current by the mapper events at the bottom of this
+# file in the same flush as the change. The tree_* columns also count every
+# thread below it (thread_closure), so a workspace row covers the whole workspace.
+# Member counts stay on Thread.member_count (memberships.py).
+# ────────────────────────────────────────────────
+class ThreadActivity(db.Model):
+    __tablename__ = 'thread_activity'
+
+    thread_id = db.Column(db.Integer, db.ForeignKey('threads.id'), primary_key=True)
+    post_count = db.Column(db.Integer, nullable=False, default=0)
+    last_post_at = db.Column(db.DateTime, nullable=True)
+    last_document_edit_at = db.Column(db.DateTime, nullable=True)
+    tree_post_count = db.Column(db.Integer, nullable=False, default=0)   # this thread + all threads below it
+    last_activity_at = db.Column(db.DateTime, nullable=True)             # newest post or edit in the tree
+
+    def __repr__(self):
+        return f'<ThreadActivity thread={self.thread_id} posts={self.post_count}/{self.tree_post_count}>'
+
+# ────────────────────────────────────────────────
+# READ MARKER
+# How many of a thread's posts a user had seen when they last opened it.
+# Unread = ThreadActivity count − read count, so no per-post read rows.
+# ────────────────────────────────────────────────
+class ReadMarker(db.Model):
+    __tablename__ = 'read_markers'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    thread_id = db.Column(db.Integer, db.ForeignKey('threads.id'), primary_key=True)
+    read_post_count = db.Column(db.Integer, nullable=False, default=0)   # vs ThreadActivity.post_count
+    read_tree_count = db.Column(db.Integer, nullable=False, default=0)   # vs ThreadActivity.tree_post_count
+    read_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<ReadMarker user={self.user_id} thread={self.thread_id} read={self.read_post_count}>'
+
 ###################################################
 ################# List Tables #####################
 ###################################################
@@ -194,9 +554,208 @@ class ListBoundaryOption(db.Model):
     def __repr__(self):
         return f'<BoundaryOption {self.option_text}>'
 
+###################################################
+################# AI Jobs #########################
+###################################################
+
+# ────────────────────────────────────────────────
+# AI JOB
+# One requested AI call (summary, continuation, canon check). Requests only
+# insert a row; worker processes (ai_jobs.py) claim, run and complete them.
+# prompt_hash identifies identical prompts for batching and the result cache.
+# ────────────────────────────────────────────────
+class AiJob(db.Model):
+    __tablename__ = 'ai_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id'), nullable=True)
+    kind = db.Column(db.String(30), nullable=False)               # 'summary', 'continuation', 'canon_check'
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued → running → done / failed
+    prompt = db.deferred(db.Column(db.Text, nullable=False))   # only workers read it
+    prompt_hash = db.Column(db.String(64), nullable=False)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.String(500), nullable=True)
+    cache_hit = db.Column(db.Boolean, nullable=False, default=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claim_token = db.Column(db.String(32), nullable=True)         # set by the worker that claimed it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    user = db.relationship('User')
+    document = db.relationship('Document')
+
+    __table_args__ = (
+        db.Index('ix_ai_jobs_status_kind_id', 'status', 'kind', 'id'),   # worker claim scan
+        db.Index('ix_ai_jobs_prompt_hash_status', 'prompt_hash', 'status'),
+    )
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'document_id': self.document_id,
+            'result': self.result,
+            'error': self.error,
+            'cache_hit': self.cache_hit,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<AiJob {self.id} {self.kind} {self.status}>'
+
+# ────────────────────────────────────────────────
+# AI RESULT (content-hash cache)
+# The answer for one prompt_hash; identical prompts are answered from here
+# without calling the provider again.
+# ────────────────────────────────────────────────
+class AiResult(db.Model):
+    __tablename__ = 'ai_results'
+
+    prompt_hash = db.Column(db.String(64), primary_key=True)
+    provider = db.Column(db.String(50), nullable=False)
+    model = db.Column(db.String(100), nullable=True)
+    result = db.Column(db.Text, nullable=False)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+
+# ────────────────────────────────────────────────
+# AI CALL LOG
+# One row per completed job: which provider answered, how long the call took,
+# token usage, and whether it was served from the result cache.
+# ────────────────────────────────────────────────
+class AiCallLog(db.Model):
+    __tablename__ = 'ai_call_logs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('ai_jobs.id'), nullable=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    kind = db.Column(db.String(30), nullable=False)
+    provider = db.Column(db.String(50), nullable=False)
+    model = db.Column(db.String(100), nullable=True)
+    prompt_hash = db.Column(db.String(64), nullable=False)
+    cache_hit = db.Column(db.Boolean, nullable=False, default=False)
+    batch_size = db.Column(db.Integer, nullable=False, default=1)   # prompts sent in the same provider call
+    latency_ms = db.Column(db.Float, nullable=False, default=0.0)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<AiCallLog job={self.job_id} {self.provider} {self.latency_ms:.0f}ms cache_hit={self.cache_hit}>'
+
+###################################################
+################# Change markers ##################
+###################################################
+
+# ────────────────────────────────────────────────
+# Bump Thread.changed_at (the thread and every thread above it) whenever
+# something rendered on its pages changes. One UPDATE inside the same flush,
+# so the marker is always committed together with the change.
+# ────────────────────────────────────────────────
+def touch_thread(connection, thread_id):
+    if thread_id is None:
+        return
+    threads = Thread.__table__
+    closure = ThreadClosure.__table__
+    ancestors = db.select(closure.c.ancestor_id).where(closure.c.descendant_id == thread_id)
+    connection.execute(threads.update()
+                       .where(db.or_(threads.c.id == thread_id, threads.c.id.in_(ancestors)))
+                       .values(changed_at=datetime.utcnow()))
+
+
+@db.event.listens_for(Post, 'after_insert')
+@db.event.listens_for(Post, 'after_update')
+@db.event.listens_for(Post, 'after_delete')
+@db.event.listens_for(Document, 'after_insert')
+@db.event.listens_for(Document, 'after_update')
+@db.event.listens_for(Document, 'after_delete')
+@db.event.listens_for(GroupMembership, 'after_insert')
+@db.event.listens_for(GroupMembership, 'after_delete')
+def _touch_owner_thread(mapper, connection, target):
+    touch_thread(connection, target.thread_id)
+
+
+@db.event.listens_for(Thread, 'after_insert')
+def _touch_parent_thread(mapper, connection, target):
+    touch_thread(connection, target.parent_thread_id)   # new sub-thread shows on the workspace page
+
+# ────────────────────────────────────────────────
+# Closure rows for a new thread: itself, plus its parent's ancestors one level
+# further away.
+# ────────────────────────────────────────────────
+@db.event.listens_for(Thread, 'after_insert')
+def _add_closure(mapper, connection, target):
+    closure = ThreadClosure.__table__
+    connection.execute(closure.insert().values(ancestor_id=target.id, descendant_id=target.id, depth=0))
+    if target.parent_thread_id is not None:
+        connection.execute(closure.insert().from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            db.select(closure.c.ancestor_id, db.literal(target.id), closure.c.depth + 1)
+            .where(closure.c.descendant_id == target.parent_thread_id)))
+
+
+@db.event.listens_for(Thread, 'after_delete')
+def _remove_closure(mapper, connection, target):
+    closure = ThreadClosure.__table__
+    connection.execute(closure.delete().where(db.or_(closure.c.ancestor_id == target.id,
+                                                     closure.c.descendant_id == target.id)))
+
+# ────────────────────────────────────────────────
+# Keep thread_activity current: one UPDATE per change covering the thread
+# and all its ancestors. `flask rebuild-activity` recomputes it from scratch.
+# ────────────────────────────────────────────────
+def _bump_activity(connection, thread_id, posts=0, posted_at=None, edited_at=None):
+    activity = ThreadActivity.__table__
+    closure = ThreadClosure.__table__
+    ancestors = db.select(closure.c.ancestor_id).where(closure.c.descendant_id == thread_id)
+    own = activity.c.thread_id == thread_id
+    values = {'tree_post_count': activity.c.tree_post_count + posts}
+    if posts:
+        values['post_count'] = db.case((own, activity.c.post_count + posts), else_=activity.c.post_count)
+    if posted_at is not None:
+        values['last_post_at'] = db.case((own, posted_at), else_=activity.c.last_post_at)
+    if edited_at is not None:
+        values['last_document_edit_at'] = db.case((own, edited_at), else_=activity.c.last_document_edit_at)
+    if posted_at is not None or edited_at is not None:
+        values['last_activity_at'] = posted_at or edited_at
+    connection.execute(activity.update()
+                       .where(activity.c.thread_id.in_(ancestors))   # closure includes the thread itself
+                       .values(**values))
+
+
+@db.event.listens_for(Thread, 'after_insert')
+def _create_activity(mapper, connection, target):
+    connection.execute(ThreadActivity.__table__.insert().values(thread_id=target.id))
+
+
+@db.event.listens_for(Post, 'after_insert')
+def _post_added(mapper, connection, target):
+    _bump_activity(connection, target.thread_id, posts=1, posted_at=target.created_at)
+
+
+@db.event.listens_for(Post, 'after_delete')
+def _post_removed(mapper, connection, target):
+    _bump_activity(connection, target.thread_id, posts=-1)
+
+
+@db.event.listens_for(Document, 'after_insert')
+@db.event.listens_for(Document, 'after_update')
+def _document_edited(mapper, connection, target):
+    _bump_activity(connection, target.thread_id, edited_at=datetime.utcnow())
+
 # ────────────────────────────────────────────────
 # Future models
-# - AiCallLog
 # - Vote
 # - AttributionLog
 # ────────────────────────────────────────────────
\ No newline at end of file
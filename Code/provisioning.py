@@ -0,0 +1,160 @@
+# provisioning.py
+# Builds a proposal + its private workspace (sub-threads, starter documents,
+# first post) in ONE transaction. Rows are flushed to get their ids but nothing
+# is committed until the whole structure exists, so a failure leaves nothing
+# behind and SQLite pays for one fsync instead of seven.
+#
+# The structure comes from a template dict, so events/seeding can reuse it:
+#   sub_threads: [{'key', 'title'}, …]          created under the workspace
+#   documents:   [{'title', 'type', 'content', 'chapter_num'?, 'thread'?}, …]
+#                'thread' is the key of the sub-thread the document is linked to
+
+import time
+
+import click
+from flask import current_app
+
+from extensions import db
+from models import Thread, Post, Document, GroupMembership, User
+from memberships import bump_membership_version
+
+DEFAULT_TEMPLATE = {
+    'sub_threads': [
+        {'key': 'social', 'title': 'Social Chat (Not Book Related)'},
+        {'key': 'arc', 'title': 'Overall Story Arc (Big Picture)'},
+        {'key': 'chapter_1', 'title': 'Chapter 1'},
+    ],
+    'documents': [
+        {'title': 'Overall Story Arc', 'type': 'story_arc',
+         'content': '[Initial big-picture elements – edit here]', 'thread': 'arc'},
+        {'title': 'Chapter 1 Story Arc', 'type': 'chapter_arc', 'chapter_num': 1,
+         'content': '[Chapter 1 outline – edit here]', 'thread': 'chapter_1'},
+        {'title': 'Chapter 1 Text', 'type': 'chapter_text', 'chapter_num': 1,
+         'content': '[Start writing the actual chapter here]', 'thread': 'chapter_1'},
+    ],
+}
+
+
+class ProvisionResult:
+    def __init__(self, recruitment, workspace, elapsed_ms):
+        self.recruitment = recruitment
+        self.workspace = workspace
+        self.elapsed_ms = elapsed_ms
+
+    def __repr__(self):
+        return f'<ProvisionResult workspace={self.workspace.id} {self.elapsed_ms:.1f}ms>'
+
+
+def _build(leader_id, title, description, max_members, boundary_ids, template):
+    """Add every row for one workspace to the session (no commit)."""
+    boundary_ids = boundary_ids or {}
+
+    # Public recruitment thread (proposal) + private workspace
+    # (member_count=1: the leader's memberships are added below)
+    recruitment = Thread(title=title, is_proposal=True, leader_id=leader_id, member_count=1,
+                         max_members=max_members, status='open', **boundary_ids)
+    workspace = Thread(title=f"Workspace: {title}", is_proposal=False, is_private_workspace=True,
+                       leader_id=leader_id, member_count=1, max_members=max_members,
+                       status='active', **boundary_ids)
+    db.session.add_all([recruitment, workspace])
+    db.session.flush()   # ids for the rows below
+
+    sub_threads = {
+        spec['key']: Thread(title=spec['title'], is_proposal=False, parent_thread_id=workspace.id,
+                            leader_id=leader_id, status='active')
+        for spec in template['sub_threads']
+    }
+    db.session.add_all([
+        GroupMembership(user_id=leader_id, thread_id=recruitment.id, role='leader'),
+        GroupMembership(user_id=leader_id, thread_id=workspace.id, role='leader'),
+        *sub_threads.values(),
+    ])
+    bump_membership_version(leader_id)
+    db.session.flush()
+
+    db.session.add_all([
+        Document(thread_id=workspace.id, title=spec['title'], type=spec['type'],
+                 chapter_num=spec.get('chapter_num'), content=spec.get('content', ''),
+                 associated_thread_id=sub_threads[spec['thread']].id if spec.get('thread') else None)
+        for spec in template['documents']
+    ])
+    if description:
+        db.session.add(Post(thread_id=recruitment.id, user_id=leader_id, content=description))
+    return recruitment, workspace
+
+
+def provision_workspace(leader_id, title, description=None, max_members=15,
+                        boundary_ids=None, template=DEFAULT_TEMPLATE) -> ProvisionResult:
+    """Create a proposal and its workspace atomically. Rolls back everything on error."""
+    started = time.perf_counter()
+    try:
+        recruitment, workspace = _build(leader_id, title, description, max_members,
+                                        boundary_ids, template)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    current_app.logger.info('Provisioned workspace %s in %.1f ms', workspace.id, elapsed_ms)
+    return ProvisionResult(recruitment, workspace, elapsed_ms)
+
+
+def provision_many(specs, batch_size=100, template=DEFAULT_TEMPLATE):
+    """Bulk-create workspaces (events, seeding). One transaction per batch.
+
+    specs: iterable of dicts with provision_workspace's keyword arguments
+    (leader_id and title required). Returns a ProvisionResult per spec; a
+    failing batch is rolled back as a whole and the error re-raised.
+    """
+    results = []
+    batch = []
+
+    def flush_batch():
+        started = time.perf_counter()
+        try:
+            built = [_build(spec['leader_id'], spec['title'], spec.get('description'),
+                            spec.get('max_members', 15), spec.get('boundary_ids'),
+                            spec.get('template', template))
+                     for spec in batch]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        per_item_ms = (time.perf_counter() - started) * 1000 / len(batch)
+        results.extend(ProvisionResult(r, w, per_item_ms) for r, w in built)
+        batch.clear()
+
+    for spec in specs:
+        batch.append(spec)
+        if len(batch) >= batch_size:
+            flush_batch()
+    if batch:
+        flush_batch()
+    return results
+
+
+def init_app(app):
+    @app.cli.command('provision-workspaces')
+    @click.option('--leader', 'leader_name', required=True, help='Username that leads every workspace.')
+    @click.option('--count', default=1, show_default=True, help='How many workspaces to create.')
+    @click.option('--title-prefix', default='Workspace', show_default=True)
+    @click.option('--max-members', default=15, show_default=True)
+    @click.option('--batch-size', default=100, show_default=True, help='Workspaces per transaction.')
+    def provision_workspaces_command(leader_name, count, title_prefix, max_members, batch_size):
+        """Bulk-create proposals + workspaces from the default template."""
+        leader = User.query.filter_by(username=leader_name).first()
+        if leader is None:
+            raise click.ClickException(f'No user named {leader_name!r}.')
+
+        started = time.perf_counter()
+        results = provision_many(
+            ({'leader_id': leader.id, 'title': f'{title_prefix} {n}', 'max_members': max_members}
+             for n in range(1, count + 1)),
+            batch_size=batch_size)
+        total_s = time.perf_counter() - started
+
+        latencies = sorted(r.elapsed_ms for r in results)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        click.echo(f'Provisioned {len(results)} workspaces in {total_s:.2f}s '
+                   f'({len(results) / total_s if total_s else 0:.0f}/s, '
+                   f'mean {sum(latencies) / max(len(latencies), 1):.2f} ms, p95 {p95:.2f} ms per workspace)')
@@ -0,0 +1,156 @@
+# sanitize.py
+# Allowlist HTML sanitizer for user content (posts, documents).
+# Runs once, when content is written (see the validators in models.py), so
+# templates can print stored content with |safe and page views pay nothing.
+#
+# Keeps the formatting CKEditor produces – paragraphs, headings, lists, links,
+# tables, images – and drops everything else: unknown tags are unwrapped (their
+# text is kept), script/style/etc. are removed with their contents, and only
+# listed attributes survive, with href/src limited to safe URL schemes.
+# Output is normalised, so cleaning already-clean HTML returns it unchanged.
+# text_content() gives the words alone (what the search index holds).
+
+import re
+from html import escape
+from html.parser import HTMLParser
+
+ALLOWED_TAGS = frozenset((
+    'a', 'b', 'blockquote', 'br', 'caption', 'code', 'div', 'em', 'figcaption', 'figure',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img', 'li', 'ol', 'p', 'pre', 's',
+    'span', 'strike', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'tfoot', 'th',
+    'thead', 'tr', 'u', 'ul',
+))
+VOID_TAGS = frozenset(('br', 'hr', 'img'))
+# Dropped together with everything inside them
+DROP_CONTENT_TAGS = frozenset(('script', 'style', 'iframe', 'object', 'embed', 'template',
+                               'noscript', 'textarea', 'select', 'svg', 'math', 'head', 'title'))
+
+GLOBAL_ATTRS = frozenset(('class', 'title'))
+ALLOWED_ATTRS = {
+    'a': frozenset(('href', 'rel', 'target')),
+    'img': frozenset(('src', 'alt', 'width', 'height')),
+    'td': frozenset(('colspan', 'rowspan')),
+    'th': frozenset(('colspan', 'rowspan', 'scope')),
+    'ol': frozenset(('start', 'type')),
+}
+URL_ATTRS = frozenset(('href', 'src'))
+# Tags that separate words even with no whitespace around them (text_content)
+BREAK_TAGS = frozenset(('blockquote', 'br', 'caption', 'div', 'figcaption', 'h1', 'h2', 'h3', 'h4', 'h5',
+                        'h6', 'hr', 'img', 'li', 'ol', 'p', 'pre', 'table', 'td', 'th', 'tr', 'ul'))
+
+_SAFE_URL = re.compile(r'^(?:https?:|mailto:|[^:/?#]*(?:[/?#]|$))', re.IGNORECASE)
+_SAFE_DATA_IMAGE = re.compile(r'^data:image/(?:png|jpeg|gif|webp);base64,[a-z0-9+/=\s]*$', re.IGNORECASE)
+_URL_JUNK = re.compile(r'[\x00-\x20\x7f]+')   # browsers ignore these inside "java\tscript:"
+
+
+def _safe_url(tag, value):
+    url = _URL_JUNK.sub('', value)
+    if _SAFE_URL.match(url):
+        return True
+    return tag == 'img' and bool(_SAFE_DATA_IMAGE.match(value.strip()))
+
+
+class _Cleaner(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open_tags = []
+        self.dropping = []   # stack of DROP_CONTENT_TAGS we are inside
+
+    def handle_starttag(self, tag, attrs):
+        if self.dropping:
+            if tag in DROP_CONTENT_TAGS:
+                self.dropping.append(tag)
+            return
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping.append(tag)
+            return
+        if tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRS.get(tag, frozenset()) | GLOBAL_ATTRS
+        parts = [tag]
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRS and not _safe_url(tag, value):
+                continue
+            parts.append(f'{name}="{escape(value)}"')
+        self.out.append('<' + ' '.join(parts) + '>')
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in DROP_CONTENT_TAGS and self.dropping and self.dropping[-1] == tag:
+            self.dropping.pop()   # <script/> has no content to skip
+        elif tag in ALLOWED_TAGS and tag not in VOID_TAGS and not self.dropping:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.dropping:
+            if tag == self.dropping[-1]:
+                self.dropping.pop()
+            return
+        if tag not in self.open_tags:
+            return   # stray end tag
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.out.append(f'</{open_tag}>')
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.out.append(escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.out.append(f'</{self.open_tags.pop()}>')
+        return ''.join(self.out)
+
+
+def clean_html(html):
+    """Sanitized copy of html (None stays None)."""
+    if not html:
+        return html
+    cleaner = _Cleaner()
+    cleaner.feed(html)
+    return cleaner.close()
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.dropping = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping.append(tag)
+        elif tag in BREAK_TAGS:
+            self.out.append(' ')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BREAK_TAGS:
+            self.out.append(' ')
+
+    def handle_endtag(self, tag):
+        if self.dropping and tag == self.dropping[-1]:
+            self.dropping.pop()
+        elif tag in BREAK_TAGS:
+            self.out.append(' ')
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.out.append(data)
+
+
+def text_content(html):
+    """The words of html with every tag gone and entities decoded (None stays None)."""
+    if not html:
+        return html
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return ' '.join(''.join(extractor.out).split())
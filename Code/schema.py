@@ -0,0 +1,130 @@
+# schema.py
+# In-place upgrade of databases created by an older version of models.py
+# (DB/database.db, or any deployment that predates a column):
+#
+#   flask upgrade-db             add what is missing, then backfill it
+#   flask upgrade-db --dry-run   only list what is missing
+#
+# db.create_all() creates missing tables but never touches a table that
+# already exists, so new columns on users / threads / documents (and new
+# indexes on old tables) would be missing and every query naming them fails.
+# upgrade() compares the live schema with the models and
+#
+#   - creates missing tables (and the FTS index, through search.py's hook);
+#   - ALTER TABLE … ADD COLUMN for missing columns, with their scalar default;
+#   - creates missing indexes;
+#   - runs the backfill registered for whatever it just added.
+#
+# The module that owns a table or column registers its backfill from its
+# init_app (register_backfill), next to the code that maintains it. It is
+# idempotent, does nothing on an empty database (create_all builds that) and
+# never runs by itself: upgrading is an explicit step of a deploy.
+
+import logging
+
+import click
+from sqlalchemy import inspect, literal
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.schema import CreateColumn
+
+from extensions import db
+
+log = logging.getLogger(__name__)
+
+# 'table' or ('table', 'column') → [(fn, is_missing or None)], run after it is added
+_backfills = {}
+
+
+def register_backfill(target, fn, is_missing=None):
+    """Run fn() once upgrade() has added target: a table name or (table, column).
+
+    For something the models don't describe (an FTS table, say), is_missing(connection)
+    says whether it has to be built. Registering the same fn twice is a no-op.
+    """
+    entries = _backfills.setdefault(target, [])
+    if all(existing is not fn for existing, _ in entries):
+        entries.append((fn, is_missing))
+
+
+def _add_column_ddl(column, dialect):
+    ddl = str(CreateColumn(column).compile(dialect=dialect))
+    default = column.default
+    if column.server_default is None and default is not None and default.is_scalar:
+        value = literal(default.arg, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+        ddl += f' DEFAULT {value}'
+    elif not column.nullable and column.server_default is None:
+        raise RuntimeError(f'{column.table.name}.{column.name} is NOT NULL without a scalar default; '
+                           'it cannot be added to a table that has rows')
+    return f'ALTER TABLE {column.table.name} ADD COLUMN {ddl}'
+
+
+def pending_changes(connection) -> dict:
+    """What upgrade() would do: {'tables': [...], 'columns': [(table, column)], 'indexes': [...]}."""
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    changes = {'tables': [], 'columns': [], 'indexes': []}
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            changes['tables'].append(table.name)
+            continue
+        present = {column['name'] for column in inspector.get_columns(table.name)}
+        changes['columns'].extend((table.name, column.name) for column in table.columns
+                                  if column.name not in present)
+        indexed = {index['name'] for index in inspector.get_indexes(table.name)}
+        changes['indexes'].extend(index.name for index in table.indexes if index.name not in indexed)
+    for target, entries in _backfills.items():   # tables outside the models
+        if any(is_missing is not None and is_missing(connection) for _, is_missing in entries):
+            changes['tables'].append(target)
+    return changes
+
+
+def upgrade(dry_run=False):
+    """Bring an existing database up to the models. Returns the changes (to be) made."""
+    engine = db.engine
+    with engine.connect() as connection:
+        if 'users' not in inspect(connection).get_table_names():
+            return {'tables': [], 'columns': [], 'indexes': []}   # empty database: create_all's job
+        changes = pending_changes(connection)
+    if dry_run or not any(changes.values()):
+        return changes
+
+    tables = db.metadata.tables
+    with engine.begin() as connection:
+        for table_name, column_name in changes['columns']:
+            try:
+                connection.exec_driver_sql(_add_column_ddl(tables[table_name].c[column_name], engine.dialect))
+            except (OperationalError, ProgrammingError):
+                # another process added it first
+                if column_name not in {c['name'] for c in inspect(connection).get_columns(table_name)}:
+                    raise
+    db.create_all()   # new tables; the FTS hook in search.py runs here too
+    with engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in changes['indexes']:
+                    index.create(connection, checkfirst=True)
+
+    done = []
+    for target in changes['columns'] + changes['tables']:
+        for fn, _ in _backfills.get(target, ()):
+            if fn not in done:
+                log.info('schema upgrade: backfilling %s with %s', target, fn.__name__)
+                fn()
+                done.append(fn)
+    log.warning('schema upgraded: %s', changes)
+    return changes
+
+
+def init_app(app):
+    @app.cli.command('upgrade-db')
+    @click.option('--dry-run', is_flag=True, help='only list what is missing')
+    def upgrade_db_command(dry_run):
+        """Add the tables, columns and indexes an older database is missing, then backfill them."""
+        changes = upgrade(dry_run)
+        if not any(changes.values()):
+            click.echo('Schema is up to date.')
+            return
+        for kind in ('tables', 'columns', 'indexes'):
+            for item in changes[kind]:
+                click.echo(f"{'Missing' if dry_run else 'Added'} {kind[:-1] if kind != 'indexes' else 'index'}: "
+                           f"{'.'.join(item) if isinstance(item, tuple) else item}")
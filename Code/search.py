@@ -0,0 +1,269 @@
+# search.py
+# Full-text search over posts and documents using SQLite FTS5.
+# posts_fts / documents_fts / document_chunks_fts hold the *text* of each row
+# (sanitize.text_content, registered as the SQL function plain_text), never its
+# markup, so "strong" or "href" only match where someone wrote them. Chunked
+# chapters are indexed paragraph by paragraph. Triggers keep the index in sync
+# row-by-row, so writes stay incremental and queries are index lookups instead
+# of LIKE scans.
+#
+# Each row also carries its thread as a token ('t42') in a `thread` column, so
+# a search is limited to the user's threads inside MATCH itself: only visible
+# hits are ever ranked, however common the words are elsewhere.
+
+import re
+
+import click
+from markupsafe import Markup, escape
+from sqlalchemy import event, text
+
+import sanitize
+import schema
+from extensions import db
+
+PAGE_SIZE = 20
+KINDS = ('posts', 'documents')
+FTS_TABLES = ('posts_fts', 'documents_fts', 'document_chunks_fts')
+
+# Snippet highlight markers – swapped for <mark> after escaping the text
+_HL_START, _HL_END = '\x02', '\x03'
+_TOKENIZE = "tokenize='unicode61 remove_diacritics 2'"
+
+FTS_DDL = [
+    # ─── posts ───────────────────────────────────────────────
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(thread, content, {_TOKENIZE})",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN
+           INSERT INTO posts_fts(rowid, thread, content) VALUES (new.id, 't' || new.thread_id, plain_text(new.content));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN
+           DELETE FROM posts_fts WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF thread_id, content ON posts BEGIN
+           DELETE FROM posts_fts WHERE rowid = old.id;
+           INSERT INTO posts_fts(rowid, thread, content) VALUES (new.id, 't' || new.thread_id, plain_text(new.content));
+       END""",
+    # ─── documents ───────────────────────────────────────────
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(thread, title, content, {_TOKENIZE})",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+           INSERT INTO documents_fts(rowid, thread, title, content)
+               VALUES (new.id, 't' || new.thread_id, new.title, plain_text(new.content));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+           DELETE FROM documents_fts WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE OF thread_id, title, content ON documents BEGIN
+           DELETE FROM documents_fts WHERE rowid = old.id;
+           INSERT INTO documents_fts(rowid, thread, title, content)
+               VALUES (new.id, 't' || new.thread_id, new.title, plain_text(new.content));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS documents_fts_moved AFTER UPDATE OF thread_id ON documents BEGIN
+           UPDATE document_chunks_fts SET thread = 't' || new.thread_id
+            WHERE rowid IN (SELECT id FROM document_chunks WHERE document_id = new.id);
+       END""",
+    # ─── document chunks (bodies of chunked documents) ───────
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS document_chunks_fts USING fts5(thread, content, {_TOKENIZE})",
+    """CREATE TRIGGER IF NOT EXISTS document_chunks_fts_ai AFTER INSERT ON document_chunks BEGIN
+           INSERT INTO document_chunks_fts(rowid, thread, content)
+               SELECT new.id, 't' || d.thread_id, plain_text(new.content) FROM documents d WHERE d.id = new.document_id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS document_chunks_fts_ad AFTER DELETE ON document_chunks BEGIN
+           DELETE FROM document_chunks_fts WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS document_chunks_fts_au AFTER UPDATE OF content ON document_chunks BEGIN
+           DELETE FROM document_chunks_fts WHERE rowid = old.id;
+           INSERT INTO document_chunks_fts(rowid, thread, content)
+               SELECT new.id, 't' || d.thread_id, plain_text(new.content) FROM documents d WHERE d.id = new.document_id;
+       END""",
+    # rank = bm25 with the thread column weighted 0 (it is a filter, not relevance)
+    "INSERT INTO posts_fts(posts_fts, rank) VALUES ('rank', 'bm25(0.0, 1.0)')",
+    "INSERT INTO documents_fts(documents_fts, rank) VALUES ('rank', 'bm25(0.0, 5.0, 1.0)')",
+    "INSERT INTO document_chunks_fts(document_chunks_fts, rank) VALUES ('rank', 'bm25(0.0, 1.0)')",
+]
+
+_FILL_SQL = [
+    "INSERT INTO posts_fts(rowid, thread, content) SELECT id, 't' || thread_id, plain_text(content) FROM posts",
+    """INSERT INTO documents_fts(rowid, thread, title, content)
+           SELECT id, 't' || thread_id, title, plain_text(content) FROM documents""",
+    """INSERT INTO document_chunks_fts(rowid, thread, content)
+           SELECT c.id, 't' || d.thread_id, plain_text(c.content)
+             FROM document_chunks c JOIN documents d ON d.id = c.document_id""",
+]
+_TRIGGERS = re.findall(r'CREATE TRIGGER IF NOT EXISTS (\w+)', '\n'.join(FTS_DDL))
+
+
+# ─── Setup ───────────────────────────────────────────────────────────
+def is_available(connection=None) -> bool:
+    """FTS5 only exists on SQLite; other databases get no search index."""
+    bind = connection if connection is not None else db.engine
+    return bind.dialect.name == 'sqlite'
+
+
+def install_functions(dbapi_connection):
+    """plain_text(html) for the sync triggers; needed on every connection that writes content."""
+    dbapi_connection.create_function('plain_text', 1, sanitize.text_content, deterministic=True)
+
+
+def create_index(connection):
+    """Create the FTS tables and sync triggers if they are missing."""
+    if not is_available(connection):
+        return
+    install_functions(connection.connection.driver_connection)
+    for ddl in FTS_DDL:
+        connection.exec_driver_sql(ddl)
+
+
+def index_outdated(connection) -> bool:
+    """No index, or one from before the `thread` column (it indexed raw HTML)."""
+    if not is_available(connection):
+        return False
+    ddl = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'posts_fts'").scalar()
+    return ddl is None or 'thread' not in ddl
+
+
+def rebuild_index():
+    """Recreate the index from scratch (after bulk imports, for repairs, or to upgrade it)."""
+    with db.engine.begin() as connection:
+        if not is_available(connection):
+            return
+        for name in _TRIGGERS:
+            connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+        for table in FTS_TABLES:
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS {table}')
+        create_index(connection)
+        for sql in _FILL_SQL:
+            connection.exec_driver_sql(sql)
+        for table in FTS_TABLES:
+            connection.exec_driver_sql(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+
+
+def init_app(app):
+    # db.create_all() also builds the FTS tables + triggers
+    @event.listens_for(db.metadata, 'after_create')
+    def _create_fts(target, connection, **kw):
+        create_index(connection)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', lambda dbapi_connection, record: install_functions(dbapi_connection))
+
+    schema.register_backfill('posts_fts', rebuild_index, is_missing=index_outdated)   # `flask upgrade-db`
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Rebuild the full-text search index for posts and documents."""
+        rebuild_index()
+        click.echo('Search index rebuilt.')
+
+
+# ─── Querying ────────────────────────────────────────────────────────
+def to_match_query(raw: str) -> str:
+    """Turn free text into a safe FTS5 query: every word must match, `word*` is a prefix search."""
+    terms = []
+    for word in raw.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return ' '.join(terms)
+
+
+def _clean_snippet(raw):
+    """Escape an FTS snippet (plain text), keeping only the highlights."""
+    html = str(escape(raw or '')).replace(_HL_START, '<mark>').replace(_HL_END, '</mark>')
+    return Markup(' '.join(html.split()))
+
+
+# Threads a user may search: the ones they are a member of and every thread below them.
+_VISIBLE_THREADS = """
+    SELECT c.descendant_id FROM group_memberships gm
+      JOIN thread_closure c ON c.ancestor_id = gm.thread_id
+     WHERE gm.user_id = :user_id
+"""
+
+# :match / :text_match already carry the thread filter (see _scoped), so only
+# visible hits are ranked; the IN check stays as a backstop.
+_POST_SQL = f"""
+    SELECT p.id, p.thread_id, p.created_at, t.title AS thread_title, u.username,
+           snippet(posts_fts, 1, '{_HL_START}', '{_HL_END}', '…', 16) AS snippet
+      FROM posts_fts
+      JOIN posts p   ON p.id = posts_fts.rowid
+      JOIN threads t ON t.id = p.thread_id
+      JOIN users u   ON u.id = p.user_id
+     WHERE posts_fts MATCH :text_match
+       AND p.thread_id IN ({_VISIBLE_THREADS})
+     ORDER BY posts_fts.rank
+     LIMIT :limit OFFSET :offset
+"""
+
+# Document hits come from the title/inline body index and from the chunk index;
+# each document is listed once, with its best-ranked snippet (SQLite returns the
+# bare snippet column from the row that holds MIN(score)).
+_DOCUMENT_SQL = f"""
+    WITH hits AS (
+        SELECT documents_fts.rowid AS document_id, documents_fts.rank AS score,
+               snippet(documents_fts, 2, '{_HL_START}', '{_HL_END}', '…', 24) AS snippet
+          FROM documents_fts
+         WHERE documents_fts MATCH :match
+        UNION ALL
+        SELECT c.document_id, document_chunks_fts.rank AS score,
+               snippet(document_chunks_fts, 1, '{_HL_START}', '{_HL_END}', '…', 24) AS snippet
+          FROM document_chunks_fts
+          JOIN document_chunks c ON c.id = document_chunks_fts.rowid
+         WHERE document_chunks_fts MATCH :text_match
+    ), best AS (
+        SELECT document_id, MIN(score) AS score, snippet FROM hits GROUP BY document_id
+    )
+    SELECT d.id, d.thread_id, d.title, d.type, d.last_updated, t.title AS thread_title, best.snippet
+      FROM best
+      JOIN documents d ON d.id = best.document_id
+      JOIN threads t   ON t.id = d.thread_id
+     WHERE d.thread_id IN ({_VISIBLE_THREADS})
+     ORDER BY best.score
+     LIMIT :limit OFFSET :offset
+"""
+
+
+def visible_thread_ids(user_id) -> list:
+    return list(db.session.execute(text(_VISIBLE_THREADS), {'user_id': user_id}).scalars())
+
+
+def _scoped(columns, match, thread_ids):
+    """FTS5 query: the words in columns, in one of thread_ids (the `thread` column)."""
+    threads = ' OR '.join(f't{thread_id}' for thread_id in thread_ids)
+    return f'{{{columns}}} : ({match}) AND thread : ({threads})'
+
+
+class SearchResults:
+    def __init__(self, kind, hits, page, has_next):
+        self.kind = kind
+        self.hits = hits
+        self.page = page
+        self.has_next = has_next
+
+
+def search(user_id, raw_query, kind='posts', page=1, per_page=PAGE_SIZE) -> SearchResults:
+    """Ranked, paginated hits for `raw_query` inside the user's workspaces."""
+    page = max(page or 1, 1)
+    match = to_match_query(raw_query or '')
+    if kind not in KINDS or not match or not is_available():
+        return SearchResults(kind, [], page, False)
+    thread_ids = visible_thread_ids(user_id)
+    if not thread_ids:
+        return SearchResults(kind, [], page, False)
+
+    sql = _POST_SQL if kind == 'posts' else _DOCUMENT_SQL
+    rows = db.session.execute(text(sql), {
+        'match': _scoped('title content', match, thread_ids),
+        'text_match': _scoped('content', match, thread_ids),
+        'user_id': user_id,
+        'limit': per_page + 1,
+        'offset': (page - 1) * per_page,
+    }).mappings().all()
+
+    hits = []
+    for row in rows[:per_page]:
+        hit = dict(row)
+        hit['snippet'] = _clean_snippet(hit['snippet'])
+        hits.append(hit)
+    return SearchResults(kind, hits, page, has_next=len(rows) > per_page)
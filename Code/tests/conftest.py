@@ -0,0 +1,122 @@
+# tests/conftest.py
+# Tests run against the real app on a scratch SQLite database (created once,
+# emptied after every test), so the mapper events, triggers and pragmas are
+# the ones production uses.
+#
+#   python -m pytest -q Code/tests
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))   # modules import flat from Code/
+
+_fd, DB_PATH = tempfile.mkstemp(suffix='.db')
+os.close(_fd)
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_PATH}'   # read by config.py on import
+
+
+@pytest.fixture(scope='session')
+def app():
+    from flask import g
+    from app import app
+    from extensions import db
+    import auth
+
+    @app.teardown_request
+    def _clear_request_globals(exc):
+        # Test-client requests made inside a test's app context share its g: don't let
+        # one request's @read_only flag or membership role map leak into the next one
+        for name in list(g):
+            g.pop(name)
+
+    app.config.update(TESTING=True, LAST_LOGIN_FLUSH_SECONDS=0,
+                      LOGIN_IP_LIMIT=0, LOGIN_ACCOUNT_LIMIT=0, REGISTER_IP_LIMIT=0)
+    auth.last_logins.interval = 0
+    auth.pool.configure(0)   # hash in the test thread
+    with app.app_context():
+        db.create_all()
+    yield app
+    auth.last_logins.flush()   # before the scratch database goes
+    with app.app_context():
+        db.engine.dispose()
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+
+
+@pytest.fixture
+def db(app):
+    """An app context over empty tables."""
+    from extensions import db
+    from fragments import fragment_cache
+
+    with app.app_context():
+        yield db
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        db.session.remove()
+    fragment_cache.clear()   # ids are reused once the rows are gone
+
+
+@pytest.fixture
+def make_user(db):
+    from models import User
+
+    def make_user(username='writer', password=None):
+        user = User(username=username, email=f'{username}@example.com')
+        user.set_password(password or f'{username}-password')
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make_user
+
+
+@pytest.fixture
+def make_thread(db, make_user):
+    from models import Thread
+
+    def make_thread(title='Thread', parent=None, leader=None, **fields):
+        leader = leader or make_user(f'leader{Thread.query.count()}')
+        thread = Thread(title=title, leader_id=leader.id,
+                        parent_thread_id=parent.id if parent is not None else None, **fields)
+        db.session.add(thread)
+        db.session.commit()
+        return thread
+    return make_thread
+
+
+@pytest.fixture
+def login(app, db):
+    """A test client logged in as user (whose password is the make_user default)."""
+    def login(user, password=None):
+        client = app.test_client()
+        response = client.post('/login', data={'username': user.username,
+                                               'password': password or f'{user.username}-password'})
+        assert response.status_code == 302, response.status_code
+        return client
+    return login
+
+
+@pytest.fixture
+def count_queries(db):
+    """count_queries(fn) → (fn's result, SQL statements it ran)."""
+    from sqlalchemy import event
+
+    def count_queries(fn):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            result = fn()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return result, statements
+    return count_queries
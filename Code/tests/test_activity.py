@@ -0,0 +1,79 @@
+import pytest
+
+import activity
+from models import Post, ReadMarker, ThreadActivity
+
+
+def _post(db, thread, user, n=1):
+    db.session.add_all(Post(thread_id=thread.id, user_id=user.id, content=f'<p>post {i}</p>') for i in range(n))
+    db.session.commit()
+
+
+def test_post_counts_roll_up(db, make_thread):
+    workspace = make_thread('Workspace', is_private_workspace=True, is_proposal=False)
+    chapter = make_thread('Chapter', parent=workspace, leader=workspace.leader)
+    _post(db, workspace, workspace.leader, 2)
+    _post(db, chapter, workspace.leader, 3)
+    assert db.session.get(ThreadActivity, chapter.id).post_count == 3
+    top = db.session.get(ThreadActivity, workspace.id)
+    assert (top.post_count, top.tree_post_count) == (2, 5)
+    assert top.last_activity_at is not None
+
+
+def test_mark_read_writes_only_when_something_is_new(db, make_thread, make_user):
+    thread = make_thread()
+    reader = make_user('reader')
+    _post(db, thread, thread.leader, 2)
+
+    assert activity.mark_read(reader.id, thread) is True
+    assert db.session.get(ReadMarker, (reader.id, thread.id)).read_post_count == 2
+    assert activity.mark_read(reader.id, thread) is False
+    _post(db, thread, thread.leader)
+    assert activity.mark_read(reader.id, thread) is True
+    assert db.session.get(ReadMarker, (reader.id, thread.id)).read_tree_count == 3
+
+
+def test_workspace_summaries_count_unread(db, make_thread, make_user):
+    import memberships
+    workspace = make_thread('Workspace', is_private_workspace=True, is_proposal=False, status='active')
+    chapter = make_thread('Chapter', parent=workspace, leader=workspace.leader)
+    member = make_user('member')
+    memberships.add_member(workspace.id, member.id)
+    _post(db, workspace, workspace.leader, 2)
+    _post(db, chapter, workspace.leader, 3)
+
+    [summary] = activity.workspace_summaries(member.id)
+    assert (summary.post_count, summary.unread, summary.member_count) == (5, 5, 1)
+    activity.mark_read(member.id, chapter)
+    [summary] = activity.workspace_summaries(member.id)
+    assert summary.unread == 2
+
+
+@pytest.mark.parametrize('warm', [False, True])
+def test_thread_page_queries_do_not_grow_with_the_page(db, make_thread, make_user, login, count_queries, warm):
+    client = login(make_user('reader'))
+    client.get(f'/threads/{make_thread("Warm-up").id}')   # per-process and per-session caches
+    counts = []
+    for posts in (2, 30):
+        thread = make_thread(f'{posts} posts')
+        _post(db, thread, thread.leader, posts)
+        if warm:
+            client.get(f'/threads/{thread.id}')   # read marker written, fragments cached
+        response, statements = count_queries(lambda: client.get(f'/threads/{thread.id}'))
+        assert response.status_code == 200
+        assert not [s for s in statements if 'WHERE posts.id = ?' in s], 'posts reloaded one by one'
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+def test_upgrade_db_rebuilds_a_missing_activity_table(db, make_thread):
+    import schema
+    thread = make_thread()
+    thread_id = thread.id
+    _post(db, thread, thread.leader, 3)
+    db.session.remove()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('DROP TABLE thread_activity')
+
+    assert 'thread_activity' in schema.upgrade()['tables']
+    assert db.session.get(ThreadActivity, thread_id).post_count == 3
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import ai_jobs
+from ai_providers import FakeProvider, Provider
+from models import AiCallLog, AiJob, AiResult, Document
+
+
+@pytest.fixture
+def document(db, make_thread):
+    thread = make_thread('Novel')
+    doc = Document(thread_id=thread.id, title='Chapter 1', content='<p>It was a dark and stormy night.</p>')
+    db.session.add(doc)
+    db.session.commit()
+    return doc
+
+
+@pytest.fixture
+def worker(app, db):
+    return ai_jobs.Worker(app.config)
+
+
+class ShortProvider(FakeProvider):
+    """Answers only the first prompt of every batch."""
+
+    def complete(self, requests):
+        return super().complete(requests)[:1]
+
+
+def test_provider_base_is_abstract():
+    with pytest.raises(TypeError):
+        Provider({})
+
+
+def test_worker_runs_and_caches(db, document, worker):
+    job = ai_jobs.enqueue(document.thread.leader_id, 'summary', document)
+    assert job.status == 'queued'
+    worker.run(once=True)
+    db.session.expire_all()
+    job = db.session.get(AiJob, job.id)
+    assert job.status == 'done' and job.result.startswith('Summary') and not job.cache_hit
+
+    again = ai_jobs.enqueue(job.user_id, 'summary', document)   # same prompt: answered from ai_results
+    assert again.status == 'done' and again.cache_hit and again.result == job.result
+    assert db.session.get(AiResult, job.prompt_hash).hit_count == 1
+    assert AiCallLog.query.count() == 2
+
+
+def test_short_provider_answer_fails_the_rest(db, document, worker):
+    worker.provider = ShortProvider({})
+    user_id = document.thread.leader_id
+    first = ai_jobs.enqueue(user_id, 'summary', document)
+    second = ai_jobs.enqueue(user_id, 'continuation', document)
+    third = ai_jobs.enqueue(user_id, 'summary', document)   # duplicate of first
+    worker.run_batch(worker.claim())   # one kind per claim: first and third
+    worker.run_batch(worker.claim())   # second
+
+    db.session.expire_all()
+    assert [db.session.get(AiJob, job.id).status for job in (first, second, third)] == ['done', 'done', 'done']
+
+    doc2 = Document(thread_id=document.thread_id, title='Chapter 2', content='<p>Morning came.</p>')
+    db.session.add(doc2)
+    db.session.commit()
+    answered = ai_jobs.enqueue(user_id, 'canon_check', document)
+    dropped = ai_jobs.enqueue(user_id, 'canon_check', doc2)
+    worker.run_batch(worker.claim())
+
+    db.session.expire_all()
+    assert db.session.get(AiJob, answered.id).status == 'done'
+    dropped = db.session.get(AiJob, dropped.id)
+    assert dropped.status == 'failed' and '1 completions for 2 prompts' in dropped.error
+
+
+def test_requeue_stale_gives_up_after_max_attempts(db, document, worker):
+    user_id = document.thread.leader_id
+    jobs = [ai_jobs.enqueue(user_id, kind, document) for kind in ('summary', 'continuation')]
+    long_ago = datetime.utcnow() - timedelta(seconds=worker.job_timeout + 60)
+    for job, attempts in zip(jobs, (1, worker.max_attempts)):
+        job.status, job.attempts, job.started_at, job.claim_token = 'running', attempts, long_ago, 'dead'
+    db.session.commit()
+
+    assert worker.requeue_stale() == 2
+    db.session.expire_all()
+    retried, exhausted = (db.session.get(AiJob, job.id) for job in jobs)
+    assert retried.status == 'queued' and retried.claim_token is None
+    assert exhausted.status == 'failed' and 'timed out' in exhausted.error
+    assert AiCallLog.query.filter_by(job_id=exhausted.id).count() == 1
+
+    worker.run(once=True)
+    db.session.expire_all()
+    retried = db.session.get(AiJob, retried.id)
+    assert retried.status == 'done' and retried.attempts == 2
+
+
+def test_pending_cap(db, document, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'AI_MAX_PENDING_PER_USER', 1)
+    ai_jobs.enqueue(document.thread.leader_id, 'summary', document)
+    with pytest.raises(ai_jobs.QueueFullError):
+        ai_jobs.enqueue(document.thread.leader_id, 'continuation', document)
@@ -0,0 +1,84 @@
+import gzip
+import json
+import os
+
+import pytest
+
+import assets
+
+SOURCE = assets.ASSETS['ckeditor.js']
+BUNDLE = b'/* editor */ ' + b'window.ClassicEditor = {};\n' * 200
+
+
+@pytest.fixture
+def dirs(app, tmp_path, monkeypatch):
+    """A source tree holding the vendor bundle, an empty build dir and no manifest loaded."""
+    source, build = tmp_path / 'src', tmp_path / 'build'
+    os.makedirs(source / os.path.dirname(SOURCE))
+    (source / SOURCE).write_bytes(BUNDLE)
+    monkeypatch.setitem(app.config, 'ASSETS_SOURCE_DIR', str(source))
+    monkeypatch.setitem(app.config, 'ASSETS_BUILD_DIR', str(build))
+    monkeypatch.setattr(assets, 'brotli', None)   # the same files whether or not brotli is installed
+    monkeypatch.setattr(assets, '_manifest', {})
+    return source, build
+
+
+def test_build_fingerprints_and_compresses(dirs):
+    source, build = dirs
+    manifest = assets.build(str(source), str(build))
+    name = assets.hashed_name('ckeditor.js', BUNDLE)
+    assert manifest == {'ckeditor.js': {'file': name, 'size': len(BUNDLE), 'encodings': ['gzip']}}
+    assert (build / name).read_bytes() == BUNDLE
+    assert gzip.decompress((build / f'{name}.gz').read_bytes()) == BUNDLE
+    assert json.loads((build / assets.MANIFEST).read_text()) == manifest
+
+    gz = (build / f'{name}.gz').read_bytes()
+    assert assets.build(str(source), str(build)) == manifest and (build / f'{name}.gz').read_bytes() == gz
+
+
+def test_clean_removes_earlier_builds_only_when_asked(dirs):
+    source, build = dirs
+    old = assets.build(str(source), str(build))['ckeditor.js']['file']
+    (source / SOURCE).write_bytes(BUNDLE + b'// patched\n')
+    new = assets.build(str(source), str(build))['ckeditor.js']['file']
+    assert new != old and (build / old).exists()
+    assets.build(str(source), str(build), clean=True)
+    assert sorted(os.listdir(build)) == sorted([assets.MANIFEST, new, f'{new}.gz'])
+
+
+def test_missing_source_is_skipped(dirs):
+    source, build = dirs
+    os.remove(source / SOURCE)
+    assert assets.build(str(source), str(build)) == {}
+
+
+def test_unbuilt_asset_is_served_from_source_uncached(app, dirs):
+    with app.test_request_context():
+        assert assets.asset_url('ckeditor.js') == '/assets/ckeditor.js'
+    response = app.test_client().get('/assets/ckeditor.js')
+    assert response.status_code == 200 and response.get_data() == BUNDLE
+    assert response.cache_control.no_cache and not response.cache_control.immutable
+    assert app.test_client().get('/assets/other.js').status_code == 404
+
+
+def test_built_asset_is_immutable_and_negotiated(app, dirs):
+    source, build = dirs
+    assets.build(str(source), str(build))
+    assets.load_manifest(str(build))
+    name = assets.hashed_name('ckeditor.js', BUNDLE)
+    with app.test_request_context():
+        assert assets.asset_url('ckeditor.js') == f'/assets/{name}'
+
+    client = app.test_client()
+    compressed = client.get(f'/assets/{name}', headers={'Accept-Encoding': 'br;q=1.0, gzip;q=0.8'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.get_data()) == BUNDLE
+    assert compressed.cache_control.immutable and compressed.cache_control.public
+    assert compressed.cache_control.max_age == app.config['ASSETS_MAX_AGE']
+    assert compressed.vary.as_set() == {'accept-encoding'} and 'Set-Cookie' not in compressed.headers
+
+    for accept in ('', 'identity;q=1.0, gzip;q=0.5'):
+        plain = client.get(f'/assets/{name}', headers={'Accept-Encoding': accept})
+        assert 'Content-Encoding' not in plain.headers and plain.get_data() == BUNDLE
+
+    assert client.get('/assets/ckeditor.000000000000.js').status_code == 404
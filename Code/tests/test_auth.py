@@ -0,0 +1,143 @@
+import threading
+
+import pytest
+
+import auth
+from models import User
+
+
+@pytest.fixture
+def limits(app, monkeypatch):
+    monkeypatch.setattr(auth, 'backend', auth.MemoryBackend())
+    for key, value in (('LOGIN_IP_LIMIT', 3), ('LOGIN_IP_WINDOW', 60),
+                       ('LOGIN_ACCOUNT_LIMIT', 2), ('LOGIN_ACCOUNT_WINDOW', 900)):
+        monkeypatch.setitem(app.config, key, value)
+
+
+def test_sliding_window_counts():
+    backend = auth.MemoryBackend()
+    assert backend.hit('k', 10, now=100) == 1
+    assert backend.hit('k', 10, now=101) == 2
+    assert backend.peek('k', 10, now=105) == 2
+    assert backend.peek('k', 10, now=115) == pytest.approx(1)   # halfway into the next window
+    assert backend.peek('k', 10, now=125) == 0
+    backend.reset('k', 10)
+    assert backend.peek('k', 10, now=101) == 0
+
+
+def test_authenticate(db, make_user, limits):
+    user = make_user('author', 'right-password')
+    assert auth.authenticate('author', 'right-password', '10.0.0.1').id == user.id
+    assert auth.authenticate('author', 'wrong', '10.0.0.2') is None
+    assert auth.authenticate('nobody', 'right-password', '10.0.0.3') is None
+
+
+def test_account_throttle_after_failures(db, make_user, limits):
+    make_user('target', 'right-password')
+    for n in range(2):
+        assert auth.authenticate('target', 'wrong', f'10.0.1.{n}') is None
+    with pytest.raises(auth.Throttled) as caught:
+        auth.authenticate('TARGET ', 'right-password', '10.0.1.9')   # same account, any spelling
+    assert caught.value.retry_after >= 1
+
+
+def test_success_clears_account_failures(db, make_user, limits):
+    make_user('forgetful', 'right-password')
+    auth.authenticate('forgetful', 'wrong', '10.0.2.1')
+    assert auth.authenticate('forgetful', 'right-password', '10.0.2.2') is not None
+    auth.authenticate('forgetful', 'wrong', '10.0.2.3')
+    assert auth.authenticate('forgetful', 'right-password', '10.0.2.4') is not None
+
+
+def test_address_throttle_counts_every_attempt(db, make_user, limits):
+    make_user('someone', 'right-password')
+    for _ in range(3):
+        auth.authenticate('someone', 'right-password', '10.0.3.1')
+    with pytest.raises(auth.Throttled):
+        auth.authenticate('someone', 'right-password', '10.0.3.1')
+    assert auth.authenticate('someone', 'right-password', '10.0.3.2') is not None
+
+
+def test_address_throttle_is_per_account(db, make_user, limits):
+    make_user('alice', 'right-password')
+    make_user('bob', 'right-password')
+    for _ in range(3):
+        auth.authenticate('alice', 'right-password', '10.0.4.1')
+    with pytest.raises(auth.Throttled):
+        auth.authenticate('Alice', 'right-password', '10.0.4.1')
+    assert auth.authenticate('bob', 'right-password', '10.0.4.1') is not None   # same NAT, other account
+
+
+def test_login_throttle_keys_on_the_forwarded_address(app, db, make_user, limits, monkeypatch):
+    monkeypatch.setitem(app.config, 'LOGIN_ACCOUNT_LIMIT', 0)   # only the address throttle
+    monkeypatch.setattr(app, 'wsgi_app', app.wsgi_app)   # restored afterwards
+    auth.trust_proxies(app, 1)
+    make_user('proxied', 'right-password')
+    client = app.test_client()
+
+    def attempt(forwarded_for, password='wrong'):
+        return client.post('/login', data={'username': 'proxied', 'password': password},
+                           headers={'X-Forwarded-For': forwarded_for},
+                           environ_base={'REMOTE_ADDR': '127.0.0.1'}).status_code
+
+    assert [attempt('203.0.113.7') for _ in range(3)] == [200, 200, 200]
+    assert attempt('203.0.113.7') == 429
+    # a spoofed left-most entry is ignored: only the one our proxy appended counts
+    assert attempt('198.51.100.1, 203.0.113.7') == 429
+    assert attempt('203.0.113.8', 'right-password') == 302
+
+
+def test_hash_pool_turns_work_away_when_full():
+    pool = auth.HashPool()
+    pool.configure(1, 0, timeout=5)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    results = []
+    busy = threading.Thread(target=lambda: results.append(pool.run(slow)))
+    busy.start()
+    try:
+        assert started.wait(5)
+        with pytest.raises(auth.Overloaded):
+            pool.run(lambda: 'never runs')
+        assert pool.rejected == 1
+    finally:
+        release.set()
+        busy.join()
+        pool.shutdown()
+    assert results == ['done']
+
+
+def test_hash_pool_timeout():
+    pool = auth.HashPool()
+    pool.configure(1, 1, timeout=0.05)
+    release = threading.Event()
+    try:
+        with pytest.raises(auth.Overloaded):
+            pool.run(release.wait, 5)
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_last_login_buffer_writes_in_one_batch(app, db, make_user, monkeypatch):
+    first, second = make_user('first'), make_user('second')
+    buffer = auth.LastLoginBuffer()
+    buffer.app = app
+    monkeypatch.setattr(buffer, 'interval', 3600)   # no flush on record…
+    monkeypatch.setattr(buffer, '_thread', threading.current_thread())   # …and no background thread
+    buffer.record(first.id)
+    buffer.record(second.id)
+    db.session.expire_all()
+    assert db.session.get(User, first.id).last_login is None
+
+    assert buffer.flush() == 2
+    db.session.expire_all()
+    assert db.session.get(User, first.id).last_login is not None
+    assert db.session.get(User, second.id).last_login is not None
+    assert buffer.flush() == 0
@@ -0,0 +1,65 @@
+import pytest
+
+from boundaries import boundary_cache
+from models import ListBoundaryOption
+
+
+@pytest.fixture
+def options(db):
+    rows = [ListBoundaryOption(option_text='Fantasy', for_genre=True, sort_order=2),
+            ListBoundaryOption(option_text='Horror', for_genre=True, for_violence=True, sort_order=1),
+            ListBoundaryOption(option_text='None', for_violence=True, for_sex=True, sort_order=0)]
+    db.session.add_all(rows)
+    db.session.commit()
+    boundary_cache.invalidate()   # the table cleanup between tests bypasses the ORM hooks
+    yield {row.option_text: row.id for row in rows}
+    boundary_cache.invalidate()
+
+
+def test_options_grouped_by_category_in_sort_order(options):
+    assert [o.option_text for o in boundary_cache.options_for('genre')] == ['Horror', 'Fantasy']
+    assert [o.option_text for o in boundary_cache.options_for('violence')] == ['None', 'Horror']
+    assert boundary_cache.options_for('audience') == ()
+    assert boundary_cache.is_valid('genre', options['Fantasy'])
+    assert not boundary_cache.is_valid('sex', options['Fantasy'])
+    assert not boundary_cache.is_valid('genre', 10_000)
+
+
+def test_lookups_after_the_first_load_run_no_queries(db, options, make_thread, count_queries):
+    thread = make_thread(genre_id=options['Horror'], violence_id=options['None'])
+    thread.genre_id   # reload the thread: make_thread's commit expired it
+    boundary_cache.fingerprint   # loaded
+
+    labels, statements = count_queries(lambda: (boundary_cache.thread_boundaries(thread),
+                                                boundary_cache.dropdowns()))
+    assert labels[0] == [('Genre', 'Horror'), ('Violence', 'None')]
+    assert statements == []
+
+
+def test_commit_touching_options_reloads_the_cache(db, options):
+    fingerprint = boundary_cache.fingerprint
+    db.session.get(ListBoundaryOption, options['Fantasy']).option_text = 'High fantasy'
+    assert boundary_cache.fingerprint == fingerprint   # not committed yet
+    db.session.commit()
+    assert boundary_cache.get(options['Fantasy']).option_text == 'High fantasy'
+    assert boundary_cache.fingerprint != fingerprint
+
+
+def test_rolled_back_change_keeps_the_cache(db, options, count_queries):
+    boundary_cache.fingerprint
+    db.session.get(ListBoundaryOption, options['Fantasy']).option_text = 'Discarded'
+    db.session.flush()
+    db.session.rollback()
+    _, statements = count_queries(lambda: boundary_cache.options_for('genre'))
+    assert statements == []
+
+
+def test_ttl_reloads_changes_from_other_processes(db, options, monkeypatch):
+    boundary_cache.fingerprint
+    db.session.execute(db.update(ListBoundaryOption).values(sort_order=5)
+                       .where(ListBoundaryOption.id == options['Horror'])
+                       .execution_options(synchronize_session=False))
+    db.session.commit()   # Core UPDATE: looks like another process's change
+    assert boundary_cache.options_for('genre')[0].option_text == 'Horror'
+    monkeypatch.setattr(boundary_cache, 'ttl', 0.000001)
+    assert boundary_cache.options_for('genre')[0].option_text == 'Fantasy'
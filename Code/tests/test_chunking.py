@@ -0,0 +1,110 @@
+import pytest
+
+import chunking
+import memberships
+from models import Document, DocumentChunk
+
+CHAPTER = '<h2>One</h2>\n<p>First <em>line</em><br>still first.</p>\n<blockquote><p>Quoted</p></blockquote><p>Last</p>\n'
+
+
+@pytest.fixture
+def chapter(db, make_thread):
+    doc = Document(thread_id=make_thread().id, title='Chapter 1', type='chapter_text', content=CHAPTER)
+    db.session.add(doc)
+    db.session.commit()
+    return doc
+
+
+def _chunks(db, document):
+    db.session.expire_all()
+    return DocumentChunk.query.filter_by(document_id=document.id).order_by(DocumentChunk.position).all()
+
+
+def test_split_blocks():
+    blocks = chunking.split_blocks(CHAPTER)
+    assert blocks == ['<h2>One</h2>\n', '<p>First <em>line</em><br>still first.</p>\n',
+                      '<blockquote><p>Quoted</p></blockquote>', '<p>Last</p>\n']
+    for html in ('', 'bare text', '<p>a</p>tail', '<hr><p>x</p>  ', '<p>unclosed'):
+        assert ''.join(chunking.split_blocks(html)) == html
+
+
+def test_positions_between():
+    gap = chunking.POSITION_GAP
+    assert chunking.positions_between(None, None, 2) == [gap, 2 * gap]
+    assert chunking.positions_between(gap, None, 1) == [2 * gap]
+    assert chunking.positions_between(0, 10, 4) == [2, 4, 6, 8]
+    assert chunking.positions_between(None, gap, 1)[0] < gap
+    assert chunking.positions_between(4, 5, 1) is None
+    assert chunking.positions_between(1, 2, 0) == []
+
+
+def test_chunked_document_round_trips(db, chapter):
+    chunks = _chunks(db, chapter)
+    assert chapter.storage == 'chunked' and len(chunks) == 4
+    assert db.session.get(Document, chapter.id).content == CHAPTER
+    assert chapter.stored_length() == len(CHAPTER)
+
+
+def test_editing_rewrites_only_the_changed_chunks(db, chapter):
+    before = _chunks(db, chapter)
+    document = db.session.get(Document, chapter.id)
+    document.content = CHAPTER.replace('Quoted', 'Requoted').replace('<p>Last</p>', '<p>New</p><p>Last</p>')
+    db.session.commit()
+    after = _chunks(db, chapter)
+    assert [c.id for c in after if c.id in {b.id for b in before}] == [c.id for c in before]
+    assert len(after) == 5 and after[2].content == '<blockquote><p>Requoted</p></blockquote>'
+    assert all(a.position < b.position for a, b in zip(after, after[1:]))
+
+
+def test_replace_chunk_splits_deletes_and_keeps_history(db, chapter):
+    document = db.session.get(Document, chapter.id)
+    document.add_revision(None, 'Start')
+    db.session.commit()
+    second = _chunks(db, chapter)[1]
+    document = db.session.get(Document, chapter.id)
+    ops, result = document.replace_chunk(second, '<p>Split</p><p>in two</p>')
+    document.add_revision(None, 'Split', delta=ops)
+    db.session.commit()
+    assert len(result) == 2
+    expected = CHAPTER.replace('<p>First <em>line</em><br>still first.</p>\n', '<p>Split</p><p>in two</p>')
+    assert db.session.get(Document, chapter.id).content == expected
+
+    first = _chunks(db, chapter)[0]
+    document = db.session.get(Document, chapter.id)
+    ops, result = document.replace_chunk(db.session.get(DocumentChunk, first.id), '')
+    document.add_revision(None, 'Delete', delta=ops)
+    db.session.commit()
+    assert result == []
+    document = db.session.get(Document, chapter.id)
+    assert document.content == expected.replace('<h2>One</h2>\n', '')
+    assert document.get_version(1) == CHAPTER and document.get_version(2) == expected
+
+
+def test_chunk_documents_cli(app, db, make_thread):
+    doc = Document(thread_id=make_thread().id, title='Old', type='chapter_text', storage='inline',
+                   content='<p>a</p><p>b</p>')
+    db.session.add(doc)
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['chunk-documents'])
+    assert 'Converted 1 documents' in result.output
+    db.session.expire_all()
+    converted = db.session.get(Document, doc.id)
+    assert converted.storage == 'chunked' and converted.content == '<p>a</p><p>b</p>'
+    assert len(_chunks(db, doc)) == 2
+
+
+def test_section_routes(db, chapter, make_user, login):
+    editor = make_user('editor')
+    memberships.add_member(chapter.thread_id, editor.id)
+    client = login(editor)
+    listing = client.get(f'/documents/{chapter.id}/chunks').get_json()
+    assert [c['length'] for c in listing['chunks']] == [len(b) for b in chunking.split_blocks(CHAPTER)]
+
+    last = listing['chunks'][-1]['id']
+    saved = client.put(f'/documents/{chapter.id}/chunks/{last}',
+                       json={'base_version': listing['version'], 'content': '<p>The end</p>'})
+    assert saved.status_code == 200 and saved.get_json()['version'] == listing['version'] + 1
+    stale = client.put(f'/documents/{chapter.id}/chunks/{last}',
+                       json={'base_version': listing['version'], 'content': '<p>Too late</p>'})
+    assert stale.status_code == 409
+    assert client.get(f'/documents/{chapter.id}/chunks/{last}').get_json()['content'] == '<p>The end</p>'
@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+import collab
+import deltas
+import live
+from models import Document, DocumentOp, DocumentRevision
+
+
+@pytest.fixture
+def manager(app, monkeypatch):
+    """A session manager whose ticks the test runs itself (no background thread)."""
+    manager = collab.SessionManager()
+    manager.app = app
+    monkeypatch.setattr(manager, '_start', lambda: None)
+    return manager
+
+
+@pytest.fixture
+def document(db, make_thread):
+    doc = Document(thread_id=make_thread().id, title='Draft', content='<p>Hello</p>')
+    db.session.add(doc)
+    db.session.commit()
+    return doc
+
+
+def _insert(text, at, new):
+    """Delta inserting new at position at of text."""
+    return [['c', at], ['i', new], ['c', len(text) - at]]
+
+
+def _ops(db, document):
+    db.session.expire_all()
+    return [row.rev for row in DocumentOp.query.filter_by(document_id=document.id).order_by(DocumentOp.rev)]
+
+
+def test_submit_writes_nothing_until_the_tick(db, document, manager, count_queries):
+    session = manager.get(document.id)
+    (rev, _), statements = count_queries(
+        lambda: session.submit('a', 1, 0, _insert('<p>Hello</p>', 8, ' world')))
+    assert (rev, statements) == (1, [])   # acked from memory
+    assert session.text == '<p>Hello world</p>'
+    assert _ops(db, document) == []
+
+    session.submit('b', 1, 0, _insert('<p>Hello</p>', 3, 'Oh, '))   # concurrent with a's edit: rebased over it
+    assert session.text == '<p>Oh, Hello world</p>'
+    manager.tick()
+    assert _ops(db, document) == [1, 2]
+
+
+def test_relay_coalesces_and_flush_saves(db, document, manager):
+    session = manager.get(document.id)
+    subscription = live.hub.subscribe(collab.channel(document.id))
+    try:
+        session.submit('a', 1, 0, _insert('<p>Hello</p>', 8, '!'))
+        session.submit('a', 1, 1, _insert('<p>Hello!</p>', 9, '!'))
+        manager.tick()
+        message = subscription.get(timeout=1)
+        assert json.loads(message['data'])['from'] == 0 and message['id'] == 2   # one event for the run
+    finally:
+        subscription.close()
+
+    manager.tick(force=True)
+    db.session.expire_all()
+    saved = db.session.get(Document, document.id)
+    assert saved.content == '<p>Hello!!</p>' and saved.collab_rev == 2
+    assert _ops(db, document) == []
+    assert DocumentRevision.query.filter_by(document_id=document.id).count() == 1
+
+
+def test_logged_ops_are_replayed_after_a_crash(db, document, manager):
+    session = manager.get(document.id)
+    session.submit('a', 1, 0, _insert('<p>Hello</p>', 8, ' again'))
+    session.write_ops()
+    manager.sessions.clear()   # the process dies before the content is saved
+
+    reopened = manager.get(document.id)
+    assert reopened.rev == 1 and reopened.text == '<p>Hello again</p>'
+
+
+def test_op_logged_by_another_worker_makes_editors_resync(db, document, manager):
+    session = manager.get(document.id)
+    db.session.add(DocumentOp(document_id=document.id, rev=1, client_id='elsewhere', user_id=None,
+                              payload=deltas.pack_delta(_insert('<p>Hello</p>', 8, ' there'))))
+    db.session.commit()   # a second worker's session for the same document
+    subscription = live.hub.subscribe(collab.channel(document.id))
+    try:
+        session.submit('a', 1, 0, _insert('<p>Hello</p>', 8, ' here'))
+        manager.tick()
+        assert subscription.get(timeout=1)['event'] == 'resync'
+    finally:
+        subscription.close()
+
+    assert document.id not in manager.sessions
+    with pytest.raises(collab.ResyncError):
+        session.submit('a', 1, 1, _insert('<p>Hello here</p>', 8, '!'))
+    fresh = manager.get(document.id)   # what the editor gets on joining again
+    assert fresh is not session and fresh.text == '<p>Hello there</p>'
+
+
+def test_stale_base_rev_needs_resync(db, document, manager):
+    session = manager.get(document.id)
+    session.submit('a', 1, 0, _insert('<p>Hello</p>', 8, '!'))
+    with pytest.raises(collab.ResyncError):
+        session.submit('a', 1, 5, _insert('<p>Hello!</p>', 0, 'x'))
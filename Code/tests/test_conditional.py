@@ -0,0 +1,74 @@
+import memberships
+from models import Post, Thread
+
+
+def _get(client, url, etag=None):
+    return client.get(url, headers={'If-None-Match': etag} if etag else {})
+
+
+def test_thread_page_revalidates_until_a_post_arrives(app, db, make_thread):
+    thread = make_thread('Cached')
+    client = app.test_client()
+    url = f'/threads/{thread.id}'
+    first = _get(client, url)
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('W/')
+    assert first.headers['Cache-Control'] == 'private, no-cache' and 'Cookie' in first.headers['Vary']
+
+    again = _get(client, url, etag)
+    assert again.status_code == 304 and again.get_data() == b''
+
+    db.session.add(Post(thread_id=thread.id, user_id=thread.leader_id, content='<p>news</p>'))
+    db.session.commit()
+    changed = _get(client, url, etag)
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+
+def test_change_in_a_sub_thread_moves_the_parents(db, make_thread):
+    parent = make_thread('Workspace')
+    child = make_thread('Chapter', parent=parent, leader=parent.leader)
+    db.session.expire_all()
+    before = db.session.get(Thread, parent.id).changed_at
+
+    db.session.add(Post(thread_id=child.id, user_id=parent.leader_id, content='<p>deep</p>'))
+    db.session.commit()
+    db.session.expire_all()
+    assert db.session.get(Thread, parent.id).changed_at > before
+
+
+def test_etag_depends_on_the_viewer_and_their_memberships(app, db, make_thread, make_user, login):
+    thread = make_thread('Shared')
+    url = f'/threads/{thread.id}'
+    anonymous = _get(app.test_client(), url).headers['ETag']
+    reader = make_user('reader')
+    client = login(reader)
+    client.get('/dashboard')   # consume the login flash
+    signed_in = _get(client, url).headers['ETag']
+    assert signed_in != anonymous
+    assert _get(client, url, anonymous).status_code == 200
+
+    memberships.add_member(thread.id, reader.id)   # bumps membership_version (and the thread)
+    assert _get(client, url, signed_in).status_code == 200
+
+
+def test_pending_flash_is_never_a_304(db, make_thread, make_user, login):
+    thread = make_thread('Flashy')
+    client = login(make_user('reader'))
+    client.get('/dashboard')   # shows (and clears) the login flash
+    url = f'/threads/{thread.id}'
+    etag = _get(client, url).headers['ETag']
+    with client.session_transaction() as session:
+        session['_flashes'] = [('info', 'Pending')]
+    assert _get(client, url, etag).status_code == 200
+
+
+def test_proposals_listing_and_switch(app, db, make_thread, monkeypatch):
+    make_thread('Open one')
+    client = app.test_client()
+    etag = _get(client, '/proposals').headers['ETag']
+    assert _get(client, '/proposals', etag).status_code == 304
+    assert _get(client, '/proposals?genre_id=1', etag).status_code == 200   # other filters, other page
+
+    monkeypatch.setitem(app.config, 'CONDITIONAL_GET_ENABLED', False)
+    response = _get(client, '/proposals', etag)
+    assert response.status_code == 200 and 'ETag' not in response.headers
@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+import deltas
+
+WORDS = 'the ember dragon river crown shadow whisper storm <p> </p> <b> </b> é 🐉'.split()
+
+
+def _text(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def _edit(rng, text):
+    words = text.split(' ')
+    for _ in range(rng.randint(1, 4)):
+        at = rng.randrange(len(words) + 1)
+        roll = rng.random()
+        if roll < 0.4:
+            words.insert(at, rng.choice(WORDS))
+        elif roll < 0.7 and at < len(words):
+            del words[at]
+        elif at < len(words):
+            words[at] = rng.choice(WORDS).upper()
+    return ' '.join(words)
+
+
+@pytest.mark.parametrize('old, new', [
+    ('', ''),
+    ('', 'new text'),
+    ('old text', ''),
+    ('same', 'same'),
+    ('<p>The dragon sleeps.</p>', '<p>The old dragon sleeps.</p>'),
+    ('a 🐉 b', 'a 🐉🐉 b'),
+])
+def test_make_delta_round_trips(old, new):
+    ops = deltas.make_delta(old, new)
+    assert deltas.apply_delta(old, ops) == new
+    assert deltas.unpack_delta(deltas.pack_delta(ops)) == ops
+
+
+def test_make_delta_random_edits():
+    rng = random.Random(7)
+    for _ in range(200):
+        old = _text(rng, rng.randint(0, 60))
+        new = _edit(rng, old)
+        assert deltas.apply_delta(old, deltas.make_delta(old, new)) == new
+
+
+def test_one_spot_edit_copies_the_rest():
+    old = '<p>' + 'word ' * 500 + '</p>'
+    new = old[:1000] + 'inserted ' + old[1000:]
+    assert deltas.make_delta(old, new) == [['c', 1000], ['i', 'inserted '], ['c', len(old) - 1000]]
+
+
+def test_large_changes_stay_correct_over_the_cap(monkeypatch):
+    monkeypatch.setattr(deltas, 'MAX_DIFF_WORK', 100)
+    rng = random.Random(3)
+    old = ''.join(f'<p>{_text(rng, 40)}</p>' for _ in range(20))
+    new = ''.join(f'<p>{_edit(rng, paragraph)}</p>' for paragraph in old[3:-4].split('</p><p>'))
+    ops = deltas.make_delta(old, new)
+    assert deltas.apply_delta(old, ops) == new
+
+    monkeypatch.setattr(deltas, 'MAX_DIFF_WORK', 0)   # nothing may be diffed: replaced wholesale
+    assert deltas.make_delta('abc x def', 'abc y def') == [['c', 4], ['s', 1], ['i', 'y'], ['c', 4]]
+
+
+def test_apply_delta_rejects_ops_that_do_not_fit():
+    with pytest.raises(ValueError):
+        deltas.apply_delta('abc', [['c', 4]])
+    with pytest.raises(ValueError):
+        deltas.apply_delta('abc', [['s', 5]])
+
+
+@pytest.mark.parametrize('ops', ['x', [['c']], [['c', -1]], [['c', True]], [['i', 3]], [['x', 1]]])
+def test_validate_delta_rejects_bad_shapes(ops):
+    with pytest.raises(ValueError):
+        deltas.validate_delta(ops)
+
+
+def test_transform_converges():
+    rng = random.Random(11)
+    for _ in range(200):
+        base = _text(rng, rng.randint(0, 20))
+        a = deltas.make_delta(base, _edit(rng, base))
+        b = deltas.make_delta(base, _edit(rng, base))
+        a2, b2 = deltas.transform(a, b)
+        assert (deltas.apply_delta(deltas.apply_delta(base, a), b2)
+                == deltas.apply_delta(deltas.apply_delta(base, b), a2))
+
+
+def test_transform_puts_the_first_insert_first():
+    a, b = [['c', 1], ['i', 'A'], ['c', 1]], [['c', 1], ['i', 'B'], ['c', 1]]
+    a2, b2 = deltas.transform(a, b)
+    assert deltas.apply_delta(deltas.apply_delta('xy', a), b2) == 'xABy'
+    assert deltas.apply_delta(deltas.apply_delta('xy', b), a2) == 'xABy'
+
+
+def test_compose_equals_applying_both():
+    rng = random.Random(5)
+    for _ in range(200):
+        base = _text(rng, rng.randint(0, 20))
+        middle = _edit(rng, base)
+        final = _edit(rng, middle)
+        ops = deltas.compose(deltas.make_delta(base, middle), deltas.make_delta(middle, final))
+        assert deltas.apply_delta(base, ops) == final
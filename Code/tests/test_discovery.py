@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import discovery
+from models import Thread
+
+
+@pytest.fixture
+def proposals(db, make_thread, make_user):
+    """Ten open proposals (genre 1 or 2; the even ones full), plus a closed one and a workspace."""
+    discovery._count_cache.clear()
+    leader = make_user('recruiter')
+    start = datetime(2024, 1, 1)
+    threads = [make_thread(f'P{n}', leader=leader, genre_id=1 + n % 2, max_members=3,
+                           member_count=3 if n % 2 == 0 else 1, created_at=start + timedelta(hours=n))
+               for n in range(10)]
+    make_thread('Closed', leader=leader, status='closed', created_at=start)
+    make_thread('Workspace', leader=leader, is_proposal=False, created_at=start)
+    yield [thread.id for thread in threads]
+    discovery._count_cache.clear()
+
+
+def _walk(filters, open_seats=False, limit=3):
+    ids, cursor = [], None
+    while True:
+        page = discovery.proposal_page(filters, open_seats, cursor=cursor, limit=limit)
+        ids += [thread.id for thread in page.threads]
+        if page.next_cursor is None:
+            return ids
+        cursor = page.next_cursor
+
+
+def test_parse_filters():
+    filters, open_seats = discovery.parse_filters(MultiDict({'genre_id': '2', 'sex_id': '', 'style_id': 'x',
+                                                             'open_seats': 'on', 'unknown': '4'}))
+    assert filters == {'genre_id': 2} and open_seats
+
+
+def test_pages_cover_every_open_proposal_newest_first(proposals):
+    assert _walk({}) == proposals[::-1]
+    assert _walk({'genre_id': 2}) == proposals[1::2][::-1]
+    assert _walk({}, open_seats=True) == proposals[1::2][::-1]
+    assert _walk({'genre_id': 1}, open_seats=True) == []
+
+
+def test_bad_cursor_is_a_value_error(proposals):
+    with pytest.raises(ValueError):
+        discovery.proposal_page({}, cursor='garbage')
+
+
+def test_count_is_cached(db, proposals):
+    assert discovery.proposal_count({'genre_id': 1}) == 5
+    db.session.execute(db.update(Thread).where(Thread.id == proposals[0]).values(status='closed'))
+    db.session.commit()
+    assert discovery.proposal_count({'genre_id': 1}) == 5   # for COUNT_TTL seconds
+    discovery._count_cache.clear()
+    assert discovery.proposal_count({'genre_id': 1}) == 4
+
+
+@pytest.mark.parametrize('filters, index', [({}, 'ix_threads_discovery'),
+                                            ({'genre_id': 2}, 'ix_threads_discovery_genre')])
+def test_page_query_is_an_index_range_scan(db, proposals, filters, index):
+    query = discovery._filtered(Thread.query, filters, False).order_by(Thread.created_at.desc(), Thread.id.desc())
+    statement = query.limit(25).statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    plan = ' '.join(row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {statement}')))
+    assert f'USING INDEX {index}' in plan and 'TEMP B-TREE' not in plan
+
+
+def test_json_listing(app, proposals):
+    client = app.test_client()
+    first = client.get('/proposals.json?limit=4&genre_id=2').get_json()
+    assert first['total'] == 5 and len(first['items']) == 4
+    assert first['items'][0]['leader'] == 'recruiter'
+    rest = client.get(f"/proposals.json?limit=4&genre_id=2&cursor={first['next_cursor']}").get_json()
+    assert 'total' not in rest and len(rest['items']) == 1 and rest['next_cursor'] is None
+    assert client.get('/proposals.json?cursor=garbage').status_code == 400
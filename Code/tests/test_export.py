@@ -0,0 +1,101 @@
+import io
+import os
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+
+import export
+import memberships
+from models import Document
+
+
+@pytest.fixture
+def book(app, db, make_thread, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'EXPORT_CACHE_DIR', str(tmp_path))
+    workspace = make_thread('The Long Road', is_proposal=False, is_private_workspace=True)
+    chapters = [
+        Document(thread_id=workspace.id, title='Two', type='chapter_text', chapter_num=2,
+                 content='<p>Rain&nbsp;fell &amp; fell.<br>Then <strong>stopped</strong>.</p>'),
+        Document(thread_id=workspace.id, title='One', type='chapter_text', chapter_num=1,
+                 content='<h3>Dawn</h3><ul><li>bread</li><li>salt</li></ul><blockquote><p>Go.</p></blockquote>'),
+        Document(thread_id=workspace.id, title='Notes', type='custom', content='<p>not in the book</p>'),
+    ]
+    db.session.add_all(chapters)
+    db.session.commit()
+    return workspace
+
+
+def _export(workspace, fmt):
+    key, stream = export.export_book(workspace, fmt)
+    pieces = list(stream)
+    return key, (b''.join(pieces) if fmt == 'epub' else ''.join(pieces))
+
+
+def _files(tmp_path, kind):
+    return sorted(os.listdir(tmp_path / kind))
+
+
+def test_markdown_and_text(book):
+    _, md = _export(book, 'md')
+    assert md.startswith('# The Long Road\n')
+    assert md.index('## One') < md.index('## Two') and 'not in the book' not in md
+    assert '### Dawn' in md and '- bread\n- salt' in md and '> Go.' in md
+    assert 'Rain\xa0fell & fell.  \nThen **stopped**.' in md
+
+    _, txt = _export(book, 'txt')
+    assert txt.startswith('THE LONG ROAD\n') and 'One\n===' in txt and '* bread' in txt
+    assert 'Then stopped.' in txt
+
+
+def test_book_and_parts_are_cached_and_only_changes_rerendered(db, book, tmp_path):
+    key, html = _export(book, 'html')
+    assert html.count('<section class="chapter"') == 2
+    parts = _files(tmp_path, 'parts')
+    assert len(parts) == 2 and _files(tmp_path, 'books') == [f'{book.id}-{key}.html']
+    assert _export(book, 'html') == (key, html)
+
+    two = Document.query.filter_by(title='Two').one()
+    two.content = '<p>Dry.</p>'
+    db.session.commit()
+    new_key, new_html = _export(book, 'html')
+    assert new_key != key and '<p>Dry.</p>' in new_html
+    assert _files(tmp_path, 'books') == [f'{book.id}-{new_key}.html']   # old book removed
+    new_parts = _files(tmp_path, 'parts')
+    assert len(new_parts) == 2 and len(set(parts) & set(new_parts)) == 1   # chapter One reused
+
+
+def test_epub_is_well_formed(book):
+    _, data = _export(book, 'epub')
+    with zipfile.ZipFile(io.BytesIO(data)) as epub:
+        first = epub.infolist()[0]
+        assert first.filename == 'mimetype' and first.compress_type == zipfile.ZIP_STORED
+        chapters = sorted(name for name in epub.namelist() if name.startswith('OEBPS/chapter-'))
+        assert len(chapters) == 2
+        for name in chapters + ['OEBPS/content.opf', 'OEBPS/nav.xhtml']:
+            ElementTree.fromstring(epub.read(name))
+        assert 'fell &amp; fell.<br/>Then' in epub.read('OEBPS/chapter-2.xhtml').decode()
+
+
+def test_xhtml_has_only_xml_entities():
+    assert export._xhtml('&nbsp;&copy;&amp;&#38;&#x26;&bogus; & <br><img src="a.png">') == \
+        '&#160;&#169;&amp;&#38;&#x26;&amp;bogus; &amp; <br/><img src="a.png"/>'
+
+
+def test_unknown_format(book):
+    with pytest.raises(ValueError):
+        export.export_book(book, 'pdf')
+
+
+def test_export_route(db, book, make_user, login):
+    reader = make_user('reader')
+    client = login(reader)
+    client.get('/dashboard')   # consume the login flash (a pending flash is never a 304)
+    assert client.get(f'/workspace/{book.id}/export.md').status_code == 403
+    memberships.add_member(book.id, reader.id)
+    response = client.get(f'/workspace/{book.id}/export.md')
+    assert response.status_code == 200 and '## One' in response.get_data(as_text=True)
+    assert 'attachment; filename="The_Long_Road.md"' == response.headers['Content-Disposition']
+    again = client.get(f'/workspace/{book.id}/export.md', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+    assert client.get(f'/workspace/{book.id}/export.pdf').status_code == 404
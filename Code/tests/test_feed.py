@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import feed
+from models import Post
+
+
+@pytest.fixture
+def thread_posts(db, make_thread, make_user):
+    """A thread with 25 posts by five authors; two of them share a created_at."""
+    thread = make_thread('Feed')
+    authors = [make_user(f'author{n}') for n in range(5)]
+    start = datetime(2024, 1, 1)
+    posts = [Post(thread_id=thread.id, user_id=authors[n % 5].id, content=f'<p>{n}</p>',
+                  created_at=start + timedelta(minutes=n if n != 11 else 10))
+             for n in range(25)]
+    db.session.add_all(posts)
+    db.session.commit()
+    db.session.expire_all()
+    return thread, [post.id for post in posts]
+
+
+def _ids(page):
+    return [post.id for post in page.posts]
+
+
+def test_cursor_round_trip_and_garbage():
+    post = Post(id=42, created_at=datetime(2024, 5, 6, 7, 8, 9, 123))
+    assert feed.decode_cursor(feed.encode_cursor(post)) == (post.created_at, 42)
+    for garbage in ('', 'not-a-cursor', '!!!', feed.encode_cursor(post)[:-3]):
+        with pytest.raises(ValueError):
+            feed.decode_cursor(garbage)
+
+
+def test_walking_back_and_forth_visits_every_post_once(thread_posts):
+    thread, _ = thread_posts
+    everything = Post.query.filter_by(thread_id=thread.id).order_by(Post.created_at, Post.id).all()
+    ordered = [post.id for post in everything]
+
+    page = feed.latest_posts(thread.id, limit=7)
+    assert _ids(page) == ordered[-7:] and page.has_older and not page.has_newer
+    seen = _ids(page)
+    while page.has_older:
+        page = feed.posts_before(thread.id, page.older_cursor, limit=7)
+        assert page.has_newer
+        seen = _ids(page) + seen
+    assert seen == ordered   # including the two posts with the same created_at
+
+    page = feed.posts_after(thread.id, feed.encode_cursor(everything[0]), limit=10)
+    forward = [ordered[0]] + _ids(page)
+    while page.has_newer:
+        page = feed.posts_after(thread.id, page.newer_cursor, limit=10)
+        forward += _ids(page)
+    assert forward == ordered
+
+
+def test_newer_cursor_is_handed_out_for_polling(db, thread_posts):
+    thread, _ = thread_posts
+    page = feed.latest_posts(thread.id)
+    assert feed.posts_after(thread.id, page.newer_cursor).posts == []
+    late = Post(thread_id=thread.id, user_id=page.posts[0].user_id, content='<p>late</p>',
+                created_at=datetime(2030, 1, 1))
+    db.session.add(late)
+    db.session.commit()
+    assert _ids(feed.posts_after(thread.id, page.newer_cursor)) == [late.id]
+
+
+def test_limits_are_clamped():
+    assert feed._clamp(None) == feed._clamp(0) == feed._clamp(-5) == feed.PAGE_SIZE
+    assert feed._clamp(10_000) == feed.MAX_PAGE_SIZE
+    assert feed._clamp(7) == 7
+
+
+def test_authors_come_in_the_same_query(db, thread_posts, count_queries):
+    thread_id = thread_posts[0].id
+    db.session.expire_all()   # nothing cached in the session
+
+    def render():
+        page = feed.latest_posts(thread_id, limit=20)
+        return [post.author.username for post in page.posts]
+
+    usernames, statements = count_queries(render)
+    assert len(usernames) == 20 and len(set(usernames)) == 5
+    assert len(statements) == 1
+
+
+def test_feed_routes(db, thread_posts, login):
+    thread, _ = thread_posts
+    client = login(thread.leader)
+    first = client.get(f'/threads/{thread.id}/posts/older?cursor=' +
+                       feed.latest_posts(thread.id, limit=5).older_cursor + '&limit=5').get_json()
+    assert first['count'] == 5 and first['has_older'] and first['html'].count('data-post-id') == 5
+    assert client.get(f'/threads/{thread.id}/posts/newer?cursor=garbage').status_code == 400
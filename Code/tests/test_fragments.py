@@ -0,0 +1,61 @@
+import fragments
+from models import Document, DocumentChunk, DocumentRevision, Post
+
+DIRTY = '<p onclick="steal()">hello<script>alert(1)</script></p>'
+
+
+def test_cache_evicts_least_recently_used():
+    cache = fragments.FragmentCache(max_bytes=20)
+    for key in 'abcd':
+        cache.get_or_render(key, lambda key=key: key * 5)
+    cache.get_or_render('a', lambda: 'never rendered')   # a is now the most recent
+    cache.get_or_render('e', lambda: 'e' * 5)            # 25 bytes: b goes
+    assert cache.get_or_render('a', lambda: 'rendered again') == 'a' * 5
+    assert cache.get_or_render('b', lambda: 'rendered again') == 'rendered again'
+    assert cache.stats()['hits'] == 2
+
+
+def test_cache_skips_huge_fragments():
+    cache = fragments.FragmentCache(max_bytes=40)
+    cache.get_or_render('small', lambda: 'x' * 10)
+    assert cache.get_or_render('huge', lambda: 'y' * 11) == 'y' * 11
+    assert cache.stats()['entries'] == 1
+
+
+def test_document_html_is_keyed_by_version(db, make_thread):
+    doc = Document(thread_id=make_thread().id, title='Notes', content='<p>one</p>')
+    db.session.add(doc)
+    db.session.commit()
+    assert fragments.document_html(doc) == '<p>one</p>'
+    doc.content = '<p>two</p>'
+    db.session.commit()
+    assert fragments.document_html(doc) == '<p>two</p>'
+
+
+def test_sanitize_existing_only_rewrites_dirty_rows(db, make_thread):
+    thread = make_thread()
+    clean_post = Post(thread_id=thread.id, user_id=thread.leader_id, content='<p>fine</p>')
+    dirty_post = Post(thread_id=thread.id, user_id=thread.leader_id, content='<p>soon dirty</p>')
+    chapter = Document(thread_id=thread.id, title='Chapter', type='chapter_text',
+                       content='<p>one</p><p>two</p>')
+    dirty_doc = Document(thread_id=thread.id, title='Old notes', content='<p>soon dirty</p>')
+    db.session.add_all([clean_post, dirty_post, chapter, dirty_doc])
+    db.session.commit()
+    # rows stored before write-time sanitizing
+    db.session.execute(db.update(Post).where(Post.id == dirty_post.id).values(content=DIRTY))
+    db.session.execute(db.update(Document).where(Document.id == dirty_doc.id).values(_content=DIRTY))
+    db.session.commit()
+    db.session.expire_all()
+    chapter_version, chunk_ids = chapter.version, [chunk.id for chunk in chapter.chunks]
+
+    assert fragments.sanitize_existing(batch_size=1) == {'posts': 1, 'documents': 1}
+
+    db.session.expire_all()
+    assert 'script' not in db.session.get(Post, dirty_post.id).content
+    assert 'onclick' not in db.session.get(Document, dirty_doc.id).content
+    assert db.session.get(Document, chapter.id).version == chapter_version
+    assert [c.id for c in DocumentChunk.query.filter_by(document_id=chapter.id).order_by('position')] == chunk_ids
+    assert DocumentRevision.query.filter_by(document_id=chapter.id).count() == 0
+    assert DocumentRevision.query.filter_by(document_id=dirty_doc.id).count() == 1
+
+    assert fragments.sanitize_existing() == {'posts': 0, 'documents': 0}
@@ -0,0 +1,105 @@
+import pytest
+
+import activity
+import hierarchy
+from models import Post, ReadMarker, ThreadActivity, ThreadClosure
+
+
+@pytest.fixture
+def tree(db, make_thread):
+    """A ─ T ─ S and B ─ C, with a few posts in each."""
+    a = make_thread('A')
+    t = make_thread('T', parent=a, leader=a.leader)
+    s = make_thread('S', parent=t, leader=a.leader)
+    b = make_thread('B', leader=a.leader)
+    c = make_thread('C', parent=b, leader=a.leader)
+    for thread, posts in ((a, 1), (t, 3), (s, 4), (b, 2), (c, 1)):
+        db.session.add_all(Post(thread_id=thread.id, user_id=a.leader_id, content='<p>x</p>') for _ in range(posts))
+    db.session.commit()
+    return {thread.title: thread for thread in (a, t, s, b, c)}
+
+
+def _closure(db):
+    return {(row.ancestor_id, row.descendant_id): row.depth for row in db.session.query(ThreadClosure)}
+
+
+def _tree_posts(db, thread):
+    return db.session.get(ThreadActivity, thread.id).tree_post_count
+
+
+def test_closure_and_tree_counts(db, tree):
+    a, t, s = tree['A'], tree['T'], tree['S']
+    closure = _closure(db)
+    assert closure[(a.id, s.id)] == 2 and closure[(t.id, s.id)] == 1 and closure[(s.id, s.id)] == 0
+    assert hierarchy.ancestor_ids(s.id) == [a.id, t.id]
+    assert hierarchy.root_id(s.id) == a.id
+    assert [node.thread.title for node in hierarchy.tree(a.id).walk()] == ['A', 'T', 'S']
+    assert _tree_posts(db, a) == 8
+
+
+def test_move_thread_moves_the_subtree(db, tree):
+    a, t, s, b, c = (tree[name] for name in 'ATSBC')
+    hierarchy.move_thread(t.id, c.id)
+
+    assert hierarchy.ancestor_ids(s.id) == [b.id, c.id, t.id]
+    assert _closure(db) == {**{(x.id, x.id): 0 for x in tree.values()},
+                            (b.id, c.id): 1, (b.id, t.id): 2, (b.id, s.id): 3,
+                            (c.id, t.id): 1, (c.id, s.id): 2, (t.id, s.id): 1}
+    assert _tree_posts(db, a) == 1
+    assert _tree_posts(db, b) == 10
+    assert _tree_posts(db, c) == 8
+
+
+def test_move_to_top_level(db, tree):
+    hierarchy.move_thread(tree['T'].id, None)
+    assert hierarchy.ancestor_ids(tree['S'].id) == [tree['T'].id]
+    assert _tree_posts(db, tree['A']) == 1
+
+
+def test_move_rejects_cycles_and_missing_threads(db, tree):
+    with pytest.raises(hierarchy.HierarchyError):
+        hierarchy.move_thread(tree['T'].id, tree['S'].id)
+    with pytest.raises(hierarchy.HierarchyError):
+        hierarchy.move_thread(tree['T'].id, tree['T'].id)
+    with pytest.raises(hierarchy.HierarchyError):
+        hierarchy.move_thread(tree['T'].id, 10_000)
+    with pytest.raises(hierarchy.HierarchyError):
+        hierarchy.move_thread(10_000, tree['A'].id)
+
+
+def test_move_carries_read_counts(db, tree, make_user):
+    a, t, s, b, c = (tree[name] for name in 'ATSBC')
+    reader, other = make_user('reader'), make_user('other')
+    for thread in (a, t, s, b):
+        activity.mark_read(reader.id, thread)
+    activity.mark_read(other.id, s)
+
+    hierarchy.move_thread(t.id, c.id)
+
+    db.session.expire_all()
+    for marker in db.session.query(ReadMarker):
+        subtree = [row.descendant_id for row in ThreadClosure.query.filter_by(ancestor_id=marker.thread_id)]
+        read_below = sum(m.read_post_count for m in ReadMarker.query.filter(
+            ReadMarker.user_id == marker.user_id, ReadMarker.thread_id.in_(subtree)))
+        assert marker.read_tree_count == read_below, (marker.user_id, marker.thread_id)
+    nodes = {node.thread.id: node for node in hierarchy.tree(b.id, reader.id).walk()}
+    assert nodes[t.id].unread == nodes[s.id].unread == 0
+    assert nodes[c.id].unread == 1   # never opened
+
+
+def test_rebuild_matches_incremental_closure(db, tree):
+    hierarchy.move_thread(tree['T'].id, tree['C'].id)
+    before = _closure(db)
+    hierarchy.rebuild()
+    assert _closure(db) == before
+
+
+def test_upgrade_db_builds_a_missing_closure(db, tree):
+    import schema
+    before = _closure(db)
+    db.session.remove()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('DROP TABLE thread_closure')
+
+    assert 'thread_closure' in schema.upgrade()['tables']
+    assert _closure(db) == before
@@ -0,0 +1,98 @@
+import queue
+import re
+from multiprocessing.connection import Listener
+
+import pytest
+
+import live
+from models import Post
+
+AUTHKEY = b'test-broker-key'
+
+
+def _event(n):
+    return {'id': n, 'event': 'post', 'data': f'<p>{n}</p>'}
+
+
+@pytest.mark.parametrize('data', [b'5', b'not json', b'["c"]', b'["c", {}]', b'["c", {"id": "1", "event": "e", "data": ""}]',
+                                  b'[1, {"id": 1, "event": "e", "data": ""}]', b'\xff'])
+def test_decode_rejects_malformed(data):
+    with pytest.raises((ValueError, TypeError, KeyError)):
+        live._decode(data)
+
+
+def test_broker_reader_skips_malformed_messages():
+    listener = Listener(('127.0.0.1', 0), authkey=AUTHKEY)
+    delivered = queue.Queue()
+    backend = live.BrokerBackend(listener.address, AUTHKEY)
+    backend.start(lambda channel, message: delivered.put((channel, message)))
+    conn = listener.accept()
+    try:
+        for data in (b'5', b'["c", {}]', b'[1, 2]'):
+            conn.send_bytes(data)
+        conn.send_bytes(live._encode('thread:1', _event(7)))
+        assert delivered.get(timeout=5) == ('thread:1', _event(7))   # the reader is still alive
+    finally:
+        backend.stop()
+        conn.close()
+        listener.close()
+
+
+def test_slow_subscriber_is_cut_off():
+    hub = live.LiveHub(queue_size=2)
+    slow, fast = hub.subscribe('c'), hub.subscribe('c')
+    for n in range(3):
+        hub.publish('c', _event(n))
+        assert fast.get(timeout=1)['id'] == n
+    assert slow.get(timeout=1)['id'] == 1   # oldest dropped to make room
+    assert slow.get(timeout=1) is live._OVERFLOW
+    assert hub.subscriber_count('c') == 1
+
+
+def test_stream_sends_backlog_then_live_once():
+    hub = live.LiveHub()
+    subscription = hub.subscribe('c')
+    for n in (2, 3):
+        hub.publish('c', _event(n))   # 2 is also in the backlog
+    frames = live.stream(subscription, backlog=[_event(1), _event(2)], heartbeat=0.01)
+    assert next(frames).startswith('retry:')
+    ids = [re.search(r'^id: (\d+)', next(frames)).group(1) for _ in range(3)]
+    assert ids == ['1', '2', '3']
+    assert next(frames) == ': keepalive\n\n'
+    frames.close()
+    assert hub.subscriber_count('c') == 0
+
+
+def _stream_frames(client, url, count, headers=None):
+    response = client.get(url, headers=headers or {}, buffered=False)
+    frames = []
+    try:
+        for chunk in response.response:
+            frames.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+            if len(frames) == count:
+                break
+    finally:
+        response.close()
+    return frames
+
+
+def test_page_stream_replays_posts_after_the_render(db, make_thread, login):
+    thread = make_thread('Live')
+    client = login(thread.leader)
+    page = client.get(f'/threads/{thread.id}').get_data(as_text=True)
+    stream_url = re.search(r'new EventSource\("([^"]+)"\)', page).group(1).replace('&amp;', '&')
+    assert 'last_id=0' in stream_url   # no posts yet
+
+    late = Post(thread_id=thread.id, user_id=thread.leader_id, content='<p>posted before the subscribe</p>')
+    db.session.add(late)
+    db.session.commit()
+
+    retry, replayed = _stream_frames(client, stream_url, 2)
+    assert retry.startswith('retry:')
+    assert f'id: {late.id}\n' in replayed and 'posted before the subscribe' in replayed
+
+    again = Post(thread_id=thread.id, user_id=thread.leader_id, content='<p>after a reconnect</p>')
+    db.session.add(again)
+    db.session.commit()
+    _, replayed = _stream_frames(client, stream_url, 2, headers={'Last-Event-ID': str(late.id)})
+    assert f'id: {again.id}\n' in replayed
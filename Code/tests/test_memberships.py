@@ -0,0 +1,64 @@
+import pytest
+
+import memberships
+from models import GroupMembership, Thread, User
+
+
+@pytest.fixture
+def group(make_thread):
+    return make_thread('Group', max_members=2)
+
+
+def _count(db, thread):
+    db.session.expire_all()
+    return db.session.get(Thread, thread.id).member_count
+
+
+def test_add_and_remove_member(db, group, make_user):
+    user = make_user('joiner')
+    version = user.membership_version
+
+    memberships.add_member(group.id, user.id, role='leader')
+    assert _count(db, group) == 1
+    assert GroupMembership.query.filter_by(thread_id=group.id, user_id=user.id).one().role == 'leader'
+    assert db.session.get(User, user.id).membership_version == version + 1
+
+    memberships.remove_member(group.id, user.id)
+    assert _count(db, group) == 0
+    assert GroupMembership.query.count() == 0
+    assert db.session.get(User, user.id).membership_version == version + 2
+
+
+def test_full_group_turns_the_next_one_away(db, group, make_user):
+    first, second, third = make_user('first'), make_user('second'), make_user('third')
+    memberships.add_member(group.id, first.id)
+    memberships.add_member(group.id, second.id)
+    with pytest.raises(memberships.GroupFullError):
+        memberships.add_member(group.id, third.id)
+    assert _count(db, group) == 2
+
+    memberships.remove_member(group.id, first.id)   # a seat frees up
+    memberships.add_member(group.id, third.id)
+    assert _count(db, group) == 2
+
+
+def test_join_twice_and_leave_twice(db, group, make_user):
+    user = make_user('twice')
+    memberships.add_member(group.id, user.id)
+    with pytest.raises(memberships.AlreadyMemberError):
+        memberships.add_member(group.id, user.id)
+    assert _count(db, group) == 1
+
+    memberships.remove_member(group.id, user.id)
+    with pytest.raises(memberships.NotMemberError):
+        memberships.remove_member(group.id, user.id)
+    assert _count(db, group) == 0
+
+
+def test_recount_members(db, group, make_user):
+    user = make_user('counted')
+    memberships.add_member(group.id, user.id)
+    db.session.execute(db.update(Thread).values(member_count=7))
+    db.session.commit()
+    memberships.recount_members()
+    assert _count(db, group) == 1
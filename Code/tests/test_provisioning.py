@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import event
+
+import provisioning
+from models import Document, GroupMembership, Post, Thread, User
+
+
+@pytest.fixture
+def commits(db):
+    """How many times the session has committed since the fixture was set up."""
+    count = [0]
+
+    def after_commit(session):
+        count[0] += 1
+    event.listen(db.session, 'after_commit', after_commit)
+    yield count
+    event.remove(db.session, 'after_commit', after_commit)
+
+
+def test_provision_builds_the_whole_structure_in_one_commit(db, make_user, commits):
+    leader = make_user('leader')
+    commits[0] = 0
+    result = provisioning.provision_workspace(leader.id, 'Skyfall', description='<p>Join us</p>',
+                                              max_members=4, boundary_ids={'genre_id': None})
+    assert commits[0] == 1
+
+    recruitment, workspace = result.recruitment, result.workspace
+    assert recruitment.is_proposal and recruitment.status == 'open' and recruitment.max_members == 4
+    assert workspace.is_private_workspace and workspace.title == 'Workspace: Skyfall'
+    subs = {t.title: t for t in Thread.query.filter_by(parent_thread_id=workspace.id)}
+    assert set(subs) == {spec['title'] for spec in provisioning.DEFAULT_TEMPLATE['sub_threads']}
+    docs = {d.title: d for d in Document.query.filter_by(thread_id=workspace.id)}
+    assert docs['Chapter 1 Text'].associated_thread_id == subs['Chapter 1'].id
+    assert docs['Chapter 1 Text'].storage == 'chunked'
+    assert {(m.thread_id, m.role) for m in GroupMembership.query.filter_by(user_id=leader.id)} == \
+        {(recruitment.id, 'leader'), (workspace.id, 'leader')}
+    assert recruitment.member_count == workspace.member_count == 1
+    assert Post.query.filter_by(thread_id=recruitment.id).one().content == '<p>Join us</p>'
+    assert db.session.get(User, leader.id).membership_version == 1
+
+
+def test_failure_leaves_nothing_behind(db, make_user):
+    leader = make_user('leader')
+    broken = {'sub_threads': [{'key': 'a', 'title': 'A'}],
+              'documents': [{'title': 'Orphan', 'type': 'custom', 'thread': 'missing'}]}
+    with pytest.raises(KeyError):
+        provisioning.provision_workspace(leader.id, 'Doomed', template=broken)
+    assert Thread.query.count() == 0
+    assert GroupMembership.query.count() == 0
+    assert db.session.get(User, leader.id).membership_version == 0
+
+
+def test_provision_many_commits_per_batch(db, make_user, commits):
+    leader = make_user('leader')
+    commits[0] = 0
+    results = provisioning.provision_many(({'leader_id': leader.id, 'title': f'Event {n}'} for n in range(5)),
+                                          batch_size=2)
+    assert commits[0] == 3
+    assert [r.recruitment.title for r in results] == [f'Event {n}' for n in range(5)]
+    assert Thread.query.filter_by(is_private_workspace=True).count() == 5
+
+
+def test_cli(app, db, make_user):
+    make_user('organizer')
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['provision-workspaces', '--leader', 'organizer', '--count', '3'])
+    assert result.exit_code == 0, result.output
+    assert 'Provisioned 3 workspaces' in result.output
+    assert runner.invoke(args=['provision-workspaces', '--leader', 'nobody']).exit_code != 0
@@ -0,0 +1,35 @@
+import pytest
+
+from sanitize import clean_html
+
+
+@pytest.mark.parametrize('dirty, clean', [
+    ('<p onclick="steal()">hi</p>', '<p>hi</p>'),
+    ('<script>alert(1)</script><p>a</p>', '<p>a</p>'),
+    ('<style>p { color: red }</style>ok', 'ok'),
+    ('<blink>kept text</blink>', 'kept text'),
+    ('<a href="javascript:alert(1)">x</a>', '<a>x</a>'),
+    ('<a href="java\tscript:alert(1)">x</a>', '<a>x</a>'),
+    ('<img src="x.png" onerror="steal()">', '<img src="x.png">'),
+    ('<img src="data:text/html;base64,PHNjcmlwdD4=">', '<img>'),
+    ('<p>unclosed', '<p>unclosed</p>'),
+    ('<b><i>x</b></i>', '<b><i>x</i></b>'),
+])
+def test_clean_html(dirty, clean):
+    assert clean_html(dirty) == clean
+
+
+@pytest.mark.parametrize('html', [
+    '<p>a &amp; b &lt; c</p>',
+    '<a href="https://example.com/" target="_blank">link</a>',
+    '<img src="data:image/png;base64,AAAA" alt="map">',
+    '<ol start="3"><li>three</li></ol>',
+    '<table><tbody><tr><td colspan="2">cell</td></tr></tbody></table>',
+])
+def test_allowed_markup_is_kept(html):
+    assert clean_html(html) == html
+
+
+def test_clean_html_is_idempotent():
+    once = clean_html('<div><p class="x" style="y">a <em>b<script>c</script></em><br>d</div>')
+    assert clean_html(once) == once
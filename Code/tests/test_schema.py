@@ -0,0 +1,42 @@
+import memberships
+import schema
+from models import Thread
+
+
+def _drop(db, *statements):
+    with db.engine.begin() as connection:
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+
+
+def test_upgrade_adds_columns_and_indexes_and_backfills(db, make_thread, make_user):
+    group = make_thread('Group')
+    group_id = group.id
+    for name in ('one', 'two'):
+        memberships.add_member(group.id, make_user(name).id)
+    db.session.remove()
+    _drop(db, 'ALTER TABLE threads DROP COLUMN member_count', 'DROP INDEX ix_posts_thread_created_id')
+
+    assert schema.upgrade(dry_run=True) == {'tables': [], 'columns': [('threads', 'member_count')],
+                                            'indexes': ['ix_posts_thread_created_id']}
+    assert schema.upgrade(dry_run=True)['columns']   # a dry run changes nothing
+
+    schema.upgrade()
+    assert db.session.get(Thread, group_id).member_count == 2   # recounted, not the column default
+    assert not any(schema.upgrade().values())
+
+
+def test_upgrade_db_command(app, db):
+    result = app.test_cli_runner().invoke(args=['upgrade-db', '--dry-run'])
+    assert result.exit_code == 0
+    assert 'Schema is up to date.' in result.output
+
+
+def test_upgrade_stamps_changed_at(db, make_thread):
+    thread_id = make_thread('Old').id
+    db.session.remove()
+    _drop(db, 'DROP INDEX ix_threads_proposal_changed', 'ALTER TABLE threads DROP COLUMN changed_at')
+
+    schema.upgrade()
+    thread = db.session.get(Thread, thread_id)
+    assert thread.changed_at == thread.created_at
@@ -0,0 +1,101 @@
+import pytest
+
+import memberships
+import search
+from models import Document, Post
+
+
+@pytest.fixture
+def reader(db, make_user):
+    return make_user('reader')
+
+
+@pytest.fixture
+def workspace(db, make_thread, reader):
+    thread = make_thread('Workspace', is_private_workspace=True, is_proposal=False)
+    memberships.add_member(thread.id, reader.id)
+    return thread
+
+
+def _post(db, thread, html):
+    post = Post(thread_id=thread.id, user_id=thread.leader_id, content=html)
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+
+def _ids(results):
+    return [hit['id'] for hit in results.hits]
+
+
+def test_indexes_text_not_markup(db, workspace, reader):
+    post = _post(db, workspace, '<p class="lead"><strong>Dragon</strong> <a href="https://x.example">lair</a></p>')
+    assert _ids(search.search(reader.id, 'dragon')) == [post.id]
+    assert _ids(search.search(reader.id, 'lai*')) == [post.id]
+    for markup in ('strong', 'href', 'class', 'lead', 'https'):
+        assert search.search(reader.id, markup).hits == [], markup
+
+
+def test_snippet_is_escaped_text_with_highlights(db, workspace, reader):
+    _post(db, workspace, '<p>if a &lt; b then the <em>dragon</em> wakes</p>')
+    [hit] = search.search(reader.id, 'dragon').hits
+    assert str(hit['snippet']) == 'if a &lt; b then the <mark>dragon</mark> wakes'
+
+
+def test_only_visible_threads(db, make_thread, workspace, reader):
+    chapter = make_thread('Chapter', parent=workspace, leader=workspace.leader)
+    elsewhere = make_thread('Elsewhere')
+    inside = _post(db, chapter, '<p>ember</p>')
+    _post(db, elsewhere, '<p>ember</p>')
+    assert _ids(search.search(reader.id, 'ember')) == [inside.id]
+    assert search.search(reader.id, f't{elsewhere.id}').hits == []   # thread tokens are not text
+
+
+def test_edits_and_deletes_follow(db, workspace, reader):
+    post = _post(db, workspace, '<p>silver</p>')
+    post.content = '<p>golden</p>'
+    db.session.commit()
+    assert search.search(reader.id, 'silver').hits == []
+    assert _ids(search.search(reader.id, 'golden')) == [post.id]
+    db.session.delete(post)
+    db.session.commit()
+    assert search.search(reader.id, 'golden').hits == []
+
+
+def test_documents_titles_and_chunks(db, workspace, reader):
+    chapter = Document(thread_id=workspace.id, title='Harbor', type='chapter_text',
+                       content='<p>First.</p><p>The <b>lantern</b> burns.</p>')
+    notes = Document(thread_id=workspace.id, title='Notes', type='story_arc', content='<p>lantern oath</p>')
+    db.session.add_all([chapter, notes])
+    db.session.commit()
+    assert chapter.storage == 'chunked'
+    assert sorted(_ids(search.search(reader.id, 'lantern', kind='documents'))) == sorted([chapter.id, notes.id])
+    assert _ids(search.search(reader.id, 'harbor', kind='documents')) == [chapter.id]
+    assert search.search(reader.id, 'b', kind='documents').hits == []
+
+
+def test_paging(db, workspace, reader):
+    for n in range(5):
+        _post(db, workspace, f'<p>storm {n}</p>')
+    first = search.search(reader.id, 'storm', per_page=3)
+    second = search.search(reader.id, 'storm', page=2, per_page=3)
+    assert (len(first.hits), first.has_next, len(second.hits), second.has_next) == (3, True, 2, False)
+    assert not set(_ids(first)) & set(_ids(second))
+
+
+def test_rebuild_and_upgrade_from_the_markup_index(db, workspace, reader):
+    import schema
+    post = _post(db, workspace, '<p><strong>crown</strong></p>')
+    with db.engine.begin() as connection:   # the index as it was before the thread column
+        for name in search._TRIGGERS:
+            connection.exec_driver_sql(f'DROP TRIGGER {name}')
+        connection.exec_driver_sql('DROP TABLE posts_fts')
+        connection.exec_driver_sql("CREATE VIRTUAL TABLE posts_fts USING fts5(content, content='posts', content_rowid='id')")
+    with db.engine.connect() as connection:
+        assert search.index_outdated(connection)
+
+    assert 'posts_fts' in schema.upgrade()['tables']
+    assert _ids(search.search(reader.id, 'crown')) == [post.id]
+    assert search.search(reader.id, 'strong').hits == []
+    search.rebuild_index()
+    assert _ids(search.search(reader.id, 'crown')) == [post.id]